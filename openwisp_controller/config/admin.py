@@ -1,6 +1,7 @@
 import json
 import logging
 from collections.abc import Iterable
+from uuid import UUID
 
 import reversion
 from django import forms
@@ -44,10 +45,12 @@ from openwisp_utils.admin import (
 )
 
 from ..admin import MultitenantAdminMixin
+from ..pagination import EstimatedCountPaginator
 from . import settings as app_settings
 from .base.vpn import AbstractVpn
 from .exportable import DeviceResource
 from .filters import DeviceGroupFilter, GroupFilter, TemplatesFilter
+from .jobs import DeviceBulkJob
 from .utils import send_file
 from .widgets import DeviceGroupJsonSchemaWidget, JsonSchemaWidget
 
@@ -256,8 +259,6 @@ class BaseConfigAdmin(BaseAdmin):
             logger.warning(msg, extra={"request": request, "stack": True})
             return HttpResponse(status=405)
         config_model = self._get_config_model()
-        error = None
-        output = None
         # error message for eventual exceptions
         error_msg = self.preview_error_msg.format(
             config_model.__name__, request.POST.get("name")
@@ -285,16 +286,7 @@ class BaseConfigAdmin(BaseAdmin):
                 return HttpResponse(str(e), status=400)
         else:
             templates = None
-        if not error:
-            context = instance.get_context()
-            backend = instance.get_backend_instance(
-                template_instances=templates, context=context
-            )
-            try:
-                instance.clean_netjsonconfig_backend(backend)
-                output = backend.render()
-            except ValidationError as e:
-                error = str(e)
+        output, error = instance.render_preview(templates)
         context = self.admin_site.each_context(request)
         opts = self.model._meta
         context.update(
@@ -582,7 +574,7 @@ class DeviceAdmin(MultitenantAdminMixin, BaseConfigAdmin, CopyableFieldsAdmin):
         list_display.insert(1, "hardware_id")
         search_fields.insert(1, "hardware_id")
         fields.insert(0, "hardware_id")
-    list_select_related = ("config", "organization")
+    list_select_related = ("config", "organization", "group")
 
     # overriding media property to allow testing in isolation
     # as class Media is evaluated at import time making the
@@ -600,6 +592,22 @@ class DeviceAdmin(MultitenantAdminMixin, BaseConfigAdmin, CopyableFieldsAdmin):
             css += (f"{whois_prefix}css/whois.css",)
         return super().media + forms.Media(js=js, css={"all": css})
 
+    # defined as a property to allow testing in isolation
+    @property
+    def show_full_result_count(self):
+        return app_settings.DEVICE_ADMIN_SHOW_FULL_RESULT_COUNT
+
+    def get_paginator(self, request, queryset, per_page, **kwargs):
+        """
+        In performance mode the total number of devices is estimated
+        from the table statistics and the number of filtered devices
+        is cached for a short time, which avoids counting all the
+        rows of very large tables at each page load
+        """
+        if app_settings.DEVICE_ADMIN_PERFORMANCE_MODE:
+            return EstimatedCountPaginator(queryset, per_page, **kwargs)
+        return super().get_paginator(request, queryset, per_page, **kwargs)
+
     def has_change_permission(self, request, obj=None):
         perm = super().has_change_permission(request)
         if not obj or getattr(request, "_recover_view", False):
@@ -743,24 +751,13 @@ class DeviceAdmin(MultitenantAdminMixin, BaseConfigAdmin, CopyableFieldsAdmin):
             form = ChangeDeviceGroupForm(data=request.POST, org_id=org_id)
             if form.is_valid():
                 group = form.cleaned_data["device_group"]
-                queryset = queryset.filter(_is_deactivated=False)
-                # Evaluate queryset to store old group id
-                old_group_qs = list(queryset)
-                queryset.update(group=group or None)
-                group_id = None
-                if group:
-                    group_id = group.id
-                for device in old_group_qs:
-                    Device._send_device_group_changed_signal(
-                        instance=device,
-                        group_id=group_id,
-                        old_group_id=device.group_id,
-                    )
-            self.message_user(
-                request,
-                _("Successfully changed group of selected devices."),
-                messages.SUCCESS,
-            )
+                # the group is changed in the background in chunks of devices
+                self._start_device_bulk_job(
+                    request,
+                    "change_group",
+                    queryset.filter(_is_deactivated=False),
+                    group_id=str(group.pk) if group else None,
+                )
             return HttpResponseRedirect(request.get_full_path())
 
         form = ChangeDeviceGroupForm(org_id=org_id)
@@ -791,6 +788,45 @@ class DeviceAdmin(MultitenantAdminMixin, BaseConfigAdmin, CopyableFieldsAdmin):
             device,
         )
 
+    _device_bulk_job_messages = {
+        "change_group": _(
+            "The group of the selected devices is being changed "
+            'in the background, <a href="{}">check progress</a>.'
+        ),
+        "deactivate": _(
+            "The selected devices are being deactivated "
+            'in the background, <a href="{}">check progress</a>.'
+        ),
+        "activate": _(
+            "The selected devices are being activated "
+            'in the background, <a href="{}">check progress</a>.'
+        ),
+        "delete": _(
+            "The selected devices are being deleted "
+            'in the background, <a href="{}">check progress</a>.'
+        ),
+    }
+
+    def _start_device_bulk_job(self, request, operation, queryset, **kwargs):
+        """
+        Starts a ``DeviceBulkJob`` on the devices of ``queryset``
+        and shows the link to its progress to the user
+        """
+        job = DeviceBulkJob.start(
+            operation,
+            queryset.values_list("pk", flat=True),
+            user=request.user,
+            **kwargs,
+        )
+        progress_url = reverse(
+            f"admin:{self.opts.app_label}_device_bulk_job", args=[job.id]
+        )
+        self.message_user(
+            request,
+            format_html(self._device_bulk_job_messages[operation], progress_url),
+            messages.SUCCESS,
+        )
+
     _device_status_messages = {
         "deactivate": {
             messages.SUCCESS: ngettext_lazy(
@@ -848,6 +884,9 @@ class DeviceAdmin(MultitenantAdminMixin, BaseConfigAdmin, CopyableFieldsAdmin):
         This helper method provides re-usability of code for
         device activation and deactivation actions.
         """
+        if queryset.count() > app_settings.BULK_ACTION_SYNC_MAX_DEVICES:
+            self._start_device_bulk_job(request, method, queryset)
+            return
         success_devices = []
         error_devices = []
         for device in queryset.iterator():
@@ -872,6 +911,24 @@ class DeviceAdmin(MultitenantAdminMixin, BaseConfigAdmin, CopyableFieldsAdmin):
 
     @admin.action(description=delete_selected.short_description, permissions=["delete"])
     def delete_selected(self, request, queryset):
+        if (
+            request.POST.get("post")
+            and queryset.count() > app_settings.BULK_ACTION_SYNC_MAX_DEVICES
+        ):
+            _, _, perms_needed, protected = self.get_deleted_objects(queryset, request)
+            if not perms_needed and not protected:
+                # the user has already confirmed the deletion
+                # of the devices which are not deactivated, the
+                # deleted devices are recorded in the admin log
+                # by the job
+                self._start_device_bulk_job(
+                    request,
+                    "delete",
+                    queryset,
+                    force=True,
+                    user_id=str(request.user.pk),
+                )
+                return None
         response = delete_selected(self, request, queryset)
         if not response:
             return response
@@ -965,6 +1022,11 @@ class DeviceAdmin(MultitenantAdminMixin, BaseConfigAdmin, CopyableFieldsAdmin):
                 self.admin_site.admin_view(get_default_values),
                 name="get_default_values",
             ),
+            path(
+                "bulk-job/<uuid:job_id>/",
+                self.admin_site.admin_view(self.bulk_job_view),
+                name=f"{self.opts.app_label}_device_bulk_job",
+            ),
         ] + super().get_urls()
         for inline in self.inlines + self.conditional_inlines:
             try:
@@ -973,6 +1035,46 @@ class DeviceAdmin(MultitenantAdminMixin, BaseConfigAdmin, CopyableFieldsAdmin):
                 pass
         return urls
 
+    _device_bulk_job_titles = {
+        "change_group": _("Change group of devices"),
+        "activate": _("Activate devices"),
+        "deactivate": _("Deactivate devices"),
+        "delete": _("Delete devices"),
+    }
+    # seconds after which the progress page is reloaded while the job is running
+    bulk_job_refresh_interval = 3
+
+    def bulk_job_view(self, request, job_id):
+        """
+        Shows the progress of a device bulk job started from one of
+        the admin actions, the page is reloaded until it completes
+        """
+        job = DeviceBulkJob(job_id)
+        progress = job.get_progress() if job.is_visible_to(request.user) else None
+        if progress is None:
+            raise Http404()
+        devices = self.model.objects.in_bulk(list(progress["errors"].keys()))
+        errors = []
+        for device_id, message in progress["errors"].items():
+            device = devices.get(UUID(device_id))
+            errors.append(
+                {
+                    "device": self._get_device_path(device) if device else device_id,
+                    "message": message,
+                }
+            )
+        context = {
+            **self.admin_site.each_context(request),
+            "title": self._device_bulk_job_titles.get(
+                progress["operation"], _("Device bulk operation")
+            ),
+            "opts": self.model._meta,
+            "progress": progress,
+            "errors": errors,
+            "refresh_interval": self.bulk_job_refresh_interval,
+        }
+        return TemplateResponse(request, "admin/config/device_bulk_job.html", context)
+
     def get_extra_context(self, pk=None):
         ctx = super().get_extra_context(pk)
         if pk:
@@ -1084,6 +1186,21 @@ class DeviceAdminExportable(ImportExportMixin, DeviceAdmin):
     resource_class = DeviceResource
     # needed to support both reversion and import-export
     change_list_template = "admin/config/change_list_device.html"
+    actions = DeviceAdmin.actions + ["stream_export_csv", "stream_export_ndjson"]
+
+    @admin.action(
+        description=_("Export selected devices (streaming CSV)"),
+        permissions=["view"],
+    )
+    def stream_export_csv(self, request, queryset):
+        return self.resource_class().get_streaming_response(queryset, "csv")
+
+    @admin.action(
+        description=_("Export selected devices (streaming NDJSON)"),
+        permissions=["view"],
+    )
+    def stream_export_ndjson(self, request, queryset):
+        return self.resource_class().get_streaming_response(queryset, "ndjson")
 
 
 class CloneOrganizationForm(forms.Form):
@@ -7,7 +7,7 @@ from swapper import load_model
 
 from openwisp_utils.api.serializers import ValidatedModelSerializer
 
-from ...serializers import BaseSerializer
+from ...serializers import BaseSerializer, SparseFieldsetsMixin
 from .. import settings as app_settings
 from ..whois.mixins import WHOISMixin
 
@@ -154,7 +154,7 @@ class BaseConfigSerializer(ValidatedModelSerializer):
         return super().validate(data)
 
 
-class DeviceConfigSerializer(BaseSerializer):
+class DeviceConfigSerializer(SparseFieldsetsMixin, BaseSerializer):
     def _get_config_templates(self, config_data):
         return [template.pk for template in config_data.pop("templates", [])]
 
@@ -393,3 +393,245 @@ class DeviceGroupSerializer(BaseSerializer):
         instance = super().update(instance, validated_data)
         self._save_m2m_templates(instance)
         return instance
+
+
+class DeviceImportSerializer(serializers.Serializer):
+    devices = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+
+
+class DeviceChangeGroupSerializer(serializers.Serializer):
+    devices = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+    group = serializers.UUIDField(allow_null=True)
+
+    def validate(self, data):
+        # the queryset of the view contains only the
+        # devices of the organizations managed by the user
+        devices = self.context["view"].get_queryset().filter(pk__in=data["devices"])
+        if devices.count() != len(set(data["devices"])):
+            raise serializers.ValidationError(
+                {"devices": _("Some of the selected devices could not be found.")}
+            )
+        org_ids = set(
+            devices.order_by().values_list("organization_id", flat=True).distinct()
+        )
+        if len(org_ids) > 1:
+            raise serializers.ValidationError(
+                {"devices": _("Select devices from one organization")}
+            )
+        if (
+            data["group"]
+            and not DeviceGroup.objects.filter(
+                pk=data["group"], organization_id__in=org_ids
+            ).exists()
+        ):
+            raise serializers.ValidationError(
+                {
+                    "group": _(
+                        "The group must belong to the organization of the devices."
+                    )
+                }
+            )
+        return data
+
+
+class DeviceBulkActionSerializer(serializers.Serializer):
+    devices = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+    action = serializers.ChoiceField(choices=["activate", "deactivate", "delete"])
+    force = serializers.BooleanField(default=False)
+
+    def validate_devices(self, value):
+        # the queryset of the view contains only the
+        # devices of the organizations managed by the user
+        devices = self.context["view"].get_queryset().filter(pk__in=value)
+        if devices.count() != len(set(value)):
+            raise serializers.ValidationError(
+                _("Some of the selected devices could not be found.")
+            )
+        return value
+
+
+class DeviceBulkChangesSerializer(serializers.Serializer):
+    device_fields = ["model", "os", "system", "notes"]
+    model = serializers.CharField(required=False, allow_blank=True, max_length=64)
+    os = serializers.CharField(required=False, allow_blank=True, max_length=128)
+    system = serializers.CharField(required=False, allow_blank=True, max_length=128)
+    notes = serializers.CharField(required=False, allow_blank=True)
+    context = serializers.JSONField(required=False)
+    add_templates = serializers.ListField(child=serializers.UUIDField(), required=False)
+    remove_templates = serializers.ListField(
+        child=serializers.UUIDField(), required=False
+    )
+
+    def validate_context(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError(_("Must be a JSON object."))
+        return value
+
+    def validate(self, data):
+        if not data:
+            raise serializers.ValidationError(_("Specify at least one change."))
+        if set(data.get("add_templates", [])) & set(data.get("remove_templates", [])):
+            raise serializers.ValidationError(
+                _("The same template cannot be both added and removed.")
+            )
+        return data
+
+
+class DeviceBulkUpdateSerializer(serializers.Serializer):
+    devices = serializers.ListField(
+        child=serializers.UUIDField(), required=False, allow_empty=False
+    )
+    changes = DeviceBulkChangesSerializer()
+
+    def _get_devices(self, data):
+        view = self.context["view"]
+        # the queryset of the view contains only the
+        # devices of the organizations managed by the user
+        if "devices" in data:
+            devices = view.get_queryset().filter(pk__in=data["devices"])
+            if devices.count() != len(set(data["devices"])):
+                raise serializers.ValidationError(
+                    {"devices": _("Some of the selected devices could not be found.")}
+                )
+            return devices
+        filters = view.filterset_class.base_filters
+        if not any(param in filters for param in self.context["request"].GET):
+            raise serializers.ValidationError(
+                {"devices": _("Specify the devices or at least one filter.")}
+            )
+        return view.filter_queryset(view.get_queryset())
+
+    def _validate_templates(self, changes, devices):
+        added = set(changes.get("add_templates", []))
+        removed = set(changes.get("remove_templates", []))
+        if not added and not removed:
+            return
+        templates = Template.objects.filter(pk__in=added | removed)
+        if len(templates) != len(added | removed):
+            raise serializers.ValidationError(
+                {"changes": _("Some of the selected templates could not be found.")}
+            )
+        for template in templates:
+            # templates of an organization can be assigned only to
+            # its devices, while they can be removed from any device
+            if (
+                template.pk in added
+                and template.organization_id
+                and devices.exclude(organization_id=template.organization_id).exists()
+            ):
+                raise serializers.ValidationError(
+                    {
+                        "changes": _(
+                            'The template "{template}" does not belong to the '
+                            "organization of the devices."
+                        ).format(template=template.name)
+                    }
+                )
+            if template.required and template.pk in removed:
+                raise serializers.ValidationError(
+                    {
+                        "changes": _(
+                            "Required templates cannot be removed "
+                            "from the configuration"
+                        )
+                    }
+                )
+
+    def validate(self, data):
+        devices = self._get_devices(data)
+        self._validate_templates(data["changes"], devices)
+        data["devices"] = list(devices.values_list("pk", flat=True))
+        return data
+
+
+class TemplateCloneSerializer(serializers.Serializer):
+    templates = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+    organization = serializers.PrimaryKeyRelatedField(
+        queryset=Organization.objects.all(), allow_null=True
+    )
+
+    def validate_templates(self, value):
+        # the queryset of the view contains only the templates
+        # of the organizations managed by the user
+        templates = self.context["view"].get_queryset().filter(pk__in=value)
+        if templates.count() != len(set(value)):
+            raise serializers.ValidationError(
+                _("Some of the selected templates could not be found.")
+            )
+        return templates
+
+    def validate_organization(self, value):
+        user = self.context["request"].user
+        if user.is_superuser:
+            return value
+        if value is None:
+            raise serializers.ValidationError(
+                _("Only superusers can clone templates as shared.")
+            )
+        if not user.is_manager(value):
+            raise serializers.ValidationError(
+                _("You are not a manager of this organization.")
+            )
+        return value
+
+
+class DeviceRenderItemSerializer(serializers.Serializer):
+    device = serializers.UUIDField()
+    templates = serializers.ListField(child=serializers.UUIDField(), required=False)
+    config = serializers.JSONField(required=False)
+    context = serializers.JSONField(required=False)
+
+    def validate_config(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError(_("Must be a JSON object."))
+        return value
+
+    validate_context = validate_config
+
+
+class DeviceRenderSerializer(serializers.Serializer):
+    items = serializers.ListField(
+        child=DeviceRenderItemSerializer(),
+        allow_empty=False,
+        max_length=app_settings.BULK_RENDER_MAX_ITEMS,
+    )
+
+    def validate_items(self, items):
+        # the queryset of the view contains only the
+        # devices of the organizations managed by the user
+        devices = (
+            self.context["view"]
+            .get_queryset()
+            .in_bulk({item["device"] for item in items})
+        )
+        template_ids = {
+            template_id for item in items for template_id in item.get("templates", [])
+        }
+        templates = Template.objects.in_bulk(template_ids)
+        for item in items:
+            device = devices.get(item["device"])
+            if device is None:
+                raise serializers.ValidationError(
+                    _("Device {device} could not be found.").format(
+                        device=item["device"]
+                    )
+                )
+            item["device"] = device
+            if "templates" not in item:
+                continue
+            item_templates = []
+            for template_id in item["templates"]:
+                template = templates.get(template_id)
+                if template is None or template.organization_id not in [
+                    None,
+                    device.organization_id,
+                ]:
+                    raise serializers.ValidationError(
+                        _(
+                            "Template {template} could not be found "
+                            "in the organization of device {device}."
+                        ).format(template=template_id, device=device.pk)
+                    )
+                item_templates.append(template)
+            item["templates"] = item_templates
+        return items
@@ -23,6 +23,11 @@ def get_api_urls(api_views):
                 api_views.template_detail,
                 name="template_detail",
             ),
+            path(
+                "controller/template/clone/",
+                api_views.template_clone,
+                name="template_clone",
+            ),
             path(
                 "controller/template/<uuid:pk>/configuration/",
                 api_download_views.download_template_config,
@@ -63,6 +68,41 @@ def get_api_urls(api_views):
                 api_views.device_deactivate,
                 name="device_deactivate",
             ),
+            path(
+                "controller/device/change-group/",
+                api_views.device_change_group,
+                name="device_change_group",
+            ),
+            path(
+                "controller/device/bulk-update/",
+                api_views.device_bulk_update,
+                name="device_bulk_update",
+            ),
+            path(
+                "controller/device/bulk-action/",
+                api_views.device_bulk_action,
+                name="device_bulk_action",
+            ),
+            path(
+                "controller/device/import/",
+                api_views.device_import,
+                name="device_import",
+            ),
+            path(
+                "controller/device/bulk-job/<uuid:pk>/",
+                api_views.device_bulk_job,
+                name="device_bulk_job",
+            ),
+            path(
+                "controller/device/render/",
+                api_views.device_render,
+                name="device_render",
+            ),
+            path(
+                "controller/device/export/",
+                api_views.device_export,
+                name="device_export",
+            ),
             path(
                 "controller/group/",
                 api_views.devicegroup_list,
@@ -1,10 +1,14 @@
-from cache_memoize import cache_memoize
-from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import F, Q
+from hashlib import md5
+
+from django.contrib.auth import get_permission_codename
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import F
 from django.http import Http404
-from django.urls.base import reverse
+from django.utils.translation import gettext_lazy as _
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import serializers, status
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.generics import (
     GenericAPIView,
     ListCreateAPIView,
@@ -14,10 +18,15 @@ from rest_framework.generics import (
 from rest_framework.response import Response
 from swapper import load_model
 
-from openwisp_users.api.permissions import DjangoModelPermissions
+from openwisp_users.api.permissions import DjangoModelPermissions, IsOrganizationManager
 from openwisp_utils.api.pagination import OpenWispPagination
 
-from ...mixins import ProtectedAPIMixin
+from ...mixins import ConditionalListMixin, ProtectedAPIMixin, SparseFieldsetsViewMixin
+from ...pagination import OptionalCursorPagination
+from .. import settings as app_settings
+from ..bulk_import import DeviceBulkImport
+from ..exportable import DeviceResource
+from ..jobs import DeviceBulkJob
 from .filters import (
     DeviceGroupListFilter,
     DeviceListFilter,
@@ -26,9 +35,16 @@ from .filters import (
     VPNListFilter,
 )
 from .serializers import (
+    DeviceBulkActionSerializer,
+    DeviceBulkChangesSerializer,
+    DeviceBulkUpdateSerializer,
+    DeviceChangeGroupSerializer,
     DeviceDetailSerializer,
     DeviceGroupSerializer,
+    DeviceImportSerializer,
     DeviceListSerializer,
+    DeviceRenderSerializer,
+    TemplateCloneSerializer,
     TemplateSerializer,
     VpnSerializer,
 )
@@ -42,10 +58,12 @@ VpnClient = load_model("config", "VpnClient")
 Cert = load_model("django_x509", "Cert")
 
 
-class TemplateListCreateView(ProtectedAPIMixin, ListCreateAPIView):
+class TemplateListCreateView(
+    ConditionalListMixin, ProtectedAPIMixin, ListCreateAPIView
+):
     serializer_class = TemplateSerializer
     queryset = Template.objects.prefetch_related("tags").order_by("-created")
-    pagination_class = OpenWispPagination
+    pagination_class = OptionalCursorPagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = TemplateListFilter
 
@@ -55,10 +73,36 @@ class TemplateDetailView(ProtectedAPIMixin, RetrieveUpdateDestroyAPIView):
     queryset = Template.objects.all()
 
 
-class VpnListCreateView(ProtectedAPIMixin, ListCreateAPIView):
+class TemplateCloneView(ProtectedAPIMixin, GenericAPIView):
+    """
+    Clones the specified templates (including their tags)
+    into the specified organization (``null`` means shared).
+    """
+
+    serializer_class = TemplateCloneSerializer
+    queryset = Template.objects.all()
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            clones = Template.bulk_clone(
+                serializer.validated_data["templates"],
+                organization=serializer.validated_data["organization"],
+                user=request.user,
+            )
+        except ValidationError as e:
+            raise serializers.ValidationError({"templates": e.messages})
+        data = TemplateSerializer(
+            clones, many=True, context=self.get_serializer_context()
+        ).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+class VpnListCreateView(ConditionalListMixin, ProtectedAPIMixin, ListCreateAPIView):
     serializer_class = VpnSerializer
     queryset = Vpn.objects.select_related("subnet").order_by("-created")
-    pagination_class = OpenWispPagination
+    pagination_class = OptionalCursorPagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = VPNListFilter
 
@@ -76,7 +120,9 @@ class DevicePermission(DjangoModelPermissions):
         return perm and not obj.is_deactivated()
 
 
-class DeviceListCreateView(ProtectedAPIMixin, ListCreateAPIView):
+class DeviceListCreateView(
+    SparseFieldsetsViewMixin, ProtectedAPIMixin, ListCreateAPIView
+):
     """
     Templates: Templates flagged as required will be added automatically
                to the `config` of a device and cannot be unassigned.
@@ -86,19 +132,33 @@ class DeviceListCreateView(ProtectedAPIMixin, ListCreateAPIView):
     queryset = Device.objects.select_related(
         "config", "group", "organization", "devicelocation"
     ).order_by("-created")
-    pagination_class = OpenWispPagination
+    sparse_fieldsets_relations = {
+        "config": ["config"],
+        "group": ["group"],
+        "organization": ["organization"],
+    }
+    pagination_class = OptionalCursorPagination
     filter_backends = [DeviceListFilterBackend]
     filterset_class = DeviceListFilter
 
 
-class DeviceDetailView(ProtectedAPIMixin, RetrieveUpdateDestroyAPIView):
+class DeviceDetailView(
+    SparseFieldsetsViewMixin, ProtectedAPIMixin, RetrieveUpdateDestroyAPIView
+):
     """
     Templates: Templates flagged as _required_ will be added automatically
                to the `config` of a device and cannot be unassigned.
     """
 
     serializer_class = DeviceDetailSerializer
-    queryset = Device.objects.select_related("config", "group", "organization")
+    # sortedm2m keeps the order of the templates when they are prefetched
+    queryset = Device.objects.select_related(
+        "config", "group", "organization"
+    ).prefetch_related("config__templates")
+    sparse_fieldsets_relations = {
+        "config": ["config"],
+        "group": ["group"],
+    }
     permission_classes = ProtectedAPIMixin.permission_classes + (DevicePermission,)
 
     def perform_destroy(self, instance):
@@ -144,6 +204,231 @@ class DeviceDeactivateView(ProtectedAPIMixin, GenericAPIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+class DeviceChangePermission(DjangoModelPermissions):
+    """
+    Requires the permission to change devices for POST requests,
+    which are used to change existing devices
+    """
+
+    perms_map = {
+        **DjangoModelPermissions.perms_map,
+        "POST": ["%(app_label)s.change_%(model_name)s"],
+    }
+
+
+class DeviceChangeGroupView(ProtectedAPIMixin, GenericAPIView):
+    """
+    Changes the group of the specified devices in the background,
+    returns the progress information of the job which can be
+    checked at the device bulk job endpoint.
+    """
+
+    serializer_class = DeviceChangeGroupSerializer
+    queryset = Device.objects.all()
+    permission_classes = [IsOrganizationManager, DeviceChangePermission]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        group_id = serializer.validated_data["group"]
+        job = DeviceBulkJob.start(
+            "change_group",
+            serializer.validated_data["devices"],
+            user=request.user,
+            group_id=str(group_id) if group_id else None,
+        )
+        return Response(job.get_progress(), status=status.HTTP_202_ACCEPTED)
+
+
+class DeviceBulkActionView(ProtectedAPIMixin, GenericAPIView):
+    """
+    Activates, deactivates or deletes the specified devices in the
+    background, returns the progress information of the job which
+    can be checked at the device bulk job endpoint.
+    """
+
+    serializer_class = DeviceBulkActionSerializer
+    queryset = Device.objects.all()
+    permission_classes = [IsOrganizationManager, DeviceChangePermission]
+    # model permission required by each action, in addition
+    # to the permission to change devices required for POST
+    action_permissions = {
+        "activate": "change",
+        "deactivate": "change",
+        "delete": "delete",
+    }
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        action = serializer.validated_data["action"]
+        opts = self.get_queryset().model._meta
+        codename = get_permission_codename(self.action_permissions[action], opts)
+        if not request.user.has_perm(f"{opts.app_label}.{codename}"):
+            raise PermissionDenied()
+        operation_kwargs = {}
+        if action == "delete":
+            operation_kwargs["force"] = serializer.validated_data["force"]
+        job = DeviceBulkJob.start(
+            action,
+            serializer.validated_data["devices"],
+            user=request.user,
+            **operation_kwargs,
+        )
+        return Response(job.get_progress(), status=status.HTTP_202_ACCEPTED)
+
+
+class DeviceBulkUpdateView(ProtectedAPIMixin, GenericAPIView):
+    """
+    Applies the same changes to many devices at once, the devices can
+    be specified with a list of IDs or with the filters of the device
+    list endpoint. Large changes are applied in the background and
+    return the progress information of the job which can be checked
+    at the device bulk job endpoint.
+    """
+
+    serializer_class = DeviceBulkUpdateSerializer
+    queryset = Device.objects.order_by("-created")
+    filter_backends = [DeviceListFilterBackend]
+    filterset_class = DeviceListFilter
+
+    def _get_operation_kwargs(self, changes):
+        kwargs = {
+            "fields": {
+                field: changes[field]
+                for field in DeviceBulkChangesSerializer.device_fields
+                if field in changes
+            },
+            "context": changes.get("context"),
+        }
+        for field in ["add_templates", "remove_templates"]:
+            kwargs[field] = [str(pk) for pk in changes.get(field, [])]
+        return kwargs
+
+    def patch(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        device_ids = serializer.validated_data["devices"]
+        operation_kwargs = self._get_operation_kwargs(
+            serializer.validated_data["changes"]
+        )
+        if len(device_ids) <= app_settings.BULK_UPDATE_SYNC_MAX_DEVICES:
+            try:
+                processed = Device.bulk_apply_changes(device_ids, **operation_kwargs)
+            except ValidationError as e:
+                raise serializers.ValidationError({"changes": e.messages})
+            return Response(
+                {"total": len(device_ids), "processed": processed},
+                status=status.HTTP_200_OK,
+            )
+        job = DeviceBulkJob.start(
+            "update", device_ids, user=request.user, **operation_kwargs
+        )
+        return Response(job.get_progress(), status=status.HTTP_202_ACCEPTED)
+
+
+class DeviceImportView(ProtectedAPIMixin, GenericAPIView):
+    """
+    Validates and imports many devices at once (each item uses the
+    columns of the device export); the import is completed in the
+    background, returns the progress information of the job which
+    can be checked at the device bulk job endpoint.
+    """
+
+    serializer_class = DeviceImportSerializer
+    queryset = Device.objects.all()
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        device_import = DeviceBulkImport(
+            serializer.validated_data["devices"], user=request.user
+        )
+        try:
+            job = device_import.save()
+        except ValidationError as e:
+            raise serializers.ValidationError({"devices": e.messages})
+        return Response(job.get_progress(), status=status.HTTP_202_ACCEPTED)
+
+
+class DeviceBulkJobView(ProtectedAPIMixin, GenericAPIView):
+    serializer_class = serializers.Serializer
+    queryset = Device.objects.none()
+
+    def get(self, request, *args, **kwargs):
+        job = DeviceBulkJob(kwargs["pk"])
+        if not job.is_visible_to(request.user):
+            raise Http404
+        return Response(job.get_progress())
+
+
+class DeviceRenderView(ProtectedAPIMixin, GenericAPIView):
+    """
+    Validates and renders the configuration of many devices at once
+    without saving anything, optionally replacing the templates,
+    the configuration or the configuration variables of each device.
+    """
+
+    serializer_class = DeviceRenderSerializer
+    queryset = Device.objects.select_related("config", "group", "organization")
+
+    def _get_preview_instance(self, item):
+        device = item["device"]
+        if device._has_config():
+            instance = device.config
+        else:
+            instance = Config(device=device, backend=app_settings.DEFAULT_BACKEND)
+        for field in ["config", "context"]:
+            if field in item:
+                setattr(instance, field, item[field])
+        return instance
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = []
+        for item in serializer.validated_data["items"]:
+            instance = self._get_preview_instance(item)
+            output, error = instance.render_preview(item.get("templates"))
+            results.append(
+                {
+                    "device": str(item["device"].pk),
+                    "valid": error is None,
+                    "output": output,
+                    "error": error,
+                }
+            )
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+
+class DeviceExportView(ProtectedAPIMixin, GenericAPIView):
+    """
+    Streams the devices (with their configuration) as NDJSON
+    (default) or CSV, depending on the ``export_format`` parameter;
+    the filters of the device list endpoint are supported.
+    """
+
+    serializer_class = serializers.Serializer
+    queryset = Device.objects.order_by("-created")
+    filter_backends = [DeviceListFilterBackend]
+    filterset_class = DeviceListFilter
+    resource_class = DeviceResource
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.query_params.get("export_format", "ndjson")
+        resource = self.resource_class()
+        if export_format not in resource.stream_formats:
+            raise serializers.ValidationError(
+                {
+                    "export_format": _("Supported formats: {formats}.").format(
+                        formats=", ".join(resource.stream_formats)
+                    )
+                }
+            )
+        queryset = self.filter_queryset(self.get_queryset())
+        return resource.get_streaming_response(queryset, export_format)
+
+
 class DeviceGroupListCreateView(ProtectedAPIMixin, ListCreateAPIView):
     serializer_class = DeviceGroupSerializer
     queryset = DeviceGroup.objects.prefetch_related("templates").order_by("-created")
@@ -157,48 +442,55 @@ class DeviceGroupDetailView(ProtectedAPIMixin, RetrieveUpdateDestroyAPIView):
     queryset = DeviceGroup.objects.select_related("organization").order_by("-created")
 
 
-def get_cached_devicegroup_args_rewrite(cls, org_slugs, common_name):
-    url = reverse(
-        "config_api:devicegroup_x509_commonname",
-        args=[common_name],
-    )
-    url = f"{url}?org={org_slugs}"
-    return url
-
-
 class DeviceGroupCommonName(ProtectedAPIMixin, RetrieveAPIView):
     serializer_class = DeviceGroupSerializer
     queryset = DeviceGroup.objects.select_related("organization").order_by("-created")
     # Not setting lookup_field makes DRF raise error. but it is not used
     lookup_field = "pk"
+    cache_timeout = 24 * 60 * 60
+
+    @staticmethod
+    def get_cache_key(common_name):
+        digest = md5(common_name.encode()).hexdigest()
+        return f"devicegroup_commonname_{digest}"
 
     @classmethod
-    @cache_memoize(
-        timeout=24 * 60 * 60, args_rewrite=get_cached_devicegroup_args_rewrite
-    )
-    def get_device_group(cls, org_slugs, common_name):
-        query = Q(common_name=common_name)
-        if org_slugs:
-            org_slugs = org_slugs.split(",")
-            query = query & Q(organization__slug__in=org_slugs)
-        try:
-            cert = (
-                Cert.objects.select_related("organization")
-                .only("id", "organization")
-                .filter(query)
-                .first()
-            )
-            vpnclient = VpnClient.objects.only("config_id").get(cert_id=cert.id)
-            group = (
-                Device.objects.select_related("group")
-                .only("group")
-                .get(config=vpnclient.config_id)
-                .group
+    def get_common_name_index(cls, common_name):
+        """
+        Returns the groups of the devices whose VPN clients use a
+        certificate with ``common_name``, annotated with the slug of the
+        organization of the certificate; the result is fetched with a
+        single joined query and cached under a key derived only from
+        ``common_name``, which allows to invalidate it directly.
+        """
+        cache_key = cls.get_cache_key(common_name)
+        groups = cache.get(cache_key)
+        if groups is None:
+            groups = list(
+                DeviceGroup.objects.filter(
+                    device__config__vpnclient__cert__common_name=common_name
+                )
+                .select_related("organization")
+                .annotate(
+                    cert_organization_slug=F(
+                        "device__config__vpnclient__cert__organization__slug"
+                    )
+                )
+                .order_by("device__config__vpnclient__cert__created")
             )
-            assert group is not None
-        except (ObjectDoesNotExist, AssertionError, AttributeError):
-            raise Http404
-        return group
+            # missing entries are not cached, the certificate
+            # may be assigned to a device at any moment
+            if groups:
+                cache.set(cache_key, groups, cls.cache_timeout)
+        return groups
+
+    @classmethod
+    def get_device_group(cls, org_slugs, common_name):
+        org_slugs = set(org_slugs.split(",")) if org_slugs else None
+        for group in cls.get_common_name_index(common_name):
+            if org_slugs is None or group.cert_organization_slug in org_slugs:
+                return group
+        raise Http404
 
     def get_object(self):
         org_slugs = self.request.query_params.get("org", "")
@@ -209,86 +501,66 @@ class DeviceGroupCommonName(ProtectedAPIMixin, RetrieveAPIView):
         return group
 
     @classmethod
-    def _invalidate_from_queryset(cls, queryset):
-        for obj in queryset.iterator():
-            if not obj["common_name"]:
-                return
-            cls.get_device_group.invalidate(None, "", obj["common_name"])
-            cls.get_device_group.invalidate(
-                None, obj["organization__slug"], obj["common_name"]
-            )
+    def _invalidate_common_names(cls, common_names):
+        cache.delete_many(
+            [cls.get_cache_key(common_name) for common_name in set(common_names)]
+        )
 
     @classmethod
     def device_change_invalidates_cache(cls, device_id):
-        qs = (
-            VpnClient.objects.select_related(
-                "config",
-                "organization",
-                "cert",
-            )
-            .filter(config__device_id=device_id)
-            .annotate(
-                organization__slug=F("cert__organization__slug"),
-                common_name=F("cert__common_name"),
-            )
-            .values("common_name", "organization__slug")
+        cls._invalidate_common_names(
+            VpnClient.objects.filter(config__device_id=device_id)
+            .exclude(cert__common_name=None)
+            .values_list("cert__common_name", flat=True)
         )
-        cls._invalidate_from_queryset(qs)
 
     @classmethod
     def devicegroup_change_invalidates_cache(cls, device_group_id):
-        qs = (
-            VpnClient.objects.select_related(
-                "config",
-                "config__device",
-                "config__device__group",
-                "organization",
-                "cert",
-            )
-            .filter(config__device__group_id=device_group_id)
-            .annotate(
-                organization__slug=F("cert__organization__slug"),
-                common_name=F("cert__common_name"),
-            )
-            .values("common_name", "organization__slug")
+        cls._invalidate_common_names(
+            VpnClient.objects.filter(config__device__group_id=device_group_id)
+            .exclude(cert__common_name=None)
+            .values_list("cert__common_name", flat=True)
         )
-        cls._invalidate_from_queryset(qs)
 
     @classmethod
     def certificate_change_invalidates_cache(cls, cert_id):
-        qs = (
-            Cert.objects.select_related("organization")
-            .filter(id=cert_id)
-            .values("organization__slug", "common_name")
+        cls._invalidate_common_names(
+            Cert.objects.filter(id=cert_id).values_list("common_name", flat=True)
         )
-        cls._invalidate_from_queryset(qs)
 
     @classmethod
     def devicegroup_delete_invalidates_cache(cls, organization_id):
-        qs = (
-            Cert.objects.select_related("organization")
-            .filter(organization_id=organization_id)
-            .values("organization__slug", "common_name")
+        # the devices of the deleted group have already been
+        # removed from it, hence all the organization is affected
+        cls._invalidate_common_names(
+            Cert.objects.filter(organization_id=organization_id).values_list(
+                "common_name", flat=True
+            )
         )
-        cls._invalidate_from_queryset(qs)
 
     @classmethod
     def certificate_delete_invalidates_cache(cls, common_name, organization_slug=None):
         if not common_name:
             return
-        cls.get_device_group.invalidate(cls, "", common_name)
-        if organization_slug:
-            cls.get_device_group.invalidate(cls, organization_slug, common_name)
+        cls._invalidate_common_names([common_name])
 
 
 template_list = TemplateListCreateView.as_view()
 template_detail = TemplateDetailView.as_view()
+template_clone = TemplateCloneView.as_view()
 vpn_list = VpnListCreateView.as_view()
 vpn_detail = VpnDetailView.as_view()
 device_list = DeviceListCreateView.as_view()
 device_detail = DeviceDetailView.as_view()
 device_activate = DeviceActivateView.as_view()
 device_deactivate = DeviceDeactivateView.as_view()
+device_change_group = DeviceChangeGroupView.as_view()
+device_bulk_update = DeviceBulkUpdateView.as_view()
+device_bulk_action = DeviceBulkActionView.as_view()
+device_import = DeviceImportView.as_view()
+device_bulk_job = DeviceBulkJobView.as_view()
+device_render = DeviceRenderView.as_view()
+device_export = DeviceExportView.as_view()
 devicegroup_list = DeviceGroupListCreateView.as_view()
 devicegroup_detail = DeviceGroupDetailView.as_view()
 devicegroup_commonname = DeviceGroupCommonName.as_view()
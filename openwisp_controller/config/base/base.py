@@ -1,9 +1,12 @@
 import hashlib
 import json
 import logging
+import re
 from copy import deepcopy
+from functools import lru_cache
 
 from cache_memoize import cache_memoize
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
@@ -19,6 +22,23 @@ from .. import settings as app_settings
 
 logger = logging.getLogger(__name__)
 
+# matches the configuration variables (eg: ``{{ ssid }}``)
+# which netjsonconfig replaces with the values of the context
+VARIABLE_PATTERN = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+# time (in seconds) for which the successful
+# validation of a configuration is remembered
+_VALIDATION_CACHE_TIMEOUT = 86400
+
+
+@lru_cache(maxsize=None)
+def get_schema_digest(backend_class):
+    """
+    Returns a digest of the schema of a netjsonconfig backend,
+    computed only once per backend class
+    """
+    schema = json.dumps(backend_class.schema, sort_keys=True, default=str)
+    return hashlib.md5(schema.encode()).hexdigest()
+
 
 def get_cached_args_rewrite(instance):
     """
@@ -174,6 +194,14 @@ class BaseConfig(BaseModel):
     def get_context(self):
         return app_settings.CONTEXT.copy()
 
+    def get_variables(self):
+        """
+        Returns the set of the configuration variables
+        referenced in the configuration
+        """
+        config = json.dumps(self.config or {}, cls=DjangoJSONEncoder)
+        return set(VARIABLE_PATTERN.findall(config))
+
     @classmethod
     def validate_netjsonconfig_backend(cls, backend):
         """
@@ -183,8 +211,27 @@ class BaseConfig(BaseModel):
         # the following line is a trick needed to avoid cluttering
         # an eventual ``ValidationError`` message with ``OrderedDict``
         # which would make the error message hard to read
-        backend.config = json.loads(json.dumps(backend.config))
+        config = json.dumps(backend.config)
+        backend.config = json.loads(config)
+        # configurations which have already passed the validation
+        # (eg: devices saved again without changing the templates)
+        # are not validated again, only successes are remembered
+        cache_key = cls._get_validation_cache_key(backend, config)
+        if cache.get(cache_key):
+            return
         backend.validate()
+        cache.set(cache_key, True, timeout=_VALIDATION_CACHE_TIMEOUT)
+
+    @classmethod
+    def _get_validation_cache_key(cls, backend, config):
+        backend_class = type(backend)
+        key = "{0}.{1}:{2}:{3}".format(
+            backend_class.__module__,
+            backend_class.__name__,
+            get_schema_digest(backend_class),
+            config,
+        )
+        return f"config_valid_{hashlib.md5(key.encode()).hexdigest()}"
 
     @classmethod
     def clean_netjsonconfig_backend(cls, backend):
@@ -195,14 +242,21 @@ class BaseConfig(BaseModel):
         try:
             cls.validate_netjsonconfig_backend(backend)
         except SchemaError as e:
-            path = [str(el) for el in e.details.path]
-            trigger = "/".join(path)
-            error = e.details.message
-            message = (
-                'Invalid configuration triggered by "#/{0}", '
-                "validator says:\n\n{1}".format(trigger, error)
-            )
-            raise ValidationError(message)
+            raise cls._get_schema_validation_error(e)
+
+    @classmethod
+    def _get_schema_validation_error(cls, error):
+        """
+        converts a ``SchemaError`` (which can also be raised by
+        the ``render`` method of the backend) to ``ValidationError``
+        """
+        path = [str(el) for el in error.details.path]
+        trigger = "/".join(path)
+        message = (
+            'Invalid configuration triggered by "#/{0}", '
+            "validator says:\n\n{1}".format(trigger, error.details.message)
+        )
+        return ValidationError(message)
 
     @cached_property
     def backend_class(self):
@@ -259,6 +313,54 @@ class BaseConfig(BaseModel):
                 unique_files.append(file)
         backend_instance.config["files"] = unique_files
 
+    def render_preview(self, templates=None):
+        """
+        Validates and renders the configuration merged with ``templates``
+        (defaults to the assigned templates) without saving anything,
+        returns a tuple ``(output, error)``.
+
+        The result is cached for ``PREVIEW_CACHE_TIMEOUT`` seconds, keyed
+        by the configuration which is rendered (templates merged and
+        variables replaced): a change of the configuration, of the
+        templates or of the context results in a new render.
+        """
+        backend = self.get_backend_instance(
+            template_instances=templates, context=self.get_context()
+        )
+        cache_key = self._get_preview_cache_key(backend)
+        if cache_key:
+            result = cache.get(cache_key)
+            if result is not None:
+                return tuple(result)
+        output = None
+        error = None
+        try:
+            self.clean_netjsonconfig_backend(backend)
+            output = backend.render()
+        except ValidationError as e:
+            error = str(e)
+        if cache_key:
+            cache.set(cache_key, (output, error), app_settings.PREVIEW_CACHE_TIMEOUT)
+        return output, error
+
+    @classmethod
+    def _get_preview_cache_key(cls, backend):
+        if not app_settings.PREVIEW_CACHE_TIMEOUT:
+            return None
+        try:
+            data = json.dumps(
+                [
+                    f"{backend.__module__}.{backend.__class__.__name__}",
+                    backend.config,
+                    getattr(backend, "dsa", None),
+                ],
+                sort_keys=True,
+                cls=DjangoJSONEncoder,
+            )
+        except (TypeError, ValueError):
+            return None
+        return f"config_preview_{hashlib.md5(data.encode()).hexdigest()}"
+
     def generate(self):
         """
         shortcut for self.backend_instance.generate()
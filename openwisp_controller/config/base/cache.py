@@ -1,6 +1,8 @@
 import json
+import re
 from types import SimpleNamespace
 
+from django.core.cache import cache
 from django.core.exceptions import FieldDoesNotExist
 from django.db import models, transaction
 from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
@@ -55,11 +57,15 @@ class CacheDependency:
         Either a method name (``str``) invoked on each resolved object, or a
         callable ``target(obj)``. Reusing the existing action methods (e.g.
         ``update_status_if_checksum_changed``, ``invalidate_checksum_cache``)
-        and view classmethods keeps behavior identical.
+        and view classmethods keeps behavior identical. It can be omitted
+        only in the ``invalidated_by`` dependencies of a
+        :class:`CacheDependencyIndex`, which sets it.
     resolve:
         Callable ``resolve(instance, **signal_kwargs)`` returning an iterable
         of the objects ``target`` must act on. Defaults to acting on the
-        instance that emitted the signal (``[instance]``).
+        instance that emitted the signal (``[instance]``). When
+        ``track_fields`` is set, it also receives ``old_values``, a dict
+        holding the previous value of each tracked field.
     source:
         The signal sender. Either a swappable model label (e.g.
         ``"django_x509.Cert"``) resolved lazily via ``swapper.load_model``, a
@@ -96,7 +102,7 @@ class CacheDependency:
     def __init__(
         self,
         *,
-        target,
+        target=None,
         resolve=_default_resolve,
         source=None,
         signal="post_save",
@@ -325,11 +331,13 @@ class CacheDependency:
             return None
         return {field: getattr(old, field) for field in self.track_fields}
 
-    def _tracked_fields_changed(self, instance):
+    def _pop_snapshot(self, instance):
         snapshots = getattr(instance, self._SNAPSHOT_ATTR, None) or {}
         # Consume the snapshot: a reused instance saved again (e.g. with
         # ``update_fields``) must not compare against this stale snapshot.
-        old = snapshots.pop(self._uid, None)
+        return snapshots.pop(self._uid, None)
+
+    def _tracked_fields_changed(self, old, instance):
         if old is None:
             # No snapshot (e.g. on creation) -> nothing to compare against.
             return False
@@ -341,14 +349,14 @@ class CacheDependency:
                 return True
         return False
 
-    def _should_skip(self, instance, **kwargs):
+    def _should_skip(self, instance, old_values=None, **kwargs):
         if (
             self.signal is post_save
             and kwargs.get("created", False)
             and not self.on_create
         ):
             return True
-        if self.track_fields and not self._tracked_fields_changed(instance):
+        if self.track_fields and not self._tracked_fields_changed(old_values, instance):
             return True
         return False
 
@@ -362,8 +370,12 @@ class CacheDependency:
                 getattr(obj, self.target)()
 
     def _handler(self, sender, instance, **kwargs):
-        if self._should_skip(instance, **kwargs):
+        old_values = self._pop_snapshot(instance) if self.track_fields else None
+        if self._should_skip(instance, old_values, **kwargs):
             return
+        if self.track_fields:
+            # lets the resolver act only on what the change actually affects
+            kwargs["old_values"] = old_values
         objects = self.resolve(instance, **kwargs)
         if not objects:
             return
@@ -374,6 +386,216 @@ class CacheDependency:
             self._apply(objects)
 
 
+class CacheDependencyIndex:
+    """
+    Reverse index from a related object to the objects whose cached values
+    depend on it (e.g. template -> configs, VPN server -> VPN clients),
+    materialized in the cache.
+
+    The first time the dependents of a key are needed, they are read from
+    the database (a single read of an indexed column, without instantiating
+    any model) and stored in the cache as a compact list of primary keys,
+    so that the following invalidations resolve their fan-out with a single
+    cache read. Keys having more than ``max_entries`` dependents are not
+    materialized: their dependents are read from the database each time.
+
+    The entries are discarded by the ``invalidated_by`` dependencies, which
+    are wired like any other :class:`CacheDependency`, when the relationship
+    changes, while the bulk operations which do not emit signals call
+    :meth:`invalidate` explicitly. Entries are not discarded when dependents
+    are deleted, hence they may list objects which no longer exist and must
+    always be used as a ``pk__in`` filter.
+
+    Parameters
+    ----------
+    name:
+        Unique, human-readable name of the index (e.g. ``"template -> configs"``).
+    model:
+        The model class (or swappable model label) holding the relationship.
+    key_field:
+        The field (or lookup) identifying the related object which changes.
+    value_field:
+        The field identifying the objects whose cache depends on the key
+        (defaults to ``"pk"``).
+    invalidated_by:
+        List of :class:`CacheDependency` whose ``resolve`` returns the keys
+        of the entries made stale by a change, their ``target`` is set by
+        the index.
+    """
+
+    # keys with more dependents than this are not stored in the cache
+    max_entries = 10000
+    cache_timeout = 60 * 60 * 24
+    # stored for the keys having more than ``max_entries`` dependents
+    _NOT_MATERIALIZED = False
+
+    # Every index declared by a model registers itself here, so the fan-out
+    # of the invalidation graph can be inspected (see ``render_registered``
+    # and the ``print_cache_dependencies --index`` management command).
+    _registry = {}
+
+    def __init__(
+        self, *, name, model, key_field, value_field="pk", invalidated_by=None
+    ):
+        self.name = name
+        self._model = model
+        self.key_field = key_field
+        self.value_field = value_field
+        self.invalidated_by = list(invalidated_by or [])
+        for dependency in self.invalidated_by:
+            dependency.target = self.invalidate_key
+            # invalidate() discards the entries both immediately and on commit
+            dependency.on_commit = False
+
+    @property
+    def model(self):
+        if isinstance(self._model, str):
+            app_label, model_name = self._model.split(".")
+            return load_model(app_label, model_name)
+        return self._model
+
+    @property
+    def label(self):
+        return re.sub(r"\W+", "_", self.name).strip("_")
+
+    def register(self, prefix):
+        """Connects ``invalidated_by`` and registers the index."""
+        prefix = f"{prefix}.index.{self.label}"
+        for dependency in self.invalidated_by:
+            dependency.connect(dispatch_uid=dependency.build_dispatch_uid(prefix))
+        self._registry[self.name] = self
+
+    @classmethod
+    def get_registered_indexes(cls):
+        """Returns all registered indexes, sorted by name."""
+        return [cls._registry[name] for name in sorted(cls._registry)]
+
+    @classmethod
+    def get_registered_index(cls, name):
+        try:
+            return cls._registry[name]
+        except KeyError:
+            raise KeyError(f'Unknown cache dependency index: "{name}"')
+
+    def get_cache_key(self, key):
+        return f"cache_dependency_index_{self.label}_{key}"
+
+    def _query(self, key):
+        return (
+            self.model._default_manager.filter(**{self.key_field: key})
+            .order_by()
+            .values_list(self.value_field, flat=True)
+        )
+
+    def lookup(self, key):
+        """
+        Returns the primary keys of the dependents of ``key``: a list read
+        from the cache or, if ``key`` has too many dependents to be
+        materialized, a lazy ``values_list`` which can be used directly
+        as a ``pk__in`` subquery.
+        """
+        if key is None:
+            return []
+        cache_key = self.get_cache_key(key)
+        entries = cache.get(cache_key)
+        if entries is None:
+            values = list(self._query(key)[: self.max_entries + 1])
+            if len(values) > self.max_entries:
+                entries = self._NOT_MATERIALIZED
+            else:
+                entries = [str(value) for value in values]
+            cache.set(cache_key, entries, self.cache_timeout)
+        if entries is self._NOT_MATERIALIZED:
+            return self._query(key)
+        return entries
+
+    def invalidate(self, keys):
+        """Discards the entries of ``keys``."""
+        cache_keys = [self.get_cache_key(key) for key in keys if key is not None]
+        if not cache_keys:
+            return
+        cache.delete_many(cache_keys)
+        # a concurrent request may materialize the entries again from
+        # the database before the transaction changing them is committed
+        transaction.on_commit(lambda: cache.delete_many(cache_keys))
+
+    def invalidate_key(self, key):
+        self.invalidate([key])
+
+    def get_stats(self):
+        """
+        Returns a dict describing the size of the index: the number of keys,
+        the number of entries, the maximum and average fan-out per key and
+        how many keys are currently materialized in the cache.
+        """
+        counts = dict(
+            self.model._default_manager.filter(**{f"{self.key_field}__isnull": False})
+            .order_by()
+            .values(self.key_field)
+            .annotate(fanout=models.Count(self.value_field))
+            .values_list(self.key_field, "fanout")
+        )
+        entries = sum(counts.values())
+        materialized = cache.get_many([self.get_cache_key(key) for key in counts])
+        return {
+            "name": self.name,
+            "model": self.model._meta.label_lower,
+            "key_field": self.key_field,
+            "value_field": self.value_field,
+            "keys": len(counts),
+            "entries": entries,
+            "max_fanout": max(counts.values(), default=0),
+            "avg_fanout": round(entries / len(counts), 2) if counts else 0,
+            "materialized_keys": sum(
+                1 for value in materialized.values() if value is not False
+            ),
+            "oversized_keys": sum(
+                1 for fanout in counts.values() if fanout > self.max_entries
+            ),
+        }
+
+    @classmethod
+    def render_registered(cls, fmt="text"):
+        """
+        Returns a string describing the size of every registered index.
+
+        ``fmt`` is either ``"text"`` (human-readable) or ``"json"``
+        (a machine-readable list of ``get_stats()`` dicts).
+        """
+        stats = [index.get_stats() for index in cls.get_registered_indexes()]
+        if fmt == "json":
+            return json.dumps(stats, indent=2)
+        if not stats:
+            return _("No cache dependency indexes are registered.")
+        lines = []
+        for info in stats:
+            if lines:
+                lines.append("")
+            lines.append(info["name"])
+            lines.append(
+                "  {model}: {key_field} -> {value_field}".format(
+                    model=info["model"],
+                    key_field=info["key_field"],
+                    value_field=info["value_field"],
+                )
+            )
+            lines.append(
+                "  "
+                + _(
+                    "keys: {keys}   entries: {entries}"
+                    "   max fan-out: {max_fanout}   avg fan-out: {avg_fanout}"
+                ).format(**info)
+            )
+            lines.append(
+                "  "
+                + _(
+                    "materialized keys: {materialized_keys}"
+                    "   oversized keys: {oversized_keys}"
+                ).format(**info)
+            )
+        return "\n".join(lines)
+
+
 class CacheInvalidationMixin:
     """
     Lets a cache-owning model declare, in one place, which related changes
@@ -395,8 +617,18 @@ class CacheInvalidationMixin:
         """Returns the list of :class:`CacheDependency` for this model."""
         return []
 
+    @classmethod
+    def get_dependency_indexes(cls):
+        """
+        Returns the list of :class:`CacheDependencyIndex` used by this model
+        to resolve the objects affected by a related change.
+        """
+        return []
+
     @classmethod
     def register_cache_dependencies(cls):
         prefix = f"cache_invalidation.{cls._meta.label_lower}"
         for dependency in cls.get_cache_dependencies():
             dependency.connect(dispatch_uid=dependency.build_dispatch_uid(prefix))
+        for index in cls.get_dependency_indexes():
+            index.register(prefix)
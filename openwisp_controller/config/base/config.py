@@ -2,6 +2,7 @@ import collections
 import logging
 import re
 from collections import defaultdict
+from types import SimpleNamespace
 
 from cache_memoize import cache_memoize
 from django.core.cache import cache
@@ -9,6 +10,7 @@ from django.core.exceptions import ObjectDoesNotExist, PermissionDenied, Validat
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models, transaction
 from django.db.models import JSONField
+from django.db.models.signals import m2m_changed
 from django.utils.translation import gettext_lazy as _
 from model_utils import Choices
 from model_utils.fields import StatusField
@@ -27,7 +29,7 @@ from ..signals import (
 from ..sortedm2m.fields import SortedManyToManyField
 from ..utils import get_default_templates_queryset
 from .base import BaseConfig, ChecksumCacheMixin, get_cached_args_rewrite
-from .cache import CacheDependency, CacheInvalidationMixin
+from .cache import CacheDependency, CacheDependencyIndex, CacheInvalidationMixin
 
 logger = logging.getLogger(__name__)
 
@@ -104,6 +106,9 @@ class AbstractConfig(CacheInvalidationMixin, ChecksumCacheMixin, BaseConfig):
 
     _CHECKSUM_CACHE_TIMEOUT = ChecksumCacheMixin._CHECKSUM_CACHE_TIMEOUT
     _CONFIG_MODIFIED_TIMEOUT = 3
+    # amount of configs processed at once
+    # by ``bulk_manage_group_templates``
+    _group_templates_chunk_size = 1000
     _config_context_functions = list()
     _old_backend = None
 
@@ -186,22 +191,59 @@ class AbstractConfig(CacheInvalidationMixin, ChecksumCacheMixin, BaseConfig):
             return []
 
     @classmethod
-    def _bulk_invalidate_configs(cls, filters):
-        """Bulk-recompute the checksums of the configs matching ``filters``."""
+    def _bulk_invalidate_configs(cls, filters, variables=None):
+        """
+        Bulk-recompute the checksums of the configs matching ``filters``,
+        if ``variables`` is not ``None``, only the configs referencing
+        at least one of them are recomputed.
+        """
         from ..tasks import bulk_invalidate_config_get_cached_checksum
 
-        bulk_invalidate_config_get_cached_checksum.delay(filters)
+        if variables is None:
+            bulk_invalidate_config_get_cached_checksum.delay(filters)
+        elif variables:
+            bulk_invalidate_config_get_cached_checksum.delay(
+                filters, variables=variables
+            )
+
+    @classmethod
+    def _resolve_context_dependency(cls, instance, old_values=None, **kwargs):
+        """
+        Returns a snapshot of the object whose ``context`` has changed,
+        holding the names of the variables which have been added, removed
+        or modified (``None`` if the previous context is not known).
+        """
+        changed_variables = None
+        old_context = (old_values or {}).get("context")
+        if isinstance(old_context, dict) and isinstance(instance.context, dict):
+            missing = object()
+            changed_variables = sorted(
+                key
+                for key in old_context.keys() | instance.context.keys()
+                if old_context.get(key, missing) != instance.context.get(key, missing)
+            )
+        return [
+            SimpleNamespace(
+                id=instance.pk,
+                organization_id=getattr(instance, "organization_id", None),
+                changed_variables=changed_variables,
+            )
+        ]
 
     @classmethod
     def _invalidate_configs_in_group(cls, group):
         """Bulk-recompute checksums of configs in a group (context change)."""
-        cls._bulk_invalidate_configs({"device__group_id": str(group.id)})
+        cls._bulk_invalidate_configs(
+            {"device__group_id": str(group.id)},
+            getattr(group, "changed_variables", None),
+        )
 
     @classmethod
     def _invalidate_configs_in_org(cls, org_config_settings):
         """Bulk-recompute checksums of an org's configs (context change)."""
         cls._bulk_invalidate_configs(
-            {"device__organization_id": str(org_config_settings.organization_id)}
+            {"device__organization_id": str(org_config_settings.organization_id)},
+            getattr(org_config_settings, "changed_variables", None),
         )
 
     @classmethod
@@ -240,7 +282,8 @@ class AbstractConfig(CacheInvalidationMixin, ChecksumCacheMixin, BaseConfig):
             )
             if issubclass(origin_model, Organization):
                 return []
-        return list(cls.objects.filter(templates=template))
+        index = CacheDependencyIndex.get_registered_index("template -> configs")
+        return list(cls.objects.filter(pk__in=index.lookup(template.pk)))
 
     @classmethod
     def get_cache_dependencies(cls):
@@ -269,6 +312,7 @@ class AbstractConfig(CacheInvalidationMixin, ChecksumCacheMixin, BaseConfig):
                 source="config.DeviceGroup",
                 signal="post_save",
                 track_fields=["context"],
+                resolve=cls._resolve_context_dependency,
                 target=cls._invalidate_configs_in_group,
             ),
             # Organization-level configuration variables feed into
@@ -277,6 +321,7 @@ class AbstractConfig(CacheInvalidationMixin, ChecksumCacheMixin, BaseConfig):
                 source="config.OrganizationConfigSettings",
                 signal="post_save",
                 track_fields=["context"],
+                resolve=cls._resolve_context_dependency,
                 target=cls._invalidate_configs_in_org,
             ),
             # When a template is deleted, Django removes through-table
@@ -292,13 +337,170 @@ class AbstractConfig(CacheInvalidationMixin, ChecksumCacheMixin, BaseConfig):
         ]
 
     @classmethod
-    def bulk_invalidate_get_cached_checksum(cls, query_params):
+    def get_dependency_indexes(cls):
+        return [
+            # Configs using a template (sortedm2m through table).
+            CacheDependencyIndex(
+                name="template -> configs",
+                model=cls.templates.through,
+                key_field="template_id",
+                value_field="config_id",
+                invalidated_by=[
+                    CacheDependency(
+                        source=cls.templates.through,
+                        signal_obj=m2m_changed,
+                        name="m2m_changed",
+                        resolve=cls._resolve_template_index_keys,
+                    ),
+                ],
+            ),
+            # Configs of the devices in a device group.
+            CacheDependencyIndex(
+                name="device group -> configs",
+                model=cls,
+                key_field="device__group_id",
+                invalidated_by=[
+                    CacheDependency(
+                        source="config.Device",
+                        signal="post_save",
+                        track_fields=["group_id"],
+                        resolve=cls._resolve_device_group_index_keys,
+                    ),
+                    CacheDependency(
+                        source=cls,
+                        signal="post_save",
+                        on_create=True,
+                        resolve=cls._resolve_config_group_index_keys,
+                    ),
+                ],
+            ),
+            # Configs of the devices of an organization.
+            CacheDependencyIndex(
+                name="organization -> configs",
+                model=cls,
+                key_field="device__organization_id",
+                invalidated_by=[
+                    CacheDependency(
+                        source="config.Device",
+                        signal="post_save",
+                        track_fields=["organization_id"],
+                        resolve=cls._resolve_device_org_index_keys,
+                    ),
+                    CacheDependency(
+                        source=cls,
+                        signal="post_save",
+                        on_create=True,
+                        resolve=cls._resolve_config_org_index_keys,
+                    ),
+                ],
+            ),
+        ]
+
+    @classmethod
+    def _resolve_template_index_keys(cls, instance, action, reverse, pk_set, **kwargs):
+        """Returns the templates whose configs are changed by ``m2m_changed``."""
+        if action not in ["post_add", "post_remove", "pre_clear"]:
+            return []
+        if reverse:
+            # the configs of a template have changed
+            return [instance.pk]
+        if action == "pre_clear":
+            return list(instance.templates.values_list("pk", flat=True))
+        return list(pk_set or [])
+
+    @staticmethod
+    def _get_changed_index_keys(instance, field, old_values):
+        old_value = (old_values or {}).get(field)
+        if old_value is models.DEFERRED:
+            old_value = None
+        return [old_value, getattr(instance, field)]
+
+    @classmethod
+    def _resolve_device_group_index_keys(cls, device, old_values=None, **kwargs):
+        return cls._get_changed_index_keys(device, "group_id", old_values)
+
+    @classmethod
+    def _resolve_device_org_index_keys(cls, device, old_values=None, **kwargs):
+        return cls._get_changed_index_keys(device, "organization_id", old_values)
+
+    @classmethod
+    def _resolve_config_group_index_keys(cls, config, created=False, **kwargs):
+        return [config.device.group_id] if created else []
+
+    @classmethod
+    def _resolve_config_org_index_keys(cls, config, created=False, **kwargs):
+        return [config.device.organization_id] if created else []
+
+    @classmethod
+    def invalidate_dependency_indexes(
+        cls, template_ids=None, group_ids=None, organization_ids=None
+    ):
+        """
+        Discards the entries of the dependency indexes changed by
+        bulk operations which do not emit the related signals
+        """
+        for name, keys in [
+            ("template -> configs", template_ids),
+            ("device group -> configs", group_ids),
+            ("organization -> configs", organization_ids),
+        ]:
+            if keys:
+                CacheDependencyIndex.get_registered_index(name).invalidate(set(keys))
+
+    @classmethod
+    def _get_dependents_queryset(cls, query_params):
+        """
+        Returns the configs matching ``query_params``; the filters on a
+        field which is the key of a dependency index (eg: ``device__group_id``)
+        are resolved through the index.
+        """
+        if len(query_params) == 1:
+            ((field, key),) = query_params.items()
+            for index in CacheDependencyIndex.get_registered_indexes():
+                if index.model is cls and index.key_field == field:
+                    return cls.objects.filter(pk__in=index.lookup(key))
+        return cls.objects.filter(**query_params)
+
+    @classmethod
+    def _filter_by_variables(cls, queryset, variables):
+        """
+        Narrows down ``queryset`` to the configs which reference at least
+        one of ``variables``, either in one of their templates
+        or in their own configuration.
+        """
+        variables = set(variables)
+        Template = cls.get_template_model()
+        through = cls.templates.through
+        template_ids = [
+            template.pk
+            for template in Template.objects.only("id").filter(
+                pk__in=through.objects.filter(config__in=queryset).values("template_id")
+            )
+            if template.get_cached_variables() & variables
+        ]
+        config_ids = set(
+            queryset.filter(templates__in=template_ids).values_list("pk", flat=True)
+        )
+        # the own configuration of most configs is not using any variable,
+        # hence only the few which contain a placeholder are parsed
+        for config in queryset.filter(config__icontains="{{").only("id", "config"):
+            if config.get_variables() & variables:
+                config_ids.add(config.pk)
+        return cls.objects.filter(pk__in=config_ids)
+
+    @classmethod
+    def bulk_invalidate_get_cached_checksum(cls, query_params, variables=None):
         """
         Bulk invalidates cached configuration checksums for matching instances
 
         Sets status to modified if the configuration of the instance has changed.
+        If ``variables`` is passed, only the instances which reference at least
+        one of these configuration variables are processed.
         """
-        for instance in cls.objects.only("id").filter(**query_params).iterator():
+        queryset = cls._get_dependents_queryset(query_params)
+        if variables is not None:
+            queryset = cls._filter_by_variables(queryset, variables)
+        for instance in queryset.only("id").iterator():
             has_changed = instance.update_status_if_checksum_changed()
             if has_changed:
                 instance.invalidate_checksum_cache()
@@ -1093,6 +1295,177 @@ class AbstractConfig(CacheInvalidationMixin, ChecksumCacheMixin, BaseConfig):
         self.templates.remove(*removed_templates)
         self.templates.add(*templates)
 
+    @classmethod
+    def bulk_manage_group_templates(
+        cls,
+        config_ids,
+        templates,
+        old_templates,
+        created_config_ids=None,
+        raise_errors=False,
+    ):
+        """
+        Set based counterpart of ``manage_group_templates``.
+
+        Computes the templates to remove (``old_templates`` which are not
+        in ``templates``) and to add for all the configs in ``config_ids``
+        and applies the difference with a few queries per chunk of configs,
+        instead of triggering the m2m_changed receivers for each config.
+        The templates to add are validated with ``clean_templates``, the
+        configs for which the validation fails are left unchanged.
+
+        Args:
+            config_ids (iterable): primary keys of the configs to update
+            templates (Queryset): Queryset of templates to add
+            old_templates (Queryset): Queryset of old templates to remove
+            created_config_ids (iterable, optional): primary keys of the
+                configs which have just been created, ``config_modified``
+                is not sent for them (like ``templates_changed`` does)
+            raise_errors (bool, optional): if ``True``, the first error
+                is raised instead of leaving the failing config unchanged,
+                which allows the caller to roll back its transaction
+        """
+        created_config_ids = {str(pk) for pk in created_config_ids or []}
+        configs_by_backend = defaultdict(list)
+        for config_id, backend in (
+            cls.objects.filter(pk__in=config_ids)
+            .order_by("pk")
+            .values_list("pk", "backend")
+        ):
+            configs_by_backend[backend].append(config_id)
+        chunk_size = cls._group_templates_chunk_size
+        for backend, backend_config_ids in configs_by_backend.items():
+            backend_templates = list(templates.filter(backend=backend))
+            removed_template_ids = set(
+                old_templates.filter(backend=backend, required=False)
+                .exclude(pk__in=[template.pk for template in backend_templates])
+                .values_list("pk", flat=True)
+            )
+            for start in range(0, len(backend_config_ids), chunk_size):
+                end = start + chunk_size
+                cls._bulk_manage_group_templates_chunk(
+                    backend_config_ids[start:end],
+                    backend_templates,
+                    removed_template_ids,
+                    created_config_ids,
+                    raise_errors,
+                )
+
+    @classmethod
+    def _bulk_manage_group_templates_chunk(
+        cls,
+        config_ids,
+        templates,
+        removed_template_ids,
+        created_config_ids=(),
+        raise_errors=False,
+    ):
+        through = cls.templates.through
+        sort_field = through._sort_field_name
+        # use atomic to ensure any code bound to
+        # be executed via transaction.on_commit
+        # is executed after the whole block
+        with transaction.atomic():
+            current_rows = defaultdict(list)
+            for config_id, template_id, sort_value in (
+                through.objects.filter(config_id__in=config_ids)
+                .order_by(sort_field)
+                .values_list("config_id", "template_id", sort_field)
+            ):
+                current_rows[config_id].append((template_id, sort_value))
+            new_rows = []
+            valid_config_ids = []
+            for config in cls.objects.filter(pk__in=config_ids).select_related(
+                "device__organization"
+            ):
+                rows = current_rows[config.pk]
+                assigned_ids = {template_id for template_id, _ in rows}
+                added_ids = [
+                    template.pk
+                    for template in templates
+                    if template.pk not in assigned_ids
+                ]
+                # the rows are inserted in bulk, hence the validation
+                # performed by the m2m_changed receivers is executed here
+                if added_ids:
+                    try:
+                        cls.clean_templates("pre_add", config, set(added_ids))
+                    except ValidationError as e:
+                        if raise_errors:
+                            raise
+                        logger.warning(
+                            f"The templates of config {config.pk} "
+                            f"cannot be changed: {e}"
+                        )
+                        continue
+                valid_config_ids.append(config.pk)
+                # new templates are appended after the ones already
+                # assigned, which is what sortedm2m would do
+                sort_value = max((value for _, value in rows), default=0)
+                for template_id in added_ids:
+                    sort_value += 1
+                    new_rows.append(
+                        through(
+                            config_id=config.pk,
+                            template_id=template_id,
+                            **{sort_field: sort_value},
+                        )
+                    )
+            if removed_template_ids:
+                through.objects.filter(
+                    config_id__in=valid_config_ids,
+                    template_id__in=removed_template_ids,
+                ).delete()
+            through.objects.bulk_create(new_rows, ignore_conflicts=True)
+            cls.invalidate_dependency_indexes(
+                template_ids=set(removed_template_ids)
+                | {row.template_id for row in new_rows}
+            )
+            modified_configs = []
+            for config in (
+                cls.objects.filter(pk__in=valid_config_ids)
+                .prefetch_related("vpnclient_set", "templates")
+                .select_related("device", "device__organization__config_settings")
+            ):
+                try:
+                    # a savepoint allows to roll back only the
+                    # changes related to the config which failed
+                    with transaction.atomic():
+                        if removed_template_ids:
+                            config.vpnclient_set.filter(
+                                template_id__in=removed_template_ids
+                            ).delete()
+                        for template in templates:
+                            template._provision_vpn_client(config)
+                        if config.update_status_if_checksum_changed(
+                            send_config_modified_signal=False
+                        ):
+                            modified_configs.append(config)
+                except Exception as e:
+                    if raise_errors:
+                        raise
+                    # restore the templates the config had before
+                    logger.exception(
+                        f"Failed to change the templates of config {config.pk}: {e}"
+                    )
+                    through.objects.filter(config_id=config.pk).delete()
+                    through.objects.bulk_create(
+                        [
+                            through(
+                                config_id=config.pk,
+                                template_id=template_id,
+                                **{sort_field: sort_value},
+                            )
+                            for template_id, sort_value in current_rows[config.pk]
+                        ]
+                    )
+            # config_modified is sent once the whole chunk has been processed,
+            # except for the configs which have just been created
+            for config in modified_configs:
+                if str(config.pk) in created_config_ids:
+                    continue
+                config._send_config_modified_signal(action="m2m_templates_changed")
+
     @classmethod
     def manage_backend_changed(cls, instance_id, old_backend, backend, **kwargs):
         """
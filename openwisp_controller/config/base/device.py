@@ -1,10 +1,17 @@
+import logging
+from collections import defaultdict
 from functools import cached_property
 from hashlib import md5
 
+from django.contrib.admin.models import DELETION, LogEntry
+from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ObjectDoesNotExist, PermissionDenied, ValidationError
 from django.db import models, transaction
 from django.db.models import Q
+from django.db.models.signals import post_save
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from netjsonconfig.exceptions import ValidationError as SchemaError
 from swapper import get_model_name, load_model
 
 from openwisp_users.mixins import OrgMixin
@@ -22,6 +29,8 @@ from ..validators import device_name_validator, mac_address_validator
 from ..whois.service import WHOISService
 from .base import BaseModel
 
+logger = logging.getLogger(__name__)
+
 
 class AbstractDevice(OrgMixin, BaseModel):
     """
@@ -496,39 +505,377 @@ class AbstractDevice(OrgMixin, BaseModel):
         )
         config.save()
 
+    @classmethod
+    def bulk_change_group(cls, device_ids, group_id):
+        """
+        Changes the group of the devices in ``device_ids``
+        (deactivated devices are skipped), applies the templates
+        of the new group to their configurations and emits a single
+        ``device_group_changed`` signal for all of them.
+        Returns the number of devices which have been changed.
+        """
+        group_id = str(group_id) if group_id else None
+        devices = cls.objects.filter(pk__in=device_ids, _is_deactivated=False)
+        with transaction.atomic():
+            old_group_ids = {
+                str(device_id): str(old_group_id) if old_group_id else None
+                for device_id, old_group_id in devices.select_for_update()
+                .values_list("pk", "group_id")
+                .iterator()
+            }
+            if not old_group_ids:
+                return 0
+            devices.update(group_id=group_id)
+            Config = load_model("config", "Config")
+            Config.invalidate_dependency_indexes(
+                group_ids=set(old_group_ids.values()) | {group_id}
+            )
+            # the group templates are managed in the same transaction, so
+            # that a chunk of a DeviceBulkJob is reported as processed only
+            # once the configurations of its devices have been changed
+            cls.manage_devices_group_templates(
+                device_ids=list(old_group_ids.keys()),
+                old_group_ids=list(old_group_ids.values()),
+                group_id=group_id,
+            )
+            cls._send_device_group_changed_signal(
+                instance=list(old_group_ids.keys()),
+                group_id=group_id,
+                old_group_id=list(old_group_ids.values()),
+            )
+        return len(old_group_ids)
+
+    @classmethod
+    def bulk_complete_import(cls, device_ids):
+        """
+        Completes the import of devices created with ``bulk_create``
+        by ``DeviceBulkImport``: provisions the VPN clients of their
+        configurations, stores the configuration checksums and sends
+        the ``post_save`` signals skipped by ``bulk_create``.
+        Returns the number of devices processed.
+        """
+        Config = load_model("config", "Config")
+        configs = {
+            config.device_id: config
+            for config in Config.objects.filter(device_id__in=device_ids)
+            .select_related("device__organization__config_settings", "device__group")
+            .prefetch_related("templates", "vpnclient_set")
+        }
+        devices = cls.objects.filter(pk__in=device_ids).exclude(pk__in=configs.keys())
+        processed = 0
+        for device in [config.device for config in configs.values()] + list(devices):
+            config = configs.get(device.pk)
+            try:
+                # a savepoint allows to roll back only
+                # the changes related to the failing device
+                with transaction.atomic():
+                    if config:
+                        for template in config.templates.all():
+                            template._provision_vpn_client(config)
+                        config.update_status_if_checksum_changed(
+                            send_config_modified_signal=False
+                        )
+                    post_save.send(
+                        sender=cls,
+                        instance=device,
+                        created=True,
+                        update_fields=None,
+                        raw=False,
+                        using=device._state.db,
+                    )
+                    if config:
+                        post_save.send(
+                            sender=Config,
+                            instance=config,
+                            created=True,
+                            update_fields=None,
+                            raw=False,
+                            using=config._state.db,
+                        )
+            except Exception as e:
+                logger.exception(f"Failed to complete the import of {device}: {e}")
+            else:
+                processed += 1
+        return processed
+
+    @classmethod
+    def bulk_apply_changes(
+        cls,
+        device_ids,
+        fields=None,
+        context=None,
+        add_templates=None,
+        remove_templates=None,
+    ):
+        """
+        Applies the same change set to the devices in ``device_ids``
+        (deactivated devices are skipped):
+
+        - ``fields``: values of the device fields to update
+        - ``context``: merged into the configuration variables of the
+          devices, keys having ``None`` as value are removed
+        - ``add_templates`` / ``remove_templates``: primary keys of the
+          templates to assign to / unassign from the configurations
+
+        The change set is validated once, since it is the same for every
+        device: the field values with the validators of the model fields
+        and the templates to add once for each organization of the devices.
+        The fields are changed with a single query, then ``post_save`` is
+        sent for each device (``pre_save`` is not sent, hence the cache
+        dependencies which track the changes of the fields are not
+        triggered: the checksums are updated below). The configuration
+        variables are validated by the rendering which updates the
+        checksums in ``bulk_manage_group_templates``, which also changes
+        the templates and sends a single ``config_modified`` signal for
+        each modified configuration. The changes are applied in a single
+        transaction: if any device fails, ``ValidationError`` is raised
+        and nothing is changed.
+        Returns the number of devices which have been changed.
+        """
+        Config = load_model("config", "Config")
+        Template = load_model("config", "Template")
+        fields = cls._clean_bulk_fields(fields or {})
+        with transaction.atomic():
+            device_ids = list(
+                cls.objects.filter(pk__in=device_ids, _is_deactivated=False)
+                .select_for_update()
+                .values_list("pk", flat=True)
+            )
+            if not device_ids:
+                return 0
+            if add_templates:
+                cls._clean_bulk_templates(device_ids, add_templates)
+            if fields:
+                devices = cls.objects.filter(pk__in=device_ids)
+                devices.update(modified=timezone.now(), **fields)
+                update_fields = frozenset([*fields, "modified"])
+                for device in devices:
+                    post_save.send(
+                        sender=cls,
+                        instance=device,
+                        created=False,
+                        update_fields=update_fields,
+                        raw=False,
+                        using=device._state.db,
+                    )
+            configs = Config.objects.filter(device_id__in=device_ids)
+            if context:
+                changed_configs = list(configs.only("pk", "context", "status"))
+                for config in changed_configs:
+                    config.context = {
+                        key: value
+                        for key, value in {**config.context, **context}.items()
+                        if value is not None
+                    }
+                Config.objects.bulk_update(
+                    changed_configs, ["context"], batch_size=1000
+                )
+            # the operating system can change the output of the backend (DSA)
+            if context or add_templates or remove_templates or "os" in fields:
+                try:
+                    Config.bulk_manage_group_templates(
+                        configs.values_list("pk", flat=True),
+                        Template.objects.filter(pk__in=add_templates or []),
+                        Template.objects.filter(pk__in=remove_templates or []),
+                        raise_errors=True,
+                    )
+                except SchemaError as e:
+                    raise Config._get_schema_validation_error(e)
+        return len(device_ids)
+
+    @classmethod
+    def _clean_bulk_fields(cls, fields):
+        """
+        Validates the values of the fields changed by
+        ``bulk_apply_changes``, returns the cleaned values
+        """
+        cleaned_fields = {}
+        errors = {}
+        for name, value in fields.items():
+            try:
+                cleaned_fields[name] = cls._meta.get_field(name).clean(value, None)
+            except ValidationError as e:
+                errors[name] = e.error_list
+        if errors:
+            raise ValidationError(errors)
+        return cleaned_fields
+
+    @classmethod
+    def _clean_bulk_templates(cls, device_ids, template_ids):
+        """
+        Ensures the templates in ``template_ids`` are shared or
+        belong to the organization of each device in ``device_ids``
+        """
+        Template = load_model("config", "Template")
+        templates = Template.objects.filter(pk__in=template_ids).exclude(
+            organization=None
+        )
+        for organization_id in (
+            cls.objects.filter(pk__in=device_ids)
+            .order_by()
+            .values_list("organization_id", flat=True)
+            .distinct()
+        ):
+            names = ", ".join(
+                templates.exclude(organization_id=organization_id).values_list(
+                    "name", flat=True
+                )
+            )
+            if names:
+                raise ValidationError(
+                    _(
+                        "The following templates are owned by organizations "
+                        "which do not match the organization of "
+                        "the devices: {0}"
+                    ).format(names)
+                )
+
+    @classmethod
+    def _iter_bulk_call(cls, device_ids, method, **kwargs):
+        """
+        Calls ``method`` (with ``kwargs``) on each device in
+        ``device_ids``, each device in its own transaction.
+        Yields the primary key of each device (read before the call,
+        since ``delete`` clears it) along with the device and the error
+        message (``None`` if the call succeeded).
+        """
+        for device in cls.objects.filter(pk__in=device_ids).select_related("config"):
+            device_id = str(device.pk)
+            try:
+                with transaction.atomic():
+                    getattr(device, method)(**kwargs)
+            except Exception as e:
+                logger.exception(f"Failed to {method} {device}: {e}")
+                yield device_id, device, str(e)
+            else:
+                yield device_id, device, None
+
+    @classmethod
+    def _bulk_call(cls, device_ids, method, **kwargs):
+        """
+        Calls ``method`` (with ``kwargs``) on each device in
+        ``device_ids``, each device in its own transaction.
+        Returns a dict which maps the primary key of each
+        device which failed to the error message.
+        """
+        return {
+            device_id: error
+            for device_id, device, error in cls._iter_bulk_call(
+                device_ids, method, **kwargs
+            )
+            if error is not None
+        }
+
+    @classmethod
+    def bulk_activate(cls, device_ids):
+        """
+        Activates the devices in ``device_ids``, returns a dict which
+        maps the primary key of each device which failed to the error
+        """
+        return cls._bulk_call(device_ids, "activate")
+
+    @classmethod
+    def bulk_deactivate(cls, device_ids):
+        """
+        Deactivates the devices in ``device_ids``, returns a dict which
+        maps the primary key of each device which failed to the error
+        """
+        return cls._bulk_call(device_ids, "deactivate")
+
+    @classmethod
+    def bulk_delete(cls, device_ids, force=False, user_id=None):
+        """
+        Deletes the devices in ``device_ids`` (devices which are not
+        deactivated are deleted only if ``force`` is ``True``), returns
+        a dict which maps the primary key of each device which failed
+        to the error. If ``user_id`` is passed, the deletion of the
+        devices which have been deleted is recorded in the admin log.
+        """
+        errors = {}
+        deleted_devices = {}
+        for device_id, device, error in cls._iter_bulk_call(
+            device_ids, "delete", check_deactivated=not force
+        ):
+            if error is None:
+                deleted_devices[device_id] = device
+            else:
+                errors[device_id] = error
+        if user_id and deleted_devices:
+            cls._log_bulk_deletions(deleted_devices, user_id)
+        return errors
+
+    @classmethod
+    def _log_bulk_deletions(cls, devices, user_id):
+        """
+        Records the deletion of ``devices`` (a dict which maps the primary
+        key of each deleted device to the device) in the admin log, like
+        the ``delete_selected`` admin action does
+        """
+        content_type = ContentType.objects.get_for_model(cls)
+        LogEntry.objects.bulk_create(
+            [
+                LogEntry(
+                    user_id=user_id,
+                    content_type_id=content_type.pk,
+                    object_id=device_id,
+                    object_repr=str(device)[:200],
+                    action_flag=DELETION,
+                )
+                for device_id, device in devices.items()
+            ]
+        )
+
     @classmethod
     def manage_devices_group_templates(cls, device_ids, old_group_ids, group_id):
         """
         This method is used to manage group templates for devices.
         """
+        Config = load_model("config", "Config")
         Device = load_model("config", "Device")
         DeviceGroup = load_model("config", "DeviceGroup")
         Template = load_model("config", "Template")
         if type(device_ids) is not list:
             device_ids = [device_ids]
             old_group_ids = [old_group_ids]
-        for device_id, old_group_id in zip(device_ids, old_group_ids):
-            device = Device.objects.get(pk=device_id)
-            if device.is_deactivated():
-                # Skip deactivated devices: their configuration is intentionally
-                # emptied during deactivation, so re-applying group templates
-                # would break that state and trigger a push to the device.
-                continue
+        old_group_by_device = {
+            str(device_id): old_group_id
+            for device_id, old_group_id in zip(device_ids, old_group_ids)
+        }
+        # devices are grouped by their old group in order to
+        # update the templates of each group of devices at once
+        config_ids_by_old_group = defaultdict(list)
+        created_config_ids = []
+        # Skip deactivated devices: their configuration is intentionally
+        # emptied during deactivation, so re-applying group templates
+        # would break that state and trigger a push to the device.
+        for device in (
+            Device.objects.filter(pk__in=device_ids, _is_deactivated=False)
+            .select_related("config", "group")
+            .iterator()
+        ):
             if not hasattr(device, "config"):
                 device.create_default_config()
-            config_created = hasattr(device, "config")
-            if not config_created:
-                # device has no config (device group has no templates)
-                return
-            group_templates = Template.objects.none()
-            if group_id:
-                group = DeviceGroup.objects.get(pk=group_id)
-                group_templates = group.templates.all()
+                if not hasattr(device, "config"):
+                    # device has no config (device group has no templates)
+                    continue
+                created_config_ids.append(device.config.pk)
+            old_group_id = old_group_by_device[str(device.pk)]
+            config_ids_by_old_group[old_group_id].append(device.config.pk)
+        group_templates = Template.objects.none()
+        if group_id:
+            group = DeviceGroup.objects.get(pk=group_id)
+            group_templates = group.templates.all()
+        for old_group_id, config_ids in config_ids_by_old_group.items():
             old_group_templates = Template.objects.none()
             if old_group_id:
                 old_group = DeviceGroup.objects.get(pk=old_group_id)
                 old_group_templates = old_group.templates.all()
-            device.config.manage_group_templates(group_templates, old_group_templates)
+            Config.bulk_manage_group_templates(
+                config_ids,
+                group_templates,
+                old_group_templates,
+                created_config_ids=created_config_ids,
+            )
 
     @classmethod
     def config_deactivated_clear_management_ip(cls, instance, *args, **kwargs):
@@ -17,6 +17,22 @@ from ..signals import group_templates_changed
 from ..sortedm2m.fields import SortedManyToManyField
 from .config import TemplatesThrough
 
+_meta_data_validators = {}
+
+
+def get_meta_data_validator(schema):
+    """
+    Returns the validator of the device group meta data,
+    which is compiled only once per schema
+    """
+    validator = _meta_data_validators.get(id(schema))
+    # the identity check protects against ids reused by other objects
+    if validator is None or validator.schema is not schema:
+        validator = jsonschema.Draft4Validator(schema)
+        _meta_data_validators.clear()
+        _meta_data_validators[id(schema)] = validator
+    return validator
+
 
 class AbstractDeviceGroup(OrgMixin, TimeStampedEditableModel):
     name = models.CharField(max_length=60, null=False, blank=False)
@@ -67,7 +83,7 @@ class AbstractDeviceGroup(OrgMixin, TimeStampedEditableModel):
 
     def clean(self):
         try:
-            jsonschema.Draft4Validator(app_settings.DEVICE_GROUP_SCHEMA).validate(
+            get_meta_data_validator(app_settings.DEVICE_GROUP_SCHEMA).validate(
                 self.meta_data
             )
         except SchemaError as e:
@@ -93,10 +109,19 @@ class AbstractDeviceGroup(OrgMixin, TimeStampedEditableModel):
         """
         DeviceGroup = load_model("config", "DeviceGroup")
         Template = load_model("config", "Template")
+        Config = load_model("config", "Config")
         device_group = DeviceGroup.objects.get(id=group_id)
         templates = Template.objects.filter(pk__in=template_ids)
         old_templates = Template.objects.filter(pk__in=old_template_ids)
-        for device in device_group.device_set.exclude(_is_deactivated=True).iterator():
-            if not hasattr(device, "config"):
-                device.create_default_config()
-            device.config.manage_group_templates(templates, old_templates)
+        devices = device_group.device_set.exclude(_is_deactivated=True)
+        created_config_ids = []
+        for device in devices.filter(config__isnull=True).iterator():
+            device.create_default_config()
+            if hasattr(device, "config"):
+                created_config_ids.append(device.config.pk)
+        Config.bulk_manage_group_templates(
+            Config.objects.filter(device__in=devices).values_list("pk", flat=True),
+            templates,
+            old_templates,
+            created_config_ids=created_config_ids,
+        )
@@ -2,11 +2,18 @@ import json
 import logging
 from collections import OrderedDict
 from copy import copy
+from functools import partial
 
+import reversion
+from cache_memoize import cache_memoize
+from django.contrib.admin.models import ADDITION, LogEntry
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models, transaction
 from django.db.models import JSONField
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from netjsonconfig.exceptions import ValidationError as NetjsonconfigValidationError
 from swapper import get_model_name, load_model
@@ -17,8 +24,9 @@ from ..settings import DEFAULT_AUTO_CERT
 from ..tasks import (
     auto_add_template_to_existing_configs,
     update_template_related_config_status,
+    update_template_related_config_status_chunk,
 )
-from .base import BaseConfig
+from .base import BaseConfig, get_cached_args_rewrite
 
 logger = logging.getLogger(__name__)
 
@@ -113,6 +121,15 @@ class AbstractTemplate(ShareableOrgMixinUniqueName, BaseConfig):
         verbose_name_plural = _("templates")
         unique_together = (("organization", "name"),)
 
+    # amount of configs processed at once when the template
+    # is automatically added to existing configurations
+    _auto_add_chunk_size = 1000
+    # amount of configs processed by each task when the
+    # status of the configs related to the template is updated
+    _related_config_status_chunk_size = 1000
+    _related_config_status_timeout = 86400
+    _VARIABLES_CACHE_TIMEOUT = 60 * 60 * 24 * 30  # 30 days
+
     @classmethod
     def pre_save_handler(cls, instance, *args, **kwargs):
         """
@@ -143,6 +160,8 @@ class AbstractTemplate(ShareableOrgMixinUniqueName, BaseConfig):
 
     @classmethod
     def post_save_handler(cls, instance, created, *args, **kwargs):
+        if not created:
+            instance.invalidate_variables_cache()
         if not created and getattr(
             instance, "_should_update_related_config_status", False
         ):
@@ -157,62 +176,256 @@ class AbstractTemplate(ShareableOrgMixinUniqueName, BaseConfig):
                 lambda: auto_add_template_to_existing_configs.delay(str(instance.pk))
             )
 
+    @cache_memoize(
+        timeout=_VARIABLES_CACHE_TIMEOUT, args_rewrite=get_cached_args_rewrite
+    )
+    def get_cached_variables(self):
+        """
+        Returns the configuration variables referenced by the template,
+        the cache is invalidated when the template is saved
+        """
+        return self.get_variables()
+
+    def invalidate_variables_cache(self):
+        self.get_cached_variables.invalidate(self)
+
     def _update_related_config_status(self):
+        """
+        Splits the configs related to the template in chunks which
+        are processed in independent transactions, possibly by
+        different celery workers, in order to avoid holding a single
+        long transaction when the template is used by many devices
+        """
+        config_ids = self.config_relations.order_by("pk").values_list("pk", flat=True)
+        chunks = []
+        for index, config_id in enumerate(config_ids.iterator()):
+            if index % self._related_config_status_chunk_size == 0:
+                chunks.append([config_id, config_id])
+            chunks[-1][1] = config_id
+        if not chunks:
+            return
+        if len(chunks) == 1:
+            self._update_related_config_status_chunk(*chunks[0])
+            return
+        cache.set(
+            self._related_config_status_cache_key,
+            len(chunks),
+            self._related_config_status_timeout,
+        )
+        logger.info(
+            f"Updating the status of the configurations related to template "
+            f"{self} (ID: {self.pk}) in {len(chunks)} chunks"
+        )
+        for first_config_id, last_config_id in chunks:
+            update_template_related_config_status_chunk.delay(
+                template_pk=str(self.pk),
+                first_config_id=str(first_config_id),
+                last_config_id=str(last_config_id),
+            )
+
+    def _update_related_config_status_chunk(self, first_config_id, last_config_id):
+        """
+        Updates the status of the related configs having a primary key
+        included between ``first_config_id`` and ``last_config_id``;
+        the ``config_modified`` signals are sent at the end of the
+        chunk, once the status of all its configs has been updated.
+
+        The checksum for which each config has been signaled is stored
+        in the cache, this allows to coalesce the signals of configs
+        which are reached again by other tasks (eg: the chunks of other
+        templates changed in the meantime, or retried chunks) after
+        their configuration has already been signaled as modified.
+        """
+        configs = []
         # use atomic to ensure any code bound to
         # be executed via transaction.on_commit
         # is executed after the whole block
         with transaction.atomic():
             for config in (
-                self.config_relations.prefetch_related(
+                self.config_relations.filter(
+                    pk__gte=first_config_id, pk__lte=last_config_id
+                )
+                .prefetch_related(
                     "vpnclient_set",
                     "templates",
                 )
                 .select_related("device", "device__organization__config_settings")
-                .iterator(chunk_size=1000)
+                .iterator(chunk_size=self._related_config_status_chunk_size)
             ):
                 config.update_status_if_checksum_changed(
                     send_config_modified_signal=False
                 )
+                configs.append(config)
+            cache_keys = {
+                config.pk: self._related_config_modified_cache_key(config.pk)
+                for config in configs
+            }
+            signaled = cache.get_many(cache_keys.values())
+            modified = {}
+            for config in configs:
+                cache_key = cache_keys[config.pk]
+                if signaled.get(cache_key) == config.checksum_db:
+                    continue
                 config._send_config_modified_signal(action="related_template_changed")
+                modified[cache_key] = config.checksum_db
+            cache.set_many(modified, timeout=self._related_config_status_timeout)
+        self._related_config_status_chunk_done()
+
+    @property
+    def _related_config_status_cache_key(self):
+        return f"template_related_config_status_{self.pk}"
+
+    @staticmethod
+    def _related_config_modified_cache_key(config_pk):
+        return f"template_related_config_modified_{config_pk}"
+
+    def _related_config_status_chunk_done(self):
+        """
+        Keeps track of the chunks which have been processed
+        and logs when all of them have been completed
+        """
+        try:
+            remaining = cache.decr(self._related_config_status_cache_key)
+        except ValueError:
+            # not split in multiple chunks or expired
+            return
+        if remaining > 0:
+            return
+        cache.delete(self._related_config_status_cache_key)
+        logger.info(
+            f"Finished updating the status of the configurations related "
+            f"to template {self} (ID: {self.pk})"
+        )
 
     def _auto_add_to_existing_configs(self):
         """
         When a template is ``default`` or ``required``, adds the template
         to each relevant ``Config`` object
         """
-        Config = load_model("config", "Config")
-
         # Only proceed if template is default or required
         if not (self.default or self.required):
             return
 
+        configs = self._get_auto_add_configs()
+        config_ids = []
+        for config_id in configs.values_list("pk", flat=True).iterator():
+            config_ids.append(config_id)
+            if len(config_ids) == self._auto_add_chunk_size:
+                self._add_to_configs(config_ids)
+                config_ids = []
+        if config_ids:
+            self._add_to_configs(config_ids)
+
+    def _get_auto_add_configs(self):
+        """
+        Returns the configs to which the template can be added, the
+        organization, backend and VPN server checks performed by
+        ``Config.clean_templates`` are applied to the whole queryset
+        """
+        Config = load_model("config", "Config")
+        # Exclude deactivating or deactivated configs
+        configs = Config.objects.filter(backend=self.backend).exclude(
+            models.Q(status__in=["deactivating", "deactivated"])
+            | models.Q(templates__id=self.pk)
+        )
+        if self.organization_id:
+            configs = configs.filter(device__organization_id=self.organization_id)
+        if self.type == "vpn":
+            # multiple VPN client templates related to
+            # the same VPN server are not allowed
+            configs = configs.exclude(templates__vpn_id=self.vpn_id)
+        return configs
+
+    def _add_to_configs(self, config_ids):
+        """
+        Adds the template to the configs in ``config_ids`` with a
+        single insert in the m2m table (appending it after the templates
+        already assigned to each config, as sortedm2m would do),
+        then provisions the VPN clients and updates the checksum and
+        status of each config (which are normally handled by the
+        m2m_changed receivers of ``Config``)
+        """
+        Config = load_model("config", "Config")
+        through = Config.templates.through
+        sort_field = through._sort_field_name
         # use atomic to ensure any code bound to
         # be executed via transaction.on_commit
         # is executed after the whole block
         with transaction.atomic():
-            # Exclude deactivating or deactivated configs
+            # the configs may have changed since they have been selected
+            config_ids = list(
+                self._get_auto_add_configs()
+                .filter(pk__in=config_ids)
+                .values_list("pk", flat=True)
+            )
+            sort_values = dict(
+                through.objects.filter(config_id__in=config_ids)
+                .values_list("config_id")
+                .annotate(models.Max(sort_field))
+            )
+            through.objects.bulk_create(
+                [
+                    through(
+                        config_id=config_id,
+                        template_id=self.pk,
+                        **{sort_field: (sort_values.get(config_id) or 0) + 1},
+                    )
+                    for config_id in config_ids
+                ],
+                ignore_conflicts=True,
+            )
+            Config.invalidate_dependency_indexes(template_ids=[self.pk])
             configs = (
-                Config.objects.select_related("device")
-                .filter(
-                    backend=self.backend,
-                )
-                .exclude(
-                    models.Q(status__in=["deactivating", "deactivated"])
-                    | models.Q(templates__id=self.pk)
-                )
+                Config.objects.filter(pk__in=config_ids)
+                .prefetch_related("vpnclient_set", "templates")
+                .select_related("device", "device__organization__config_settings")
             )
-            if self.organization_id:
-                configs = configs.filter(device__organization_id=self.organization_id)
-            for config in configs.iterator():
+            for config in configs.iterator(chunk_size=self._auto_add_chunk_size):
                 try:
-                    config.templates.add(self)
+                    # a savepoint allows to roll back only the
+                    # changes related to the config which failed
+                    with transaction.atomic():
+                        # validates the configuration resulting from
+                        # the template, like Config.clean_templates
+                        Config.clean_netjsonconfig_backend(
+                            config.get_backend_instance(template_instances=[self])
+                        )
+                        self._provision_vpn_client(config)
+                        config._config_modified_action = "m2m_templates_changed"
+                        config.update_status_if_checksum_changed()
                 except Exception as e:
                     # Log error but continue with other configs
+                    through.objects.filter(
+                        config_id=config.pk, template_id=self.pk
+                    ).delete()
                     logger.exception(
                         f"Failed to add template {self.pk} to "
                         f"config {config.pk}: {e}"
                     )
 
+    def _provision_vpn_client(self, config):
+        """
+        Creates the VPN client of the config if the
+        template is a VPN client template (mirrors
+        ``Config.manage_vpn_clients``)
+        """
+        if self.type != "vpn":
+            return
+        VpnClient = load_model("config", "VpnClient")
+        for client in config.vpnclient_set.all():
+            if client.template_id == self.pk:
+                return
+        client = VpnClient(
+            config=config,
+            vpn=self.vpn,
+            template=self,
+            auto_cert=self.auto_cert,
+        )
+        client.full_clean()
+        client.save()
+        # the VPN context of the config has changed
+        config._prefetched_objects_cache.pop("vpnclient_set", None)
+
     def clean(self, *args, **kwargs):
         """
         * validates org relationship of VPN if present
@@ -277,6 +490,139 @@ class AbstractTemplate(ShareableOrgMixinUniqueName, BaseConfig):
         clone.save()
         return clone
 
+    @classmethod
+    def bulk_clone(cls, templates, organization=None, user=None):
+        """
+        Clones ``templates`` (including their tags) into ``organization``
+        (``None`` means shared) using bulk inserts and a single revision,
+        returns the list of clones.
+
+        The name of each template is kept if it's available, otherwise
+        the same naming scheme of ``clone()`` is used. VPN client templates
+        keep their VPN if it's shared or if it belongs to ``organization``,
+        otherwise the VPN of ``organization`` with the same name is used
+        and the configuration of the clone is generated from it.
+
+        Raises ``ValidationError`` if any of the templates cannot be
+        cloned, in which case nothing is saved.
+        """
+        Vpn = load_model("config", "Vpn")
+        TaggedTemplate = load_model("config", "TaggedTemplate")
+        organization_id = organization.pk if organization else None
+        templates = list(
+            cls.objects.filter(pk__in=[template.pk for template in templates])
+            .select_related("vpn")
+            .prefetch_related("tags")
+            .order_by("name")
+        )
+        # shared names must be unique across all the organizations
+        if organization_id:
+            names = cls.objects.filter(
+                models.Q(organization=None) | models.Q(organization=organization_id)
+            )
+        else:
+            names = cls.objects.all()
+        taken_names = set(names.values_list("name", flat=True))
+        target_vpns = {}
+        if organization_id:
+            target_vpns = {
+                vpn.name: vpn
+                for vpn in Vpn.objects.filter(organization=organization_id)
+            }
+        now = timezone.now()
+        max_length = cls._meta.get_field("name").max_length
+        clones = []
+        for template in templates:
+            clone = copy(template)
+            clone._state = models.base.ModelState()
+            clone.__dict__.pop("_prefetched_objects_cache", None)
+            clone.pk = cls._meta.pk.get_default()
+            clone.created = clone.modified = now
+            clone.organization_id = organization_id
+            clone.name = cls._get_bulk_clone_name(template.name, taken_names)
+            if len(clone.name) > max_length:
+                raise ValidationError(
+                    _('The name of the clone of "{name}" is too long.').format(
+                        name=template.name
+                    )
+                )
+            taken_names.add(clone.name)
+            # same behavior of ``clone()``
+            clone.default = clone.required
+            if clone.vpn and clone.vpn.organization_id not in [None, organization_id]:
+                clone.vpn = target_vpns.get(clone.vpn.name)
+                if clone.vpn is None:
+                    raise ValidationError(
+                        _(
+                            'The VPN of "{name}" is not available '
+                            "in the destination organization."
+                        ).format(name=template.name)
+                    )
+                # the configuration refers to the context
+                # variables of the VPN, which contain its pk
+                clone.config = clone.vpn.auto_client(
+                    auto_cert=clone.auto_cert,
+                    template_backend_class=clone.backend_class,
+                )
+            clone.full_clean()
+            clones.append(clone)
+        content_type = ContentType.objects.get_for_model(cls)
+        with transaction.atomic():
+            cls.objects.bulk_create(clones)
+            TaggedTemplate.objects.bulk_create(
+                [
+                    TaggedTemplate(
+                        tag=tag, content_type=content_type, object_id=clone.pk
+                    )
+                    for template, clone in zip(templates, clones)
+                    for tag in template.tags.all()
+                ]
+            )
+            if user:
+                LogEntry.objects.bulk_create(
+                    [
+                        LogEntry(
+                            user_id=user.pk,
+                            content_type_id=content_type.pk,
+                            object_id=str(clone.pk),
+                            object_repr=str(clone)[:200],
+                            action_flag=ADDITION,
+                        )
+                        for clone in clones
+                    ]
+                )
+            if reversion.is_registered(cls):
+                with reversion.create_revision():
+                    if user:
+                        reversion.set_user(user)
+                    reversion.set_comment(
+                        _("Cloned {count} templates.").format(count=len(clones))
+                    )
+                    for clone in clones:
+                        reversion.add_to_revision(clone)
+            # ``post_save`` is not sent by ``bulk_create``:
+            # add default and required clones to existing configs
+            for clone in clones:
+                if clone.default or clone.required:
+                    transaction.on_commit(
+                        partial(
+                            auto_add_template_to_existing_configs.delay,
+                            str(clone.pk),
+                        )
+                    )
+        return clones
+
+    @classmethod
+    def _get_bulk_clone_name(cls, name, taken_names):
+        if name not in taken_names:
+            return name
+        clone_name = "{} (Clone)".format(name)
+        index = 2
+        while clone_name in taken_names:
+            clone_name = "{} (Clone {})".format(name, index)
+            index += 1
+        return clone_name
+
     def __get_clone_name(self):
         name = "{} (Clone)".format(self.name)
         index = 2
@@ -16,7 +16,7 @@ from django.utils.functional import cached_property
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 from django_x509.signals import x509_renewed
-from swapper import get_model_name
+from swapper import get_model_name, load_model
 
 from openwisp_utils.base import KeyField
 
@@ -35,7 +35,12 @@ from ..tasks_zerotier import (
     trigger_zerotier_server_update_member,
 )
 from .base import BaseConfig, ConfigChecksumCacheMixin
-from .cache import CacheDependency, CacheInvalidationMixin, _resolve_pk_snapshot
+from .cache import (
+    CacheDependency,
+    CacheDependencyIndex,
+    CacheInvalidationMixin,
+    _resolve_pk_snapshot,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -405,6 +410,30 @@ class AbstractVpn(
             ),
         ]
 
+    @classmethod
+    def get_dependency_indexes(cls):
+        return [
+            # Configs of the VPN clients of a VPN server.
+            CacheDependencyIndex(
+                name="vpn -> clients",
+                model="config.VpnClient",
+                key_field="vpn_id",
+                value_field="config_id",
+                invalidated_by=[
+                    CacheDependency(
+                        source="config.VpnClient",
+                        signal="post_save",
+                        on_create=True,
+                        resolve=cls._resolve_vpn_client_index_keys,
+                    ),
+                ],
+            ),
+        ]
+
+    @classmethod
+    def _resolve_vpn_client_index_keys(cls, vpn_client, created=False, **kwargs):
+        return [vpn_client.vpn_id] if created else []
+
     @classmethod
     def dhparam(cls, length):
         """
@@ -1154,10 +1183,13 @@ class AbstractVpnClient(models.Model):
         ``config_modified`` is only emitted when the checksum actually
         changed, not unconditionally for every client of the VPN server.
         """
-        for client in vpn.vpnclient_set.select_related(
-            "config", "config__device", "config__device__group"
-        ).iterator():
-            config = client.config
+        Config = load_model("config", "Config")
+        index = CacheDependencyIndex.get_registered_index("vpn -> clients")
+        for config in (
+            Config.objects.filter(pk__in=index.lookup(vpn.pk))
+            .select_related("device", "device__group")
+            .iterator()
+        ):
             # keep the historical signal action for this related change
             config._config_modified_action = "related_template_changed"
             if not config.update_status_if_checksum_changed():
@@ -0,0 +1,432 @@
+import json
+from collections import Counter, defaultdict
+
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import Lower
+from django.utils.translation import gettext as _
+from swapper import load_model
+
+from openwisp_utils.base import KeyField
+
+from . import settings as app_settings
+from .jobs import DeviceBulkJob
+
+
+class DeviceBulkImport:
+    """
+    Imports many devices (and their configuration) at once.
+
+    ``rows`` is a list of dicts using the column names of
+    ``DeviceResource`` (eg: the rows of an export). The whole set of
+    rows is validated before anything is written, using one query per
+    check instead of one query per row; devices, configurations and
+    their templates are then inserted with ``bulk_create``, while the
+    VPN client provisioning, the computation of the configuration
+    checksums and the ``post_save`` signals are deferred to a
+    ``DeviceBulkJob`` executed in chunks by the celery workers.
+    """
+
+    device_fields = [
+        "id",
+        "name",
+        "mac_address",
+        "organization_id",
+        "group_id",
+        "model",
+        "os",
+        "system",
+        "notes",
+        "last_ip",
+        "management_ip",
+        "key",
+    ]
+    if app_settings.HARDWARE_ID_ENABLED:
+        device_fields.insert(2, "hardware_id")
+    config_fields = [
+        "config_backend",
+        "config_data",
+        "config_context",
+        "config_templates",
+    ]
+    batch_size = 1000
+
+    def __init__(self, rows, user=None):
+        self.rows = list(rows)
+        self.user = user
+        self.errors = []
+        self.devices = []
+        self.configs = []
+        # maps the index of each config to the list of its templates
+        self.config_templates = {}
+
+    def add_error(self, message, index=None):
+        if index is not None:
+            message = _("Row {row}: {message}").format(row=index + 1, message=message)
+        self.errors.append(message)
+
+    def _add_validation_error(self, error, index):
+        if hasattr(error, "message_dict"):
+            for field, messages in error.message_dict.items():
+                for message in messages:
+                    self.add_error(f"{field}: {message}", index)
+        else:
+            for message in error.messages:
+                self.add_error(message, index)
+
+    def _has_config(self, row):
+        return any(row.get(field) for field in self.config_fields)
+
+    @staticmethod
+    def _load_json(value, default):
+        if value in (None, ""):
+            return default
+        if isinstance(value, str):
+            value = json.loads(value)
+        return value
+
+    @staticmethod
+    def _split(value):
+        if not value:
+            return []
+        if isinstance(value, str):
+            value = value.split(",")
+        return [str(item).strip() for item in value if str(item).strip()]
+
+    def _build_devices(self):
+        Device = load_model("config", "Device")
+        for index, row in enumerate(self.rows):
+            data = {
+                field: row[field]
+                for field in self.device_fields
+                if row.get(field) not in (None, "")
+            }
+            device = Device(**data)
+            device.mac_address = (device.mac_address or "").upper()
+            try:
+                # relations are validated in bulk by ``_validate_relations``
+                device.clean_fields(exclude=["organization", "group", "key"])
+            except ValidationError as e:
+                self._add_validation_error(e, index)
+            self.devices.append(device)
+
+    def _validate_relations(self):
+        Organization = load_model("openwisp_users", "Organization")
+        DeviceGroup = load_model("config", "DeviceGroup")
+        org_ids = {str(d.organization_id) for d in self.devices if d.organization_id}
+        group_ids = {str(d.group_id) for d in self.devices if d.group_id}
+        try:
+            organizations = {
+                str(org.pk): org
+                for org in Organization.objects.filter(pk__in=org_ids).select_related(
+                    "config_settings", "config_limits"
+                )
+            }
+            groups = {
+                str(group.pk): group
+                for group in DeviceGroup.objects.filter(
+                    pk__in=group_ids
+                ).prefetch_related("templates")
+            }
+        except ValidationError as e:
+            # malformed UUIDs
+            self._add_validation_error(e, None)
+            return
+        managed = None
+        if self.user and not self.user.is_superuser:
+            managed = {str(pk) for pk in self.user.organizations_managed}
+        for index, device in enumerate(self.devices):
+            org_id = str(device.organization_id) if device.organization_id else None
+            if not org_id:
+                self.add_error(_("organization_id: This field is required."), index)
+                continue
+            if org_id not in organizations or (
+                managed is not None and org_id not in managed
+            ):
+                self.add_error(_("organization_id: Organization not found."), index)
+                continue
+            device.organization = organizations[org_id]
+            if not device.group_id:
+                continue
+            group = groups.get(str(device.group_id))
+            if not group or group.organization_id != device.organization_id:
+                self.add_error(
+                    _("group_id: The group must belong to the organization."), index
+                )
+                continue
+            device.group = group
+
+    def _find_duplicates(self, keys, field):
+        """
+        Adds an error for each row whose ``keys`` value is repeated in
+        the imported rows, returns the set of the values found
+        """
+        counter = Counter(key for key in keys if key is not None)
+        for index, key in enumerate(keys):
+            if key is not None and counter[key] > 1:
+                self.add_error(
+                    _("{field}: Duplicated value in the imported rows.").format(
+                        field=field
+                    ),
+                    index,
+                )
+        return set(counter)
+
+    def _validate_uniqueness(self):
+        Device = load_model("config", "Device")
+        org_ids = {d.organization_id for d in self.devices}
+        existing = Device.objects.filter(organization_id__in=org_ids)
+        fields = ["mac_address"]
+        if app_settings.HARDWARE_ID_ENABLED:
+            fields.append("hardware_id")
+        for field in fields:
+            keys = [
+                (
+                    (str(d.organization_id), getattr(d, field))
+                    if getattr(d, field)
+                    else None
+                )
+                for d in self.devices
+            ]
+            values = {key[1] for key in self._find_duplicates(keys, field)}
+            taken = set(
+                (str(org_id), value)
+                for org_id, value in existing.filter(
+                    **{f"{field}__in": values}
+                ).values_list("organization_id", field)
+            )
+            self._add_taken_errors(keys, taken, field)
+        if app_settings.DEVICE_NAME_UNIQUE:
+            keys = [
+                (str(d.organization_id), d.name.lower()) if d.name else None
+                for d in self.devices
+            ]
+            names = {key[1] for key in self._find_duplicates(keys, "name")}
+            taken = set(
+                (str(org_id), name)
+                for org_id, name in existing.annotate(lower_name=Lower("name"))
+                .filter(lower_name__in=names)
+                .values_list("organization_id", "lower_name")
+            )
+            self._add_taken_errors(keys, taken, "name")
+        if any(row.get("id") for row in self.rows):
+            keys = [str(d.pk) for d in self.devices]
+            values = self._find_duplicates(keys, "id")
+            taken = {
+                str(pk)
+                for pk in Device.objects.filter(pk__in=values).values_list(
+                    "pk", flat=True
+                )
+            }
+            self._add_taken_errors(keys, taken, "id")
+
+    def _add_taken_errors(self, keys, taken, field):
+        for index, key in enumerate(keys):
+            if key in taken:
+                self.add_error(
+                    _("{field}: A device with this value already exists.").format(
+                        field=field
+                    ),
+                    index,
+                )
+
+    def _validate_device_limits(self):
+        Device = load_model("config", "Device")
+        new_devices = Counter(str(d.organization_id) for d in self.devices)
+        limits = {}
+        for device in self.devices:
+            organization = device.organization
+            device_limit = organization.config_limits.device_limit
+            # "0" means unlimited
+            if device_limit != 0:
+                limits[str(organization.pk)] = (organization, device_limit)
+        if not limits:
+            return
+        counts = {
+            str(org_id): count
+            for org_id, count in Device.objects.filter(organization_id__in=limits)
+            .values_list("organization_id")
+            .annotate(count=Count("pk"))
+            .order_by()
+        }
+        for org_id, (organization, device_limit) in limits.items():
+            if counts.get(org_id, 0) + new_devices[org_id] > (device_limit or 0):
+                self.add_error(
+                    _(
+                        "The maximum amount of allowed devices would be "
+                        "exceeded for organization {org}."
+                    ).format(org=organization.name)
+                )
+
+    def _get_default_templates(self):
+        """
+        Returns the default templates of each (organization, backend)
+        combination used by the imported rows, fetched with one query
+        """
+        Template = load_model("config", "Template")
+        org_ids = {d.organization_id for d in self.devices}
+        default_templates = defaultdict(list)
+        for template in Template.objects.filter(
+            Q(organization_id__in=org_ids) | Q(organization_id=None), default=True
+        ):
+            default_templates[(template.organization_id, template.backend)].append(
+                template
+            )
+        return default_templates
+
+    def _build_configs(self):
+        Config = load_model("config", "Config")
+        Template = load_model("config", "Template")
+        template_ids = set()
+        for row in self.rows:
+            template_ids.update(self._split(row.get("config_templates")))
+        try:
+            templates = {
+                str(template.pk): template
+                for template in Template.objects.filter(pk__in=template_ids)
+            }
+        except ValidationError as e:
+            self._add_validation_error(e, None)
+            return
+        default_templates = self._get_default_templates()
+        for index, (row, device) in enumerate(zip(self.rows, self.devices)):
+            group = device.group if device.group_id else None
+            group_templates = list(group.templates.all()) if group else []
+            if not self._has_config(row) and not group_templates:
+                continue
+            try:
+                config = Config(
+                    device=device,
+                    backend=row.get("config_backend") or app_settings.DEFAULT_BACKEND,
+                    config=self._load_json(row.get("config_data"), {}),
+                    context=self._load_json(row.get("config_context"), {}),
+                )
+            except ValueError:
+                self.add_error(_("config_data or config_context: Invalid JSON."), index)
+                continue
+            # same order used by ``Config.get_default_templates``
+            config_templates = sorted(
+                default_templates[(device.organization_id, config.backend)]
+                + default_templates[(None, config.backend)],
+                key=lambda template: (not template.required, template.name),
+            )
+            for template in group_templates:
+                if template.backend != config.backend:
+                    continue
+                if template not in config_templates:
+                    config_templates.append(template)
+            for template_id in self._split(row.get("config_templates")):
+                template = templates.get(template_id)
+                if (
+                    not template
+                    or template.organization_id not in (None, device.organization_id)
+                    or template.backend != config.backend
+                ):
+                    self.add_error(
+                        _("config_templates: Template {id} not found.").format(
+                            id=template_id
+                        ),
+                        index,
+                    )
+                    continue
+                if template not in config_templates:
+                    config_templates.append(template)
+            try:
+                config.clean_fields(exclude=["device"])
+                # the configuration is validated merged with its templates
+                config.backend_instance = config.get_backend_instance(
+                    template_instances=config_templates
+                )
+                config.clean()
+            except ValidationError as e:
+                self._add_validation_error(e, index)
+                continue
+            self.config_templates[len(self.configs)] = config_templates
+            self.configs.append(config)
+
+    def validate(self):
+        """
+        Validates all the rows, returns ``True`` if no errors were found
+        """
+        if not self.rows:
+            self.add_error(_("No devices to import."))
+            return False
+        # each step relies on the validity of the data checked by the
+        # previous ones, hence the validation stops at the first step
+        # which finds errors (reporting the errors of all the rows)
+        for step in [
+            self._build_devices,
+            self._validate_relations,
+            self._validate_uniqueness,
+            self._validate_device_limits,
+            self._build_configs,
+        ]:
+            step()
+            if self.errors:
+                return False
+        return True
+
+    def _set_keys(self):
+        Device = load_model("config", "Device")
+        for device in self.devices:
+            if device.key:
+                continue
+            try:
+                shared_secret = device.organization.config_settings.shared_secret
+            except ObjectDoesNotExist:
+                device.key = KeyField.default_callable()
+            else:
+                device.key = device.generate_key(shared_secret)
+        keys = [device.key for device in self.devices]
+        self._find_duplicates(keys, "key")
+        taken = set(Device.objects.filter(key__in=keys).values_list("key", flat=True))
+        self._add_taken_errors(keys, taken, "key")
+
+    def save(self):
+        """
+        Validates and imports the devices, raises ``ValidationError``
+        (with the list of the errors) if any row is not valid.
+
+        Returns the ``DeviceBulkJob`` which completes the import.
+        """
+        if not self.validate():
+            raise ValidationError(self.errors)
+        self._set_keys()
+        if self.errors:
+            raise ValidationError(self.errors)
+        Device = load_model("config", "Device")
+        Config = load_model("config", "Config")
+        through = Config.templates.through
+        sort_field = through._sort_field_name
+        with transaction.atomic():
+            Device.objects.bulk_create(self.devices, batch_size=self.batch_size)
+            Config.objects.bulk_create(self.configs, batch_size=self.batch_size)
+            through.objects.bulk_create(
+                [
+                    through(
+                        config_id=config.pk,
+                        template_id=template.pk,
+                        **{sort_field: sort_value},
+                    )
+                    for index, config in enumerate(self.configs)
+                    for sort_value, template in enumerate(
+                        self.config_templates[index], start=1
+                    )
+                ],
+                batch_size=self.batch_size,
+            )
+            Config.invalidate_dependency_indexes(
+                template_ids={
+                    template.pk
+                    for templates in self.config_templates
+                    for template in templates
+                },
+                group_ids={device.group_id for device in self.devices},
+                organization_ids={device.organization_id for device in self.devices},
+            )
+        return DeviceBulkJob.start(
+            "complete_import",
+            [device.pk for device in self.devices],
+            user=self.user,
+        )
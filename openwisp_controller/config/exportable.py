@@ -1,7 +1,11 @@
+import csv
 import json
 import uuid
 
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from import_export import resources, widgets
 from import_export.fields import Field
 from swapper import load_model
@@ -23,6 +27,16 @@ class ManyToManyWidget(widgets.ManyToManyWidget):
         return cleaned or ""
 
 
+class _Echo:
+    """
+    File-like object which returns the value written to it,
+    allows to stream the rows generated by ``csv.writer``
+    """
+
+    def write(self, value):
+        return value
+
+
 class DeviceResource(resources.ModelResource):
     organization = Field(
         attribute="organization__name", column_name="organization", readonly=True
@@ -69,6 +83,12 @@ class DeviceResource(resources.ModelResource):
         default=None,
         saves_null_values=False,
     )
+    # formats supported by ``get_streaming_response``
+    stream_formats = {
+        "ndjson": "application/x-ndjson",
+        "csv": "text/csv",
+    }
+    stream_chunk_size = 1000
 
     def dehydrate_config_data(self, device):
         """returns JSON instead of OrderedDict representation"""
@@ -84,6 +104,53 @@ class DeviceResource(resources.ModelResource):
         except ObjectDoesNotExist:
             pass
 
+    def get_stream_queryset(self, queryset):
+        """
+        Fetches the related objects of the exported devices with joins
+        and the templates with one query per chunk of devices
+        """
+        return queryset.select_related(
+            "organization", "group", "config"
+        ).prefetch_related("config__templates")
+
+    def iter_export_rows(self, queryset):
+        """
+        Yields the export headers followed by one row per device,
+        devices are read from a server-side cursor in chunks
+        of ``stream_chunk_size``, hence memory usage is constant
+        """
+        fields = self.get_export_fields()
+        yield self.get_export_headers()
+        queryset = self.get_stream_queryset(queryset)
+        for device in queryset.iterator(chunk_size=self.stream_chunk_size):
+            yield [self.export_field(field, device) for field in fields]
+
+    def iter_ndjson(self, queryset):
+        rows = self.iter_export_rows(queryset)
+        headers = next(rows)
+        for row in rows:
+            yield json.dumps(dict(zip(headers, row)), cls=DjangoJSONEncoder) + "\n"
+
+    def iter_csv(self, queryset):
+        writer = csv.writer(_Echo())
+        for row in self.iter_export_rows(queryset):
+            yield writer.writerow(row)
+
+    def get_streaming_response(self, queryset, export_format="ndjson"):
+        """
+        Returns a ``StreamingHttpResponse`` which exports
+        ``queryset`` either in ``csv`` or in ``ndjson`` format
+        """
+        if export_format not in self.stream_formats:
+            raise ValueError(f'Unsupported export format: "{export_format}"')
+        content_type = self.stream_formats[export_format]
+        rows = getattr(self, f"iter_{export_format}")(queryset)
+        response = StreamingHttpResponse(rows, content_type=content_type)
+        timestamp = timezone.now().strftime("%Y-%m-%d-%H%M%S")
+        filename = f"devices-{timestamp}.{export_format}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
     def before_import_row(self, row, **kwargs):
         if "id" in row:
             row["id"] = uuid.UUID(row["id"])
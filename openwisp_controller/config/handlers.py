@@ -51,8 +51,8 @@ def devicegroup_change_handler(instance, **kwargs):
     ``ConfigConfig.connect_cache_dependencies`` (see ``config/apps.py``).
     """
     if type(instance) is list:
-        # changes group templates for multiple devices
-        devicegroup_templates_change_handler(instance, **kwargs)
+        # the group templates of devices changed in bulk are
+        # managed by Device.bulk_change_group() in the same chunk
         return
     if instance._state.adding or ("created" in kwargs and kwargs["created"] is True):
         return
@@ -0,0 +1,158 @@
+import logging
+import uuid
+
+from django.core.cache import cache
+from swapper import load_model
+
+from .tasks import run_device_bulk_job_chunk
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceBulkJob:
+    """
+    Operation performed on many devices at once which is executed
+    in the background by celery workers, in chunks of devices.
+
+    The progress of the job is stored in the cache, which allows
+    the admin and the REST API to report it while it's running.
+    """
+
+    # maps each operation to the ``Device`` class method
+    # which performs it on a list of device primary keys,
+    # the method must return the number of devices processed
+    # or a dict which maps each device which failed to the error
+    operations = {
+        "change_group": "bulk_change_group",
+        "complete_import": "bulk_complete_import",
+        "update": "bulk_apply_changes",
+        "activate": "bulk_activate",
+        "deactivate": "bulk_deactivate",
+        "delete": "bulk_delete",
+    }
+    chunk_size = 1000
+    # time (in seconds) after which the progress information is discarded
+    cache_timeout = 86400
+
+    def __init__(self, job_id):
+        self.id = str(job_id)
+
+    def __str__(self):
+        return f"device bulk job {self.id}"
+
+    @property
+    def _cache_key(self):
+        return f"device_bulk_job_{self.id}"
+
+    def _get_counter_key(self, counter):
+        return f"{self._cache_key}_{counter}"
+
+    def _get_errors_key(self, chunk_index):
+        return f"{self._cache_key}_errors_{chunk_index}"
+
+    def _increment(self, counter, delta=1):
+        try:
+            cache.incr(self._get_counter_key(counter), delta)
+        except ValueError:
+            # the progress information has expired
+            pass
+
+    @classmethod
+    def start(cls, operation, device_ids, user=None, **kwargs):
+        """
+        Splits ``device_ids`` in chunks and sends each chunk to the
+        celery workers, ``kwargs`` are passed to the operation
+        """
+        if operation not in cls.operations:
+            raise ValueError(f'Unknown device bulk operation: "{operation}"')
+        job = cls(uuid.uuid4())
+        device_ids = [str(device_id) for device_id in device_ids]
+        chunks = []
+        for start in range(0, len(device_ids), cls.chunk_size):
+            end = start + cls.chunk_size
+            chunks.append(device_ids[start:end])
+        cache.set(
+            job._cache_key,
+            {
+                "operation": operation,
+                "user_id": str(user.pk) if user else None,
+                "total": len(device_ids),
+                "chunks": len(chunks),
+            },
+            cls.cache_timeout,
+        )
+        for counter in ["processed", "failed", "completed_chunks"]:
+            cache.set(job._get_counter_key(counter), 0, cls.cache_timeout)
+        for chunk_index, chunk in enumerate(chunks):
+            run_device_bulk_job_chunk.delay(
+                job_id=job.id,
+                operation=operation,
+                device_ids=chunk,
+                chunk_index=chunk_index,
+                **kwargs,
+            )
+        return job
+
+    def run_chunk(self, operation, device_ids, chunk_index=0, **kwargs):
+        Device = load_model("config", "Device")
+        method = getattr(Device, self.operations[operation])
+        try:
+            result = method(device_ids, **kwargs)
+        except Exception as e:
+            logger.exception(f"A chunk of {self} ({operation}) failed: {e}")
+            self._increment("failed", len(device_ids))
+        else:
+            if isinstance(result, dict):
+                if result:
+                    cache.set(
+                        self._get_errors_key(chunk_index), result, self.cache_timeout
+                    )
+                    self._increment("failed", len(result))
+                result = len(device_ids) - len(result)
+            self._increment("processed", result)
+        finally:
+            self._increment("completed_chunks")
+
+    def get_progress(self):
+        """
+        Returns a dict describing the progress of the job
+        or ``None`` if the job does not exist (or has expired)
+        """
+        state = cache.get(self._cache_key)
+        if state is None:
+            return None
+        counters = cache.get_many(
+            [
+                self._get_counter_key(counter)
+                for counter in ["processed", "failed", "completed_chunks"]
+            ]
+        )
+        completed_chunks = counters.get(self._get_counter_key("completed_chunks"), 0)
+        # errors of the devices which failed, reported by the operations
+        # returning per-device results
+        errors = {}
+        for chunk_errors in cache.get_many(
+            [self._get_errors_key(index) for index in range(state["chunks"])]
+        ).values():
+            errors.update(chunk_errors)
+        return {
+            "id": self.id,
+            "operation": state["operation"],
+            "status": (
+                "completed" if completed_chunks >= state["chunks"] else "running"
+            ),
+            "total": state["total"],
+            "processed": counters.get(self._get_counter_key("processed"), 0),
+            "failed": counters.get(self._get_counter_key("failed"), 0),
+            "errors": errors,
+        }
+
+    def is_visible_to(self, user):
+        """
+        Only the user who started the job and
+        superusers can check its progress
+        """
+        state = cache.get(self._cache_key)
+        if state is None:
+            return False
+        return user.is_superuser or state["user_id"] == str(user.pk)
@@ -0,0 +1,73 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext_lazy as _
+from swapper import load_model
+
+
+class Command(BaseCommand):
+    help = _(
+        "Clones templates (including their tags) into an organization,"
+        " useful to provision new organizations automatically."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--to",
+            dest="organization",
+            help=_("Slug of the organization which receives the clones."),
+        )
+        parser.add_argument(
+            "--shared",
+            action="store_true",
+            default=False,
+            help=_("Clone the templates as shared templates."),
+        )
+        parser.add_argument(
+            "--from",
+            dest="source",
+            help=_(
+                "Slug of the organization whose templates are cloned"
+                ' ("shared" clones the shared templates).'
+            ),
+        )
+        parser.add_argument(
+            "--template",
+            action="append",
+            dest="templates",
+            default=[],
+            help=_("ID of a template to clone, can be repeated."),
+        )
+
+    def _get_organization(self, slug):
+        Organization = load_model("openwisp_users", "Organization")
+        try:
+            return Organization.objects.get(slug=slug)
+        except Organization.DoesNotExist:
+            raise CommandError(f'Organization "{slug}" does not exist.')
+
+    def handle(self, *args, **options):
+        Template = load_model("config", "Template")
+        if options["shared"] == bool(options["organization"]):
+            raise CommandError("Specify either --to or --shared.")
+        if not options["source"] and not options["templates"]:
+            raise CommandError("Specify --from or at least one --template.")
+        organization = None
+        if options["organization"]:
+            organization = self._get_organization(options["organization"])
+        templates = Template.objects.none()
+        if options["source"] == "shared":
+            templates = Template.objects.filter(organization=None)
+        elif options["source"]:
+            templates = Template.objects.filter(
+                organization=self._get_organization(options["source"])
+            )
+        if options["templates"]:
+            try:
+                templates |= Template.objects.filter(pk__in=options["templates"])
+            except ValidationError as e:
+                raise CommandError(e.messages[0])
+        try:
+            clones = Template.bulk_clone(templates, organization=organization)
+        except ValidationError as e:
+            raise CommandError(e.messages[0])
+        self.stdout.write(f"Cloned {len(clones)} templates.")
@@ -0,0 +1,51 @@
+import csv
+import json
+import os
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext_lazy as _
+
+from ...bulk_import import DeviceBulkImport
+
+
+class Command(BaseCommand):
+    help = _(
+        "Imports devices (and their configuration) in bulk from a CSV"
+        " or NDJSON file which uses the columns of the device export."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help=_("Path of the file to import."))
+        parser.add_argument(
+            "--format",
+            dest="file_format",
+            choices=["csv", "ndjson"],
+            help=_("Format of the file (defaults to the file extension)."),
+        )
+
+    def _read_rows(self, path, file_format):
+        with open(path, newline="") as file:
+            if file_format == "csv":
+                return list(csv.DictReader(file))
+            return [json.loads(line) for line in file if line.strip()]
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["file_format"] or os.path.splitext(path)[1][1:]
+        if file_format not in ["csv", "ndjson"]:
+            raise CommandError("Specify the format of the file with --format.")
+        try:
+            rows = self._read_rows(path, file_format)
+        except OSError as e:
+            raise CommandError(str(e))
+        except ValueError as e:
+            raise CommandError(f"Invalid file: {e}")
+        try:
+            job = DeviceBulkImport(rows).save()
+        except ValidationError as e:
+            raise CommandError("\n".join(e.messages))
+        self.stdout.write(
+            f"Imported {len(rows)} devices, the import is completed"
+            f" in the background ({job})."
+        )
@@ -1,7 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.utils.translation import gettext_lazy as _
 
-from openwisp_controller.config.base.cache import CacheDependency
+from openwisp_controller.config.base.cache import CacheDependency, CacheDependencyIndex
 
 
 class Command(BaseCommand):
@@ -17,6 +17,19 @@ class Command(BaseCommand):
             default="text",
             help=_("Output format (default: text)."),
         )
+        parser.add_argument(
+            "--index",
+            action="store_true",
+            default=False,
+            help=_(
+                "Prints the size and fan-out of the dependency indexes"
+                " used to resolve the affected objects instead."
+            ),
+        )
 
     def handle(self, *args, **options):
-        self.stdout.write(CacheDependency.render_registered(fmt=options["format"]))
+        if options["index"]:
+            output = CacheDependencyIndex.render_registered(fmt=options["format"])
+        else:
+            output = CacheDependency.render_registered(fmt=options["format"])
+        self.stdout.write(output)
@@ -38,6 +38,10 @@ CERT_PATH = get_setting("CERT_PATH", "/etc/x509")
 COMMON_NAME_FORMAT = get_setting("COMMON_NAME_FORMAT", "{mac_address}-{name}")
 MANAGEMENT_IP_DEVICE_LIST = get_setting("MANAGEMENT_IP_DEVICE_LIST", True)
 CONFIG_BACKEND_FIELD_SHOWN = get_setting("CONFIG_BACKEND_FIELD_SHOWN", True)
+DEVICE_ADMIN_PERFORMANCE_MODE = get_setting("DEVICE_ADMIN_PERFORMANCE_MODE", False)
+DEVICE_ADMIN_SHOW_FULL_RESULT_COUNT = get_setting(
+    "DEVICE_ADMIN_SHOW_FULL_RESULT_COUNT", True
+)
 
 HARDWARE_ID_ENABLED = get_setting("HARDWARE_ID_ENABLED", False)
 HARDWARE_ID_OPTIONS = {
@@ -60,6 +64,10 @@ SHARED_MANAGEMENT_IP_ADDRESS_SPACE = get_setting(
 )
 DSA_OS_MAPPING = get_setting("DSA_OS_MAPPING", {})
 DSA_DEFAULT_FALLBACK = get_setting("DSA_DEFAULT_FALLBACK", True)
+PREVIEW_CACHE_TIMEOUT = get_setting("PREVIEW_CACHE_TIMEOUT", 300)
+BULK_RENDER_MAX_ITEMS = get_setting("BULK_RENDER_MAX_ITEMS", 100)
+BULK_UPDATE_SYNC_MAX_DEVICES = get_setting("BULK_UPDATE_SYNC_MAX_DEVICES", 100)
+BULK_ACTION_SYNC_MAX_DEVICES = get_setting("BULK_ACTION_SYNC_MAX_DEVICES", 100)
 GROUP_PIE_CHART = get_setting("GROUP_PIE_CHART", False)
 API_TASK_RETRY_OPTIONS = get_setting(
     "API_TASK_RETRY_OPTIONS",
@@ -40,6 +40,34 @@ def update_template_related_config_status(template_pk):
         )
 
 
+@shared_task(soft_time_limit=7200)
+def update_template_related_config_status_chunk(
+    template_pk, first_config_id, last_config_id
+):
+    """
+    Flags a chunk of the config objects related to the
+    specified template PK as modified (see
+    ``update_template_related_config_status``)
+    """
+    Template = load_model("config", "Template")
+    try:
+        template = Template.objects.get(pk=template_pk)
+    except ObjectDoesNotExist as e:
+        logger.warning(
+            f'update_template_related_config_status_chunk("{template_pk}") '
+            f"failed: {e}"
+        )
+        return
+    try:
+        template._update_related_config_status_chunk(first_config_id, last_config_id)
+    except SoftTimeLimitExceeded:
+        logger.error(
+            "soft time limit hit while executing "
+            f"_update_related_config_status_chunk for {template} "
+            f"(ID: {template_pk})"
+        )
+
+
 @shared_task(soft_time_limit=7200)
 def auto_add_template_to_existing_configs(template_pk):
     Template = load_model("config", "Template")
@@ -194,9 +222,21 @@ def change_devices_templates(instance_id, model_name, **kwargs):
 
 
 @shared_task(soft_time_limit=7200)
-def bulk_invalidate_config_get_cached_checksum(query_params):
+def run_device_bulk_job_chunk(job_id, operation, device_ids, chunk_index=0, **kwargs):
+    """
+    Executes a chunk of a device bulk job (see ``config.jobs.DeviceBulkJob``)
+    """
+    from .jobs import DeviceBulkJob
+
+    DeviceBulkJob(job_id).run_chunk(
+        operation, device_ids, chunk_index=chunk_index, **kwargs
+    )
+
+
+@shared_task(soft_time_limit=7200)
+def bulk_invalidate_config_get_cached_checksum(query_params, variables=None):
     Config = load_model("config", "Config")
-    Config.bulk_invalidate_get_cached_checksum(query_params)
+    Config.bulk_invalidate_get_cached_checksum(query_params, variables=variables)
 
 
 @shared_task(base=OpenwispCeleryTask)
@@ -8,8 +8,9 @@ from uuid import uuid4
 
 import django
 from django.contrib import admin
-from django.contrib.admin.models import LogEntry
+from django.contrib.admin.models import DELETION, LogEntry
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.files.base import ContentFile
 from django.core.management import call_command
@@ -27,8 +28,10 @@ from openwisp_utils.tests import (
 )
 
 from ...geo.tests.utils import TestGeoMixin
+from ...pagination import EstimatedCountPaginator
 from ...tests.utils import TestAdminMixin
 from .. import settings as app_settings
+from ..jobs import DeviceBulkJob
 from ..signals import (
     device_group_changed,
     device_name_changed,
@@ -104,6 +107,45 @@ class TestImportExportMixin:
         for field in self.resource_fields:
             self.assertIn(field, csv)
 
+    def test_device_stream_export_action(self):
+        org = self._get_org()
+        template = self._create_template(name="t1", organization=org)
+        config = self._create_config(organization=org)
+        config.templates.add(template)
+        device = config.device
+        path = reverse(f"admin:{self.app_label}_device_changelist")
+        post_data = {
+            "_selected_action": [device.pk],
+            "action": "stream_export_csv",
+            "csrfmiddlewaretoken": "test",
+        }
+
+        with self.subTest("CSV"):
+            response = self.client.post(path, post_data)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Type"], "text/csv")
+            self.assertIn(".csv", response["Content-Disposition"])
+            content = b"".join(response.streaming_content).decode()
+            rows = list(csv.reader(io.StringIO(content)))
+            self.assertEqual(len(rows), 2)
+            for field in self.resource_fields:
+                self.assertIn(field, rows[0])
+            row = dict(zip(rows[0], rows[1]))
+            self.assertEqual(row["name"], device.name)
+            self.assertEqual(row["organization"], org.name)
+            self.assertEqual(row["config_templates"], str(template.pk))
+
+        with self.subTest("NDJSON"):
+            post_data["action"] = "stream_export_ndjson"
+            response = self.client.post(path, post_data)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Type"], "application/x-ndjson")
+            lines = b"".join(response.streaming_content).decode().splitlines()
+            self.assertEqual(len(lines), 1)
+            row = json.loads(lines[0])
+            self.assertEqual(row["id"], str(device.pk))
+            self.assertEqual(row["config_templates"], str(template.pk))
+
     def test_device_import(self):
         org = self._get_org()
         contents = (
@@ -570,6 +612,49 @@ class TestAdmin(
         self.assertContains(response, d1.name)
         self.assertNotContains(response, d2.name)
 
+    def test_device_changelist_performance_mode(self):
+        org = self._get_org()
+        self._create_device(organization=org)
+        path = reverse(f"admin:{self.app_label}_device_changelist")
+        cache.clear()
+
+        with self.subTest("performance mode disabled"):
+            response = self.client.get(path)
+            self.assertNotIsInstance(
+                response.context["cl"].paginator, EstimatedCountPaginator
+            )
+            self.assertEqual(response.context["cl"].full_result_count, 1)
+
+        with patch.object(app_settings, "DEVICE_ADMIN_PERFORMANCE_MODE", True):
+            with self.subTest("counts are cached for a short time"):
+                response = self.client.get(path)
+                self.assertIsInstance(
+                    response.context["cl"].paginator, EstimatedCountPaginator
+                )
+                self.assertEqual(response.context["cl"].result_count, 1)
+                self._create_device(
+                    organization=org, name="device2", mac_address="00:11:22:33:44:66"
+                )
+                response = self.client.get(path)
+                self.assertEqual(response.context["cl"].result_count, 1)
+                cache.clear()
+                response = self.client.get(path)
+                self.assertEqual(response.context["cl"].result_count, 2)
+
+            with self.subTest("unfiltered lists use the estimated count"):
+                with patch.object(
+                    EstimatedCountPaginator,
+                    "_get_estimated_count",
+                    return_value=500000,
+                ):
+                    response = self.client.get(path)
+                self.assertEqual(response.context["cl"].result_count, 500000)
+
+        with patch.object(app_settings, "DEVICE_ADMIN_SHOW_FULL_RESULT_COUNT", False):
+            response = self.client.get(f"{path}?q=device2")
+            self.assertEqual(response.context["cl"].result_count, 1)
+            self.assertIsNone(response.context["cl"].full_result_count)
+
     def _get_change_device_post_data(self, device):
         return {
             "_selected_action": [device.pk],
@@ -594,15 +679,126 @@ class TestAdmin(
         self._create_org_user(is_admin=True, organization=org, user=user)
         device = self._create_device(organization=org)
         group = self._create_device_group(name="default", organization=org)
-        self._test_action_permission(
-            path=reverse(f"admin:{self.app_label}_device_changelist"),
-            action="change_group",
-            user=user,
-            obj=device,
-            message="Successfully changed group of selected devices.",
-            required_perms=["change"],
-            extra_payload={"device_group": group.pk, "apply": True},
+        job_id = uuid4()
+        progress_url = reverse(f"admin:{self.app_label}_device_bulk_job", args=[job_id])
+        with patch("openwisp_controller.config.jobs.uuid") as mocked_uuid:
+            mocked_uuid.uuid4.return_value = job_id
+            self._test_action_permission(
+                path=reverse(f"admin:{self.app_label}_device_changelist"),
+                action="change_group",
+                user=user,
+                obj=device,
+                message=(
+                    "The group of the selected devices is being changed in the "
+                    f'background, <a href="{progress_url}">check progress</a>.'
+                ),
+                required_perms=["change"],
+                extra_payload={"device_group": group.pk, "apply": True},
+            )
+
+    def test_device_bulk_job_view(self):
+        org = self._get_org()
+        device = self._create_device(organization=org)
+        admin = self._get_admin()
+        job = DeviceBulkJob.start(
+            "change_group", [device.pk], user=admin, group_id=None
         )
+        path = reverse(f"admin:{self.app_label}_device_bulk_job", args=[job.id])
+
+        with self.subTest("progress of the job"):
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, "Change group of devices")
+            self.assertContains(response, "The operation has been completed.")
+            self.assertContains(response, '<td class="total">1</td>', html=True)
+            self.assertContains(response, '<td class="processed">1</td>', html=True)
+            self.assertContains(response, '<td class="failed">0</td>', html=True)
+            self.assertNotContains(response, 'http-equiv="refresh"')
+
+        with self.subTest("errors of the job"):
+            job = DeviceBulkJob.start("delete", [device.pk], user=admin)
+            response = self.client.get(
+                reverse(f"admin:{self.app_label}_device_bulk_job", args=[job.id])
+            )
+            self.assertContains(response, "Delete devices")
+            self.assertContains(response, '<td class="failed">1</td>', html=True)
+            device_url = reverse(
+                f"admin:{self.app_label}_device_change", args=[device.pk]
+            )
+            self.assertContains(
+                response,
+                f'<a href="{device_url}">{device}</a>: '
+                "The device must be deactivated prior to deletion",
+            )
+
+        with self.subTest("running job"):
+            with patch("openwisp_controller.config.jobs.run_device_bulk_job_chunk"):
+                job = DeviceBulkJob.start("deactivate", [device.pk], user=admin)
+            response = self.client.get(
+                reverse(f"admin:{self.app_label}_device_bulk_job", args=[job.id])
+            )
+            self.assertContains(response, "this page is reloaded automatically")
+            self.assertContains(response, '<td class="processed">0</td>', html=True)
+            self.assertContains(response, '<meta http-equiv="refresh" content="3">')
+
+        with self.subTest("job of another user"):
+            administrator = self._create_administrator(organizations=[org])
+            self.client.force_login(administrator)
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 404)
+
+        with self.subTest("non existing job"):
+            self.client.force_login(admin)
+            path = reverse(f"admin:{self.app_label}_device_bulk_job", args=[uuid4()])
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 404)
+
+    def test_device_bulk_actions_in_background(self):
+        device = self._create_device(organization=self._get_org())
+        path = reverse(f"admin:{self.app_label}_device_changelist")
+        job_id = uuid4()
+        progress_url = reverse(f"admin:{self.app_label}_device_bulk_job", args=[job_id])
+        data = {"_selected_action": [str(device.pk)]}
+        message = (
+            "The selected devices are being {} in the background, "
+            f'<a href="{progress_url}">check progress</a>.'
+        )
+        with (
+            patch.object(app_settings, "BULK_ACTION_SYNC_MAX_DEVICES", 0),
+            patch("openwisp_controller.config.jobs.uuid") as mocked_uuid,
+        ):
+            mocked_uuid.uuid4.return_value = job_id
+
+            with self.subTest("deactivate devices"):
+                response = self.client.post(
+                    path, {**data, "action": "deactivate_device"}, follow=True
+                )
+                self.assertContains(response, message.format("deactivated"))
+                device.refresh_from_db()
+                self.assertTrue(device.is_deactivated())
+
+            with self.subTest("activate devices"):
+                response = self.client.post(
+                    path, {**data, "action": "activate_device"}, follow=True
+                )
+                self.assertContains(response, message.format("activated"))
+                device.refresh_from_db()
+                self.assertFalse(device.is_deactivated())
+
+            with self.subTest("delete devices"):
+                response = self.client.post(
+                    path,
+                    {**data, "action": "delete_selected", "post": "yes"},
+                    follow=True,
+                )
+                self.assertContains(response, message.format("deleted"))
+                self.assertFalse(Device.objects.filter(pk=device.pk).exists())
+                self.assertEqual(
+                    LogEntry.objects.filter(
+                        object_id=str(device.pk), action_flag=DELETION
+                    ).count(),
+                    1,
+                )
 
     def test_device_export_includes_deactivated_config_status(self):
         device = self._create_device_config()
@@ -1362,6 +1558,38 @@ class TestAdmin(
         # expect error
         self.assertContains(response, '<pre class="djnjc-preformatted error')
 
+    def test_preview_device_cached(self):
+        path = reverse(f"admin:{self.app_label}_device_preview")
+        data = {
+            "name": "test-device",
+            "mac_address": self.TEST_MAC_ADDRESS,
+            "backend": "netjsonconfig.OpenWrt",
+            "config": json.dumps({"general": {"description": "preview-cache"}}),
+            "csrfmiddlewaretoken": "test",
+        }
+        response = self.client.post(path, data)
+        self.assertContains(response, "preview-cache")
+        with patch("netjsonconfig.OpenWrt.render") as mocked_render:
+            response = self.client.post(path, data)
+            mocked_render.assert_not_called()
+        self.assertContains(response, "preview-cache")
+
+        with self.subTest("changing the configuration renders it again"):
+            data["config"] = json.dumps({"general": {"description": "preview-new"}})
+            response = self.client.post(path, data)
+            self.assertContains(response, "preview-new")
+
+        with self.subTest("the cache can be disabled"):
+            with (
+                patch.object(app_settings, "PREVIEW_CACHE_TIMEOUT", 0),
+                patch(
+                    "netjsonconfig.OpenWrt.render", return_value="not-cached"
+                ) as mocked_render,
+            ):
+                response = self.client.post(path, data)
+                mocked_render.assert_called_once()
+            self.assertContains(response, "not-cached")
+
     @patch("sys.stdout", devnull)
     @patch("sys.stderr", devnull)
     def test_preview_device_405(self):
@@ -3173,7 +3401,8 @@ class TestDeviceGroupAdminTransaction(
             response = self.client.post(path, post_data, follow=True)
             self.assertEqual(response.status_code, 200)
             self.assertContains(
-                response, "Successfully changed group of selected devices."
+                response,
+                "The group of the selected devices is being changed in the background",
             )
             templates = device1.config.templates.all()
             self.assertIn(t2, templates)
@@ -3193,7 +3422,12 @@ class TestDeviceGroupAdminTransaction(
             with patch.object(Device, "_send_device_group_changed_signal") as mocked:
                 response = self.client.post(path, data, follow=True)
                 self.assertEqual(response.status_code, 200)
-                self.assertEqual(len(mocked.call_args_list), 2)
+                # a single signal is sent for each chunk of devices
+                self.assertEqual(len(mocked.call_args_list), 1)
+                self.assertEqual(
+                    sorted(mocked.call_args.kwargs["instance"]),
+                    sorted([str(device1.pk), str(device2.pk)]),
+                )
 
         with self.subTest("Change group skips deactivated devices in signals"):
             device3 = self._create_device(
@@ -3210,6 +3444,7 @@ class TestDeviceGroupAdminTransaction(
                 response = self.client.post(path, data, follow=True)
                 self.assertEqual(response.status_code, 200)
                 self.assertEqual(len(mocked.call_args_list), 1)
+                self.assertEqual(mocked.call_args.kwargs["instance"], [str(device1.pk)])
             device1.refresh_from_db()
             device3.refresh_from_db()
             self.assertEqual(device1.group_id, dg2.id)
@@ -1,24 +1,38 @@
+import csv
+import io
+import json
 from datetime import timedelta
 from unittest.mock import patch
+from uuid import uuid4
 
 from django.contrib.auth.models import Permission
 from django.core.cache import cache
+from django.db import connection
 from django.http.response import Http404
 from django.test import TestCase
 from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
 from django.test.testcases import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
 from swapper import load_model
 
-from openwisp_controller.config.api.serializers import BaseConfigSerializer
+from openwisp_controller.config.api.serializers import (
+    BaseConfigSerializer,
+    DeviceDetailSerializer,
+)
 from openwisp_controller.tests.utils import TestAdminMixin
 from openwisp_users.tests.test_api import AuthenticationMixin
 from openwisp_utils.tests import capture_any_output, catch_signal
 
 from .. import settings as app_settings
 from ..controller.views import DeviceChecksumView, VpnChecksumView
+from ..jobs import DeviceBulkJob
 from ..signals import group_templates_changed
+from ..tasks import change_devices_templates
+from ..whois.service import WHOISService
 from .utils import (
     CreateConfigTemplateMixin,
     CreateDeviceGroupMixin,
@@ -32,6 +46,8 @@ VpnClient = load_model("config", "VpnClient")
 Device = load_model("config", "Device")
 Config = load_model("config", "Config")
 DeviceGroup = load_model("config", "DeviceGroup")
+WHOISInfo = load_model("config", "WHOISInfo")
+OrganizationConfigSettings = load_model("config", "OrganizationConfigSettings")
 OrganizationUser = load_model("openwisp_users", "OrganizationUser")
 
 
@@ -277,6 +293,181 @@ class TestConfigApi(
             expected = [recent.name, device.name, oldest.name]
             self.assertEqual(names, expected)
 
+    def test_device_list_api_cursor_pagination(self):
+        org = self._get_org()
+        devices = [
+            self._create_device(
+                name=f"device{index}",
+                mac_address=f"00:00:00:00:00:0{index}",
+                organization=org,
+            )
+            for index in range(3)
+        ]
+        # devices created at the same time are sorted by primary key
+        devices[0].created = devices[1].created
+        devices[0].save(update_fields=["created"])
+        expected = [devices[2].name] + [
+            device.name
+            for device in sorted(devices[:2], key=lambda d: d.pk, reverse=True)
+        ]
+        path = reverse("config_api:device_list")
+        # the total number of devices is not counted
+        with patch.object(
+            app_settings, "WHOIS_CONFIGURED", False
+        ), self.assertNumQueries(2):
+            response = self.client.get(path, {"pagination": "cursor", "page_size": 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("count", response.data)
+        self.assertIsNone(response.data["previous"])
+        self.assertIn("cursor=", response.data["next"])
+        names = [d["name"] for d in response.data["results"]]
+        # the next page is filtered on (created, id), without OFFSET
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(response.data["next"])
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(
+            any("OFFSET" in query["sql"] for query in captured.captured_queries)
+        )
+        self.assertIsNone(response.data["next"])
+        self.assertIsNotNone(response.data["previous"])
+        names += [d["name"] for d in response.data["results"]]
+        self.assertEqual(names, expected)
+        # the items sharing the creation date are not skipped backwards
+        response = self.client.get(response.data["previous"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([d["name"] for d in response.data["results"]], expected[:2])
+
+        with self.subTest("invalid cursor"):
+            response = self.client.get(
+                path, {"pagination": "cursor", "cursor": "invalid"}
+            )
+            self.assertEqual(response.status_code, 404)
+
+        with self.subTest("Page number pagination is used by default"):
+            response = self.client.get(path, {"page_size": 2})
+            self.assertEqual(response.data["count"], 3)
+            self.assertIn("page=2", response.data["next"])
+
+    def test_device_api_sparse_fieldsets(self):
+        org = self._get_org()
+        template = self._create_template(organization=org)
+        config = self._create_config(organization=org)
+        config.templates.add(template)
+        device = config.device
+        list_path = reverse("config_api:device_list")
+        detail_path = reverse("config_api:device_detail", args=[device.pk])
+        config_table = Config._meta.db_table
+
+        with self.subTest("fields of the device list"):
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(list_path, {"fields": "id,name"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.data["results"], [{"id": str(device.pk), "name": device.name}]
+            )
+            # the configuration is not joined when it's not requested
+            for query in captured.captured_queries:
+                self.assertNotIn(config_table, query["sql"])
+
+        with self.subTest("fields of nested serializers"):
+            response = self.client.get(list_path, {"fields": "id,config.status"})
+            self.assertEqual(
+                response.data["results"],
+                [{"id": str(device.pk), "config": {"status": "modified"}}],
+            )
+
+        with self.subTest("omitted fields of the device detail"):
+            response = self.client.get(
+                detail_path, {"omit": "notes,config.templates,config.config"}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("notes", response.data)
+            self.assertIn("name", response.data)
+            self.assertEqual(
+                set(response.data["config"]),
+                {"status", "error_reason", "backend", "context"},
+            )
+
+        with self.subTest("WHOIS information is not looked up when omitted"):
+            with patch.object(app_settings, "WHOIS_CONFIGURED", True), patch.object(
+                WHOISService, "get_device_whois_info"
+            ) as mocked_whois_info:
+                response = self.client.get(detail_path, {"fields": "id,name"})
+            self.assertEqual(response.data, {"id": str(device.pk), "name": device.name})
+            mocked_whois_info.assert_not_called()
+
+        with self.subTest("fields are ignored by write requests"):
+            response = self.client.patch(
+                f"{detail_path}?fields=id",
+                {"notes": "changed"},
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["notes"], "changed")
+            self.assertIn("config", response.data)
+
+    @patch.object(app_settings, "WHOIS_CONFIGURED", True)
+    def test_device_api_constant_queries(self):
+        org = self._get_org()
+        template = self._create_template(organization=org)
+        for index in range(100):
+            device = self._create_device(
+                name=f"device{index}",
+                mac_address=f"00:11:22:33:44:{index:02x}",
+                organization=org,
+                last_ip=f"172.217.22.{index % 3}",
+            )
+            self._create_config(device=device, templates=[template])
+        for index in range(1, 3):
+            WHOISInfo.objects.create(
+                ip_address=f"172.217.22.{index}",
+                isp="Test ISP",
+                asn="12345",
+                address={"city": "Test City", "country": "Test Country"},
+                cidr=f"172.217.22.{index}/32",
+            )
+        OrganizationConfigSettings.objects.update_or_create(
+            organization=org, defaults={"whois_enabled": True}
+        )
+        cache.delete(WHOISService.get_cache_key(org.pk))
+        # the settings of the organization are cached by the first lookup
+        WHOISService.get_org_config_settings(org_id=org.pk)
+        path = reverse("config_api:device_list")
+
+        def _count_list_queries(page_size):
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(path, {"page_size": page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data["results"]), page_size)
+            return len(captured)
+
+        with self.subTest("device list"):
+            queries = _count_list_queries(10)
+            self.assertEqual(_count_list_queries(100), queries)
+
+        def _count_serializer_queries(page_size):
+            request = Request(APIRequestFactory().get(path))
+            request.user = self._get_admin()
+            devices = Device.objects.select_related(
+                "config", "organization"
+            ).prefetch_related("config__templates")[:page_size]
+            with CaptureQueriesContext(connection) as captured:
+                data = DeviceDetailSerializer(
+                    devices, many=True, context={"request": request}
+                ).data
+            self.assertEqual(len(data), page_size)
+            for item in data:
+                self.assertEqual(item["config"]["templates"], [template.pk])
+                if item["last_ip"] == "172.217.22.0":
+                    self.assertIsNone(item["whois_info"])
+                else:
+                    self.assertEqual(item["whois_info"]["isp"], "Test ISP")
+            return len(captured)
+
+        with self.subTest("templates and WHOIS information of many devices"):
+            queries = _count_serializer_queries(10)
+            self.assertEqual(_count_serializer_queries(100), queries)
+
     def test_device_list_api_filter(self):
         org1 = self._create_org()
         d1, _, t1 = self._create_wireguard_vpn_template(organization=org1)
@@ -721,11 +912,57 @@ class TestConfigApi(
         initial_count = Template.objects.count()
         self._create_template(name="t1", organization=org1)
         path = reverse("config_api:template_list")
-        with self.assertNumQueries(4):
+        with self.assertNumQueries(5):
             r = self.client.get(path)
         self.assertEqual(r.status_code, 200)
         self.assertEqual(Template.objects.count(), initial_count + 1)
 
+    def test_template_list_conditional_requests(self):
+        t1 = self._create_template(name="t1", organization=self._get_org())
+        path = reverse("config_api:template_list")
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("no-cache", response["Cache-Control"])
+        etag = response["ETag"]
+
+        with self.subTest("unchanged list"):
+            with self.assertNumQueries(2):
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response["ETag"], etag)
+
+        with self.subTest("different query parameters"):
+            response = self.client.get(path, {"page_size": 1}, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+
+        with self.subTest("changed template"):
+            t1.name = "changed"
+            t1.full_clean()
+            t1.save()
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response["ETag"], etag)
+            etag = response["ETag"]
+
+        with self.subTest("deleted template"):
+            t1.delete()
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response["ETag"], etag)
+
+        with self.subTest("If-Modified-Since is not enough to detect deletions"):
+            t2 = self._create_template(name="t2", organization=self._get_org())
+            self._create_template(name="t3", organization=self._get_org())
+            response = self.client.get(path)
+            last_modified = response["Last-Modified"]
+            t2.delete()
+            # the most recent template was not deleted,
+            # hence the Last-Modified header did not change
+            response = self.client.get(path, HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Last-Modified"], last_modified)
+            self.assertEqual(response.data["count"], 1)
+
     def test_template_list_api_filter(self):
         org1 = self._create_org()
         _, _, t1 = self._create_wireguard_vpn_template(organization=org1)
@@ -889,7 +1126,7 @@ class TestConfigApi(
         org = self._get_org()
         self._create_vpn(organization=org)
         path = reverse("config_api:vpn_list")
-        with self.assertNumQueries(3):
+        with self.assertNumQueries(4):
             r = self.client.get(path)
         self.assertEqual(r.status_code, 200)
 
@@ -1336,6 +1573,128 @@ class TestConfigApi(
             )
             self.assertEqual(response.status_code, 200)
 
+    def test_template_clone_api(self):
+        org1 = self._get_org()
+        org2 = self._create_org(name="org2", slug="org2")
+        t1 = self._create_template(name="t1", organization=org1)
+        t1.tags.add("mesh")
+        t2 = self._create_template(name="t2", organization=org1)
+        path = reverse("config_api:template_clone")
+        data = {"templates": [str(t1.pk), str(t2.pk)], "organization": str(org2.pk)}
+        response = self.client.post(path, data, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual({template["name"] for template in response.data}, {"t1", "t2"})
+        clone = Template.objects.get(organization=org2, name="t1")
+        self.assertEqual(list(clone.tags.names()), ["mesh"])
+
+        with self.subTest("only superusers can clone as shared"):
+            administrator = self._create_administrator(organizations=[org1, org2])
+            self.client.force_login(administrator)
+            data["organization"] = None
+            response = self.client.post(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("organization", response.data)
+
+        with self.subTest("templates of other organizations"):
+            org3 = self._create_org(name="org3", slug="org3")
+            t3 = self._create_template(name="t3", organization=org3)
+            data = {"templates": [str(t3.pk)], "organization": str(org1.pk)}
+            response = self.client.post(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("templates", response.data)
+
+        with self.subTest("organization not managed"):
+            data = {"templates": [str(t1.pk)], "organization": str(org3.pk)}
+            response = self.client.post(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("organization", response.data)
+
+    def test_device_render_api(self):
+        org = self._get_org()
+        template = self._create_template(
+            name="t1",
+            organization=org,
+            config={"general": {"description": "{{ description }}"}},
+            default_values={"description": "from-template"},
+        )
+        config = self._create_config(organization=org)
+        config.templates.add(template)
+        device2 = self._create_device(
+            name="device2", mac_address="00:11:22:33:44:56", organization=org
+        )
+        path = reverse("config_api:device_render")
+        data = {
+            "items": [
+                {"device": str(config.device.pk)},
+                {
+                    "device": str(config.device.pk),
+                    "context": {"description": "from-context"},
+                },
+                {
+                    "device": str(device2.pk),
+                    "templates": [str(template.pk)],
+                    "config": {"interfaces": {"wrong": "wrong"}},
+                },
+            ]
+        }
+        response = self.client.post(path, data, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        results = response.data["results"]
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]["device"], str(config.device.pk))
+        self.assertTrue(results[0]["valid"])
+        self.assertIn("from-template", results[0]["output"])
+        self.assertIn("from-context", results[1]["output"])
+        self.assertEqual(results[2]["device"], str(device2.pk))
+        self.assertFalse(results[2]["valid"])
+        self.assertIsNone(results[2]["output"])
+        self.assertIsNotNone(results[2]["error"])
+        # nothing is saved
+        config.refresh_from_db()
+        self.assertEqual(config.context, {})
+        self.assertFalse(Config.objects.filter(device=device2).exists())
+
+        with self.subTest("device of another organization"):
+            org2 = self._create_org(name="org2")
+            device3 = self._create_device(
+                name="device3", mac_address="00:11:22:33:44:57", organization=org2
+            )
+            administrator = self._create_administrator(organizations=[org])
+            self.client.force_login(administrator)
+            response = self.client.post(
+                path,
+                {"items": [{"device": str(device3.pk)}]},
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("items", response.data)
+            self._login()
+
+        with self.subTest("template of another organization"):
+            template2 = self._create_template(name="t2", organization=org2)
+            response = self.client.post(
+                path,
+                {
+                    "items": [
+                        {
+                            "device": str(config.device.pk),
+                            "templates": [str(template2.pk)],
+                        }
+                    ]
+                },
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 400)
+
+        with self.subTest("empty items"):
+            response = self.client.post(
+                path,
+                {"items": []},
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 400)
+
 
 class TestConfigApiTransaction(
     ApiTestMixin,
@@ -1349,6 +1708,52 @@ class TestConfigApiTransaction(
         super().setUp()
         self._login()
 
+    def test_device_export_api(self):
+        org = self._get_org()
+        template = self._create_template(name="t1", organization=org)
+        path = reverse("config_api:device_export")
+
+        def _export(**params):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(path, params)
+                self.assertEqual(response.status_code, 200)
+                content = b"".join(response.streaming_content).decode()
+            return response, content, len(context.captured_queries)
+
+        config = self._create_config(organization=org)
+        config.templates.add(template)
+        response, content, queries = _export()
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["name"], config.device.name)
+        self.assertEqual(rows[0]["config_templates"], str(template.pk))
+
+        with self.subTest("The number of queries does not depend on devices"):
+            for index in range(3):
+                device = self._create_device(
+                    name=f"device{index}",
+                    mac_address=f"00:11:22:33:44:0{index}",
+                    organization=org,
+                )
+                config = self._create_config(device=device)
+                config.templates.add(template)
+            response, content, more_devices_queries = _export()
+            self.assertEqual(len(content.splitlines()), 4)
+            self.assertEqual(more_devices_queries, queries)
+
+        with self.subTest("CSV with filters"):
+            response, content, _ = _export(export_format="csv", name="device0")
+            self.assertEqual(response["Content-Type"], "text/csv")
+            rows = list(csv.reader(io.StringIO(content)))
+            self.assertEqual(len(rows), 2)
+            self.assertEqual(dict(zip(*rows))["name"], "device0")
+
+        with self.subTest("Unsupported format"):
+            response = self.client.get(path, {"export_format": "xml"})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("export_format", response.data)
+
     def test_session_survives_default_cache_clear(self):
         # The authenticated session must live in a cache separate from the
         # default one: tests (e.g. whois) call cache.clear() on the default
@@ -1380,11 +1785,11 @@ class TestConfigApiTransaction(
             self.assertEqual(response.status_code, 200)
 
         def _assert_cache_invalidation(path, org_slug):
-            with self.assertNumQueries(5):
+            with self.assertNumQueries(3):
                 response = self.client.get(path, data={"org": org_slug})
                 self.assertEqual(response.status_code, 200)
 
-            with self.assertNumQueries(5):
+            with self.assertNumQueries(3):
                 response = self.client.get(path)
                 self.assertEqual(response.status_code, 200)
 
@@ -1441,7 +1846,7 @@ class TestConfigApiTransaction(
             "config_api:devicegroup_x509_commonname", args=[cert.common_name]
         )
 
-        with self.assertNumQueries(5):
+        with self.assertNumQueries(3):
             response = self.client.get(path, data={"org": org.slug})
             self.assertEqual(response.status_code, 200)
 
@@ -1459,7 +1864,7 @@ class TestConfigApiTransaction(
             "config_api:devicegroup_x509_commonname", args=[cert.common_name]
         )
 
-        with self.assertNumQueries(5):
+        with self.assertNumQueries(3):
             response = self.client.get(path, data={"org": org.slug})
             self.assertEqual(response.status_code, 200)
 
@@ -1477,7 +1882,7 @@ class TestConfigApiTransaction(
             "config_api:devicegroup_x509_commonname", args=[cert.common_name]
         )
 
-        with self.assertNumQueries(5):
+        with self.assertNumQueries(3):
             response = self.client.get(path, data={"org": org.slug})
             self.assertEqual(response.status_code, 200)
 
@@ -1489,6 +1894,37 @@ class TestConfigApiTransaction(
         response = self.client.get(path, data={"org": org.slug})
         self.assertEqual(response.status_code, 404)
 
+    def test_devicegroup_commonname_cache_shared_by_organization_filters(self):
+        device_group, org, cert = self._get_devicegroup_org_cert()
+        org2 = self._create_org(name="org2", slug="org2")
+        path = reverse(
+            "config_api:devicegroup_x509_commonname", args=[cert.common_name]
+        )
+        org_slugs = f"{org2.slug},{org.slug}"
+
+        with self.subTest("the group is looked up with a single query"):
+            with self.assertNumQueries(3):
+                response = self.client.get(path, data={"org": org_slugs})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["name"], device_group.name)
+
+        with self.subTest("the cached lookup is shared by all the filters"):
+            with self.assertNumQueries(2):
+                response = self.client.get(path, data={"org": org.slug})
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get(path, data={"org": org2.slug})
+            self.assertEqual(response.status_code, 404)
+
+        with self.subTest("filters with many organizations are invalidated"):
+            device_group2 = self._create_device_group(name="Switches", organization=org)
+            device = Device.objects.get(config__vpnclient__cert=cert)
+            device.group = device_group2
+            device.full_clean()
+            device.save()
+            response = self.client.get(path, data={"org": org_slugs})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["name"], device_group2.name)
+
     def test_device_and_vpn_view_cache_invalidate_on_organization_delete(self):
         """
         Regression test for the Device and Vpn delete CacheDependency
@@ -1580,6 +2016,419 @@ class TestConfigApiTransaction(
             self.assertEqual(r.data["config"]["templates"], [])
             self.assertEqual(d1.config.templates.count(), 0)
 
+    def test_device_import_api(self):
+        org = self._get_org()
+        template = self._create_template(name="t1", organization=org)
+        path = reverse("config_api:device_import")
+        rows = [
+            {
+                "name": "imported1",
+                "mac_address": "00:11:22:33:44:01",
+                "organization_id": str(org.pk),
+                "config_backend": "netjsonconfig.OpenWrt",
+                "config_data": json.dumps({"general": {}}),
+                "config_templates": str(template.pk),
+            },
+            {
+                "name": "imported2",
+                "mac_address": "00:11:22:33:44:02",
+                "organization_id": str(org.pk),
+            },
+        ]
+
+        with self.subTest("devices are imported"):
+            with patch.object(DeviceBulkJob, "chunk_size", 1):
+                response = self.client.post(
+                    path, {"devices": rows}, content_type="application/json"
+                )
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data["operation"], "complete_import")
+            self.assertEqual(response.data["status"], "completed")
+            self.assertEqual(response.data["processed"], 2)
+            config = Device.objects.get(name="imported1").config
+            self.assertEqual(list(config.templates.all()), [template])
+            self.assertEqual(config.checksum_db, config.checksum)
+            self.assertTrue(Device.objects.filter(name="imported2").exists())
+
+        with self.subTest("the errors of all the rows are reported"):
+            rows = [
+                {
+                    "name": "imported3",
+                    "mac_address": "00:11:22:33:44:01",
+                    "organization_id": str(org.pk),
+                },
+                {
+                    "name": "imported4",
+                    "mac_address": "00:11:22:33:44:04",
+                    "organization_id": str(org.pk),
+                },
+                {
+                    "name": "imported5",
+                    "mac_address": "00:11:22:33:44:04",
+                    "organization_id": str(org.pk),
+                },
+            ]
+            response = self.client.post(
+                path, {"devices": rows}, content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 400)
+            errors = response.data["devices"]
+            self.assertEqual(len(errors), 3)
+            self.assertIn("Row 1: mac_address", errors[0])
+            self.assertIn("already exists", errors[0])
+            self.assertIn("Row 2: mac_address", errors[1])
+            self.assertIn("Duplicated value", errors[1])
+            self.assertEqual(
+                Device.objects.filter(name__startswith="imported").count(), 2
+            )
+
+        with self.subTest("organizations not managed by the user"):
+            administrator = self._create_administrator(organizations=[org])
+            self.client.force_login(administrator)
+            org2 = self._create_org(name="org2")
+            rows[0].update(
+                organization_id=str(org2.pk), mac_address="00:11:22:33:44:09"
+            )
+            response = self.client.post(
+                path, {"devices": rows[:1]}, content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("Organization not found", response.data["devices"][0])
+
+    def test_device_change_group_api(self):
+        org = self._get_org()
+        t1 = self._create_template(name="t1", organization=org)
+        t2 = self._create_template(name="t2", organization=org)
+        dg1 = self._create_device_group(name="dg-1", organization=org)
+        dg2 = self._create_device_group(name="dg-2", organization=org)
+        dg1.templates.add(t1)
+        dg2.templates.add(t2)
+        d1 = self._create_device(name="device1", group=dg1, organization=org)
+        d2 = self._create_device(
+            name="device2",
+            mac_address="00:11:22:33:44:66",
+            group=dg1,
+            organization=org,
+        )
+        path = reverse("config_api:device_change_group")
+        data = {"devices": [str(d1.pk), str(d2.pk)], "group": str(dg2.pk)}
+
+        with self.subTest("group and templates are changed in chunks"):
+            with patch.object(DeviceBulkJob, "chunk_size", 1), patch.object(
+                change_devices_templates, "delay"
+            ) as mocked_change_templates:
+                response = self.client.post(path, data, content_type="application/json")
+            # templates are applied by the chunks, not by follow-up tasks
+            mocked_change_templates.assert_not_called()
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data["operation"], "change_group")
+            self.assertEqual(response.data["status"], "completed")
+            self.assertEqual(response.data["total"], 2)
+            self.assertEqual(response.data["processed"], 2)
+            self.assertEqual(response.data["failed"], 0)
+            for device in [d1, d2]:
+                device.refresh_from_db()
+                self.assertEqual(device.group, dg2)
+                self.assertEqual(list(device.config.templates.all()), [t2])
+
+        with self.subTest("job progress"):
+            job_path = reverse("config_api:device_bulk_job", args=[response.data["id"]])
+            response = self.client.get(job_path)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["status"], "completed")
+            self.assertEqual(response.data["processed"], 2)
+
+        with self.subTest("job progress is not visible to other users"):
+            administrator = self._create_administrator(organizations=[org])
+            self.client.force_login(administrator)
+            response = self.client.get(job_path)
+            self.assertEqual(response.status_code, 404)
+            self._login()
+
+        with self.subTest("unassign group"):
+            data["group"] = None
+            response = self.client.post(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 202)
+            for device in [d1, d2]:
+                device.refresh_from_db()
+                self.assertIsNone(device.group)
+                self.assertEqual(device.config.templates.count(), 0)
+
+        with self.subTest("group of another organization"):
+            org2 = self._create_org(name="org2", slug="org2")
+            dg3 = self._create_device_group(name="dg-3", organization=org2)
+            data["group"] = str(dg3.pk)
+            response = self.client.post(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("group", response.data)
+
+        with self.subTest("devices of multiple organizations"):
+            d3 = self._create_device(
+                name="device3", mac_address="00:11:22:33:44:77", organization=org2
+            )
+            data = {"devices": [str(d1.pk), str(d3.pk)], "group": None}
+            response = self.client.post(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("devices", response.data)
+
+        with self.subTest("non existing devices"):
+            data = {"devices": [str(uuid4())], "group": None}
+            response = self.client.post(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("devices", response.data)
+
+        with self.subTest("change permission is required"):
+            user = self._get_user()
+            OrganizationUser.objects.create(user=user, organization=org, is_admin=True)
+            self.client.force_login(user)
+            data = {"devices": [str(d1.pk)], "group": str(dg1.pk)}
+            user.user_permissions.add(
+                *Permission.objects.filter(codename__in=["add_device", "view_device"])
+            )
+            response = self.client.post(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 403)
+            # the permission to add devices is not required
+            user.user_permissions.set(
+                Permission.objects.filter(codename="change_device")
+            )
+            user = type(user).objects.get(pk=user.pk)
+            self.client.force_login(user)
+            response = self.client.post(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 202)
+            d1.refresh_from_db()
+            self.assertEqual(d1.group, dg1)
+            self._login()
+
+    def test_device_bulk_action_api(self):
+        org = self._get_org()
+        d1 = self._create_device(name="device1", organization=org)
+        self._create_config(device=d1)
+        d2 = self._create_device(
+            name="device2", mac_address="00:11:22:33:44:66", organization=org
+        )
+        path = reverse("config_api:device_bulk_action")
+        data = {"devices": [str(d1.pk), str(d2.pk)], "action": "deactivate"}
+
+        with self.subTest("devices are deactivated in chunks"):
+            with patch.object(DeviceBulkJob, "chunk_size", 1):
+                response = self.client.post(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data["operation"], "deactivate")
+            self.assertEqual(response.data["status"], "completed")
+            self.assertEqual(response.data["processed"], 2)
+            self.assertEqual(response.data["errors"], {})
+            for device in [d1, d2]:
+                device.refresh_from_db()
+                self.assertTrue(device.is_deactivated())
+            self.assertEqual(d1.config.status, "deactivating")
+
+        with self.subTest("devices are activated"):
+            data["action"] = "activate"
+            response = self.client.post(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data["processed"], 2)
+            for device in [d1, d2]:
+                device.refresh_from_db()
+                self.assertFalse(device.is_deactivated())
+
+        with self.subTest("active devices are not deleted without force"):
+            data["action"] = "delete"
+            response = self.client.post(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data["processed"], 0)
+            self.assertEqual(response.data["failed"], 2)
+            message = "The device must be deactivated prior to deletion"
+            self.assertEqual(
+                response.data["errors"], {str(d1.pk): message, str(d2.pk): message}
+            )
+            self.assertEqual(Device.objects.count(), 2)
+
+        with self.subTest("devices of other organizations"):
+            org2 = self._create_org(name="org2", slug="org2")
+            d3 = self._create_device(
+                name="device3", mac_address="00:11:22:33:44:77", organization=org2
+            )
+            administrator = self._create_administrator(organizations=[org])
+            self.client.force_login(administrator)
+            data["devices"] = [str(d1.pk), str(d3.pk)]
+            response = self.client.post(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("devices", response.data)
+            self._login()
+
+        with self.subTest("delete permission is required"):
+            user = self._get_user()
+            user.user_permissions.add(
+                *Permission.objects.filter(
+                    codename__in=["view_device", "change_device"]
+                )
+            )
+            OrganizationUser.objects.create(user=user, organization=org, is_admin=True)
+            self.client.force_login(user)
+            data["devices"] = [str(d1.pk), str(d2.pk)]
+            response = self.client.post(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 403)
+            self.assertEqual(Device.objects.filter(organization=org).count(), 2)
+
+        with self.subTest("add permission is not required"):
+            data["action"] = "deactivate"
+            response = self.client.post(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data["processed"], 2)
+            user.user_permissions.add(
+                *Permission.objects.filter(codename="delete_device")
+            )
+            user = type(user).objects.get(pk=user.pk)
+            self.client.force_login(user)
+            data["action"] = "activate"
+            response = self.client.post(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data["processed"], 2)
+
+        with self.subTest("active devices are deleted with force"):
+            data.update({"action": "delete", "force": True})
+            response = self.client.post(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data["processed"], 2)
+            self.assertEqual(Device.objects.filter(organization=org).count(), 0)
+            self._login()
+
+    def test_device_bulk_update_api(self):
+        org = self._get_org()
+        t1 = self._create_template(name="t1", organization=org)
+        t2 = self._create_template(
+            name="t2",
+            organization=org,
+            config={"general": {"timezone": "{{ tz }}"}},
+            default_values={"tz": "UTC"},
+        )
+        d1 = self._create_device(name="device1", organization=org)
+        c1 = self._create_config(device=d1, context={"tz": "UTC", "ssid": "test"})
+        c1.templates.add(t1)
+        d2 = self._create_device(
+            name="device2", mac_address="00:11:22:33:44:66", organization=org
+        )
+        c2 = self._create_config(device=d2)
+        c2.templates.add(t1)
+        path = reverse("config_api:device_bulk_update")
+
+        with self.subTest("changes are applied to the specified devices"):
+            data = {
+                "devices": [str(d1.pk), str(d2.pk)],
+                "changes": {
+                    "model": "TP-Link TL-WDR4300",
+                    "context": {"tz": "Europe/Rome", "ssid": None},
+                    "add_templates": [str(t2.pk)],
+                    "remove_templates": [str(t1.pk)],
+                },
+            }
+            response = self.client.patch(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, {"total": 2, "processed": 2})
+            for device in [d1, d2]:
+                device.refresh_from_db()
+                self.assertEqual(device.model, "TP-Link TL-WDR4300")
+                config = device.config
+                self.assertEqual(list(config.templates.all()), [t2])
+                self.assertEqual(config.context, {"tz": "Europe/Rome"})
+                self.assertEqual(config.status, "modified")
+                self.assertEqual(config.checksum_db, config.checksum)
+
+        with self.subTest("large changes are applied in the background"):
+            data = {"changes": {"notes": "bulk"}}
+            with patch.object(app_settings, "BULK_UPDATE_SYNC_MAX_DEVICES", 0):
+                response = self.client.patch(
+                    f"{path}?name=device1", data, content_type="application/json"
+                )
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data["operation"], "update")
+            self.assertEqual(response.data["status"], "completed")
+            self.assertEqual(response.data["total"], 1)
+            self.assertEqual(response.data["processed"], 1)
+            d1.refresh_from_db()
+            d2.refresh_from_db()
+            self.assertEqual(d1.notes, "bulk")
+            self.assertEqual(d2.notes, "")
+
+        with self.subTest("devices or filters are required"):
+            response = self.client.patch(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("devices", response.data)
+
+        with self.subTest("changes are required"):
+            data = {"devices": [str(d1.pk)], "changes": {}}
+            response = self.client.patch(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("changes", response.data)
+
+        with self.subTest("required templates cannot be removed"):
+            t2.required = True
+            t2.save()
+            data["changes"] = {"remove_templates": [str(t2.pk)]}
+            response = self.client.patch(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("changes", response.data)
+
+        with self.subTest("templates of other organizations"):
+            org2 = self._create_org(name="org2", slug="org2")
+            t3 = self._create_template(name="t3", organization=org2)
+            data["changes"] = {"add_templates": [str(t3.pk)]}
+            response = self.client.patch(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("changes", response.data)
+            self.assertFalse(d1.config.templates.filter(pk=t3.pk).exists())
+
+        with self.subTest("invalid changes are rolled back"):
+            vpn = self._create_vpn(organization=org)
+            vpn_templates = [
+                self._create_template(
+                    name=f"vpn{index}", type="vpn", vpn=vpn, organization=org
+                )
+                for index in range(2)
+            ]
+            data["changes"] = {
+                "notes": "rolled back",
+                "add_templates": [str(template.pk) for template in vpn_templates],
+            }
+            response = self.client.patch(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("changes", response.data)
+            d1.refresh_from_db()
+            self.assertEqual(d1.notes, "bulk")
+            self.assertFalse(d1.config.templates.filter(type="vpn").exists())
+
+        with self.subTest("invalid configuration variables are rolled back"):
+            data["changes"] = {
+                "notes": "rolled back",
+                "context": {"tz": "invalid"},
+            }
+            response = self.client.patch(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("changes", response.data)
+            d1.refresh_from_db()
+            self.assertEqual(d1.notes, "bulk")
+            c1.refresh_from_db()
+            self.assertEqual(c1.context, {"tz": "Europe/Rome"})
+
+        with self.subTest("devices of different organizations"):
+            d3 = self._create_device(
+                name="device3", mac_address="00:11:22:33:44:77", organization=org2
+            )
+            c3 = self._create_config(device=d3)
+            c3.templates.add(t3)
+            data = {
+                "devices": [str(d1.pk), str(d3.pk)],
+                "changes": {"add_templates": [str(t3.pk)]},
+            }
+            response = self.client.patch(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("changes", response.data)
+            data["changes"] = {"remove_templates": [str(t3.pk)]}
+            response = self.client.patch(path, data, content_type="application/json")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, {"total": 2, "processed": 2})
+            self.assertFalse(c3.templates.filter(pk=t3.pk).exists())
+
     def test_device_detail_api_change_config(self):
         org = self._get_org()
         vpn = self._create_vpn(organization=org)
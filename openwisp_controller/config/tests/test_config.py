@@ -4,6 +4,7 @@ from copy import deepcopy
 from io import StringIO
 from unittest.mock import Mock, call, patch
 
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.management import call_command
 from django.db import models
@@ -18,7 +19,7 @@ from openwisp_utils.tests import catch_signal
 from .. import settings as app_settings
 from .. import tasks
 from ..base.base import logger as base_config_logger
-from ..base.cache import CacheDependency
+from ..base.cache import CacheDependency, CacheDependencyIndex
 from ..handlers import invalidate_devicegroup_cache_change_handler
 from ..signals import config_backend_changed, config_modified, config_status_changed
 from .utils import (
@@ -167,6 +168,36 @@ class TestConfig(
         else:
             self.fail("ValidationError not raised")
 
+    def test_netjson_validation_cached(self):
+        template = Template(
+            name="test",
+            backend="netjsonconfig.OpenWrt",
+            config={"interfaces": [{"name": "eth0", "type": "ethernet"}]},
+        )
+        backend = template.backend_instance
+        cache.delete(
+            Template._get_validation_cache_key(backend, json.dumps(backend.config))
+        )
+        with patch.object(
+            OpenWrt, "validate", autospec=True, side_effect=OpenWrt.validate
+        ) as mocked_validate:
+            template.clean_netjsonconfig_backend(backend)
+        mocked_validate.assert_called_once()
+        # the successful validation is remembered
+        with patch.object(OpenWrt, "validate") as mocked_validate:
+            template.clean_netjsonconfig_backend(backend)
+        mocked_validate.assert_not_called()
+
+        with self.subTest("Invalid configurations are validated each time"):
+            template = Template(
+                name="invalid",
+                backend="netjsonconfig.OpenWrt",
+                config={"interfaces": {"invalid": True}},
+            )
+            for attempt in range(2):
+                with self.assertRaises(ValidationError):
+                    template.clean_netjsonconfig_backend(template.backend_instance)
+
     def test_json(self):
         dhcp = Template.objects.get(name="dhcp")
         radio = Template.objects.get(name="radio0")
@@ -959,7 +990,8 @@ class TestConfig(
                 device_group.save()
                 mocked_delay.assert_not_called()
             mocked_delay.assert_called_once_with(
-                {"device__group_id": str(device_group.id)}
+                {"device__group_id": str(device_group.id)},
+                variables=["interface_type"],
             )
 
     def test_organization_context_change_defers_checksum_invalidation_to_commit(self):
@@ -980,7 +1012,74 @@ class TestConfig(
                 org_settings.save()
                 mocked_delay.assert_not_called()
             mocked_delay.assert_called_once_with(
-                {"device__organization_id": str(org_settings.organization_id)}
+                {"device__organization_id": str(org_settings.organization_id)},
+                variables=["interface_type"],
+            )
+
+    def _get_files_config(self, contents):
+        return {"files": [{"path": "/etc/vars", "mode": "0644", "contents": contents}]}
+
+    def test_context_change_limited_to_configs_using_variables(self):
+        org = self._get_org()
+        t1 = self._create_template(
+            name="t1", organization=org, config=self._get_files_config("{{ name1 }}")
+        )
+        t2 = self._create_template(name="t2", organization=org)
+        c1 = self._create_config(organization=org)
+        c1.templates.add(t1)
+        c2 = self._create_config(
+            device=self._create_device(
+                name="device2", mac_address="00:11:22:33:44:56", organization=org
+            )
+        )
+        c2.templates.add(t2)
+        c3 = self._create_config(
+            device=self._create_device(
+                name="device3", mac_address="00:11:22:33:44:57", organization=org
+            ),
+            config=self._get_files_config("{{name2}}"),
+        )
+        queryset = Config.objects.filter(device__organization=org)
+
+        with self.subTest("variables used in templates"):
+            self.assertEqual(
+                list(Config._filter_by_variables(queryset, ["name1"])), [c1]
+            )
+
+        with self.subTest("variables used in the configuration"):
+            self.assertEqual(
+                list(Config._filter_by_variables(queryset, ["name2"])), [c3]
+            )
+
+        with self.subTest("unused variables"):
+            self.assertEqual(
+                list(Config._filter_by_variables(queryset, ["unused"])), []
+            )
+
+        with self.subTest("template variables cache is invalidated on save"):
+            self.assertEqual(t2.get_cached_variables(), set())
+            t2.config = self._get_files_config("{{ name1 }}")
+            t2.full_clean()
+            t2.save()
+            self.assertEqual(
+                set(Config._filter_by_variables(queryset, ["name1"])), {c1, c2}
+            )
+
+        with self.subTest("only changed variables are recomputed"):
+            org_settings = OrganizationConfigSettings.objects.create(
+                organization=org, context={"name1": "a", "name2": "b"}
+            )
+            with patch(
+                "openwisp_controller.config.tasks"
+                ".bulk_invalidate_config_get_cached_checksum.delay"
+            ) as mocked_delay:
+                with self.captureOnCommitCallbacks(execute=True):
+                    org_settings.context = {"name1": "a", "name3": "c"}
+                    org_settings.full_clean()
+                    org_settings.save()
+            mocked_delay.assert_called_once_with(
+                {"device__organization_id": str(org.pk)},
+                variables=["name2", "name3"],
             )
 
     def test_devicegroup_delete_invalidates_cache_deferred_to_commit(self):
@@ -1606,6 +1705,123 @@ class TestCacheDependency(CreateConfigTemplateMixin, CreateDeviceGroupMixin, Tes
         for item in data:
             self.assertEqual(set(item.keys()), expected_keys)
 
+    def test_dependency_index_lookup(self):
+        org = self._get_org()
+        group = self._create_device_group(organization=org)
+        t1 = self._create_template(name="t1", organization=org)
+        t2 = self._create_template(name="t2", organization=org)
+        c1 = self._create_config(organization=org)
+        c1.templates.add(t1, t2)
+        c2 = self._create_config(
+            device=self._create_device(
+                name="device2", mac_address="00:11:22:33:44:56", organization=org
+            )
+        )
+        template_index = CacheDependencyIndex.get_registered_index(
+            "template -> configs"
+        )
+        group_index = CacheDependencyIndex.get_registered_index(
+            "device group -> configs"
+        )
+        org_index = CacheDependencyIndex.get_registered_index("organization -> configs")
+
+        with self.subTest("dependents are materialized in the cache"):
+            with self.assertNumQueries(1):
+                self.assertEqual(template_index.lookup(t1.pk), [str(c1.pk)])
+            with self.assertNumQueries(0):
+                self.assertEqual(template_index.lookup(t1.pk), [str(c1.pk)])
+            self.assertEqual(set(org_index.lookup(org.pk)), {str(c1.pk), str(c2.pk)})
+            self.assertEqual(group_index.lookup(group.pk), [])
+
+        with self.subTest("m2m changes invalidate the entries"):
+            c2.templates.add(t1)
+            self.assertEqual(
+                set(template_index.lookup(t1.pk)), {str(c1.pk), str(c2.pk)}
+            )
+            c1.templates.remove(t1)
+            self.assertEqual(template_index.lookup(t1.pk), [str(c2.pk)])
+            c2.templates.clear()
+            self.assertEqual(template_index.lookup(t1.pk), [])
+
+        with self.subTest("group changes invalidate the entries"):
+            c1.device.group = group
+            c1.device.save()
+            self.assertEqual(group_index.lookup(group.pk), [str(c1.pk)])
+            Device.bulk_change_group([c2.device_id], group.pk)
+            self.assertEqual(
+                set(group_index.lookup(group.pk)), {str(c1.pk), str(c2.pk)}
+            )
+
+        with self.subTest("new configs invalidate the entries"):
+            c3 = self._create_config(
+                device=self._create_device(
+                    name="device3",
+                    mac_address="00:11:22:33:44:57",
+                    organization=org,
+                    group=group,
+                )
+            )
+            self.assertIn(str(c3.pk), org_index.lookup(org.pk))
+            self.assertIn(str(c3.pk), group_index.lookup(group.pk))
+
+        with self.subTest("oversized keys are not materialized"):
+            with patch.object(CacheDependencyIndex, "max_entries", 1):
+                org_index.invalidate([org.pk])
+                dependents = org_index.lookup(org.pk)
+                self.assertIsInstance(dependents, models.QuerySet)
+                self.assertEqual(
+                    set(Config.objects.filter(pk__in=dependents)), {c1, c2, c3}
+                )
+                self.assertIs(cache.get(org_index.get_cache_key(org.pk)), False)
+
+        with self.subTest("stats"):
+            stats = template_index.get_stats()
+            self.assertEqual(stats["keys"], 1)
+            self.assertEqual(stats["entries"], 1)
+            self.assertEqual(stats["max_fanout"], 1)
+            self.assertEqual(stats["materialized_keys"], 0)
+            template_index.lookup(t2.pk)
+            self.assertEqual(template_index.get_stats()["materialized_keys"], 1)
+
+        with self.assertRaises(KeyError):
+            CacheDependencyIndex.get_registered_index("unknown")
+
+    def test_template_delete_resolved_through_index(self):
+        template = self._create_template()
+        config = self._create_config()
+        config.templates.add(template)
+        index = CacheDependencyIndex.get_registered_index("template -> configs")
+        index.lookup(template.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(Config._resolve_template_dependency(template), [config])
+
+    def test_dependency_indexes_registered(self):
+        names = [index.name for index in CacheDependencyIndex.get_registered_indexes()]
+        self.assertEqual(
+            names,
+            [
+                "device group -> configs",
+                "organization -> configs",
+                "template -> configs",
+                "vpn -> clients",
+            ],
+        )
+
+    def test_print_cache_dependencies_index(self):
+        self._create_config()
+        out = StringIO()
+        call_command("print_cache_dependencies", index=True, stdout=out)
+        output = out.getvalue()
+        self.assertIn("template -> configs", output)
+        self.assertIn("vpn_id -> config_id", output)
+        self.assertIn("max fan-out", output)
+        self.assertIn("materialized keys", output)
+        out = StringIO()
+        call_command("print_cache_dependencies", index=True, format="json", stdout=out)
+        data = {item["name"]: item for item in json.loads(out.getvalue())}
+        self.assertEqual(data["organization -> configs"]["entries"], 1)
+        self.assertEqual(data["vpn -> clients"]["keys"], 0)
+
     def test_invalidate_devicegroup_cache_change_handler_bulk_list(self):
         device_id1, device_id2 = uuid.uuid4(), uuid.uuid4()
         with patch.object(tasks.invalidate_devicegroup_cache_change, "delay") as delay:
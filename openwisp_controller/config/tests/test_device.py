@@ -1,13 +1,21 @@
+import json
+import os
+import tempfile
 from hashlib import md5
+from io import StringIO
 from unittest import mock
 
+from django.contrib.admin.models import DELETION, LogEntry
 from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db.models.signals import post_save
 from django.test import TestCase, TransactionTestCase
 from swapper import load_model
 
 from openwisp_utils.tests import AssertNumQueriesSubTestMixin, catch_signal
 
 from .. import settings as app_settings
+from ..bulk_import import DeviceBulkImport
 from ..signals import (
     config_deactivated,
     config_deactivating,
@@ -26,6 +34,7 @@ Config = load_model("config", "Config")
 Device = load_model("config", "Device")
 DeviceGroup = load_model("config", "DeviceGroup")
 OrganizationConfigSettings = load_model("config", "OrganizationConfigSettings")
+Template = load_model("config", "Template")
 _original_context = app_settings.CONTEXT.copy()
 
 
@@ -482,6 +491,158 @@ class TestDevice(
         # Status must remain "deactivated" — no config push is initiated.
         self.assertEqual(device.config.status, "deactivated")
 
+    def test_manage_devices_group_templates_bulk(self):
+        org = self._get_org()
+        templates = [
+            self._create_template(
+                name=f"t{index}",
+                organization=org,
+                config={"interfaces": [{"name": f"eth{index}", "type": "ethernet"}]},
+            )
+            for index in range(4)
+        ]
+        t0, t1, t2, t3 = templates
+        old_group1 = self._create_device_group(name="old-group1", organization=org)
+        old_group1.templates.add(t0)
+        old_group2 = self._create_device_group(name="old-group2", organization=org)
+        old_group2.templates.add(t1, t2)
+        new_group = self._create_device_group(name="new-group", organization=org)
+        new_group.templates.add(t2, t3)
+        devices = [
+            self._create_device(
+                name=f"device{index}",
+                mac_address=f"00:11:22:33:44:0{index}",
+                organization=org,
+                group=group,
+            )
+            for index, group in enumerate([old_group1, old_group2, old_group2])
+        ]
+        for device in devices:
+            device.config.set_status_applied()
+        Device.objects.filter(organization=org).update(group=new_group)
+        device_ids = [device.pk for device in devices]
+
+        with catch_signal(config_modified) as handler:
+            Device.manage_devices_group_templates(
+                device_ids, [old_group1.pk, old_group2.pk, old_group2.pk], new_group.pk
+            )
+        self.assertEqual(handler.call_count, 3)
+        self.assertEqual(handler.call_args.kwargs["action"], "m2m_templates_changed")
+        for device in devices:
+            device.config.refresh_from_db()
+            self.assertEqual(list(device.config.templates.all()), [t2, t3])
+            self.assertEqual(device.config.status, "modified")
+            self.assertEqual(device.config.checksum_db, device.config.checksum)
+
+        with self.subTest("templates are restored if the config is invalid"):
+            Device.objects.filter(organization=org).update(group=old_group1)
+            with mock.patch.object(
+                Config,
+                "update_status_if_checksum_changed",
+                side_effect=ValueError("Invalid configuration"),
+            ), mock.patch("logging.Logger.exception") as mocked_logger:
+                Device.manage_devices_group_templates(
+                    device_ids, [new_group.pk] * 3, old_group1.pk
+                )
+            self.assertEqual(mocked_logger.call_count, 3)
+            for device in devices:
+                self.assertEqual(list(device.config.templates.all()), [t2, t3])
+
+    def test_bulk_manage_group_templates_validation(self):
+        org = self._get_org()
+        org2 = self._create_org(name="org2", slug="org2")
+        template = self._create_template(name="t1", organization=org)
+        other_org_template = self._create_template(name="t2", organization=org2)
+        config = self._create_config(device=self._create_device(organization=org))
+        config.templates.add(template)
+        with mock.patch("logging.Logger.warning") as mocked_logger:
+            Config.bulk_manage_group_templates(
+                [config.pk],
+                Template.objects.filter(pk=other_org_template.pk),
+                Template.objects.filter(pk=template.pk),
+            )
+        mocked_logger.assert_called_once()
+        # the config is left unchanged
+        self.assertEqual(list(config.templates.all()), [template])
+
+    def test_bulk_apply_changes(self):
+        org = self._get_org()
+        org2 = self._create_org(name="org2", slug="org2")
+        devices = [
+            self._create_device(
+                name=f"device{index}",
+                mac_address=f"00:11:22:33:44:5{index}",
+                organization=org,
+            )
+            for index in range(3)
+        ]
+        device_ids = [device.pk for device in devices]
+
+        with self.subTest("field values are validated"):
+            with self.assertRaises(ValidationError) as context_manager:
+                Device.bulk_apply_changes(device_ids, fields={"model": "x" * 65})
+            self.assertIn("model", context_manager.exception.message_dict)
+
+        with self.subTest("templates of other organizations"):
+            template = self._create_template(name="t1", organization=org2)
+            with self.assertRaises(ValidationError):
+                Device.bulk_apply_changes(
+                    device_ids,
+                    fields={"notes": "rolled back"},
+                    add_templates=[template.pk],
+                )
+            self.assertFalse(Device.objects.filter(notes="rolled back").exists())
+
+        with self.subTest("fields are changed without saving each device"):
+            with catch_signal(post_save) as handler, mock.patch.object(
+                Device, "full_clean"
+            ) as mocked_full_clean, mock.patch.object(Device, "save") as mocked_save:
+                processed = Device.bulk_apply_changes(
+                    device_ids, fields={"model": "TP-Link", "notes": "bulk"}
+                )
+            self.assertEqual(processed, 3)
+            mocked_full_clean.assert_not_called()
+            mocked_save.assert_not_called()
+            self.assertEqual(handler.call_count, 3)
+            self.assertEqual(
+                Device.objects.filter(model="TP-Link", notes="bulk").count(), 3
+            )
+
+    def test_bulk_delete_admin_log(self):
+        org = self._get_org()
+        admin = self._get_admin()
+        deactivated_device = self._create_device(name="device1", organization=org)
+        deactivated_device.deactivate()
+        active_device = self._create_device(
+            name="device2", mac_address="00:11:22:33:44:66", organization=org
+        )
+        errors = Device.bulk_delete(
+            [deactivated_device.pk, active_device.pk], user_id=str(admin.pk)
+        )
+        self.assertEqual(list(errors.keys()), [str(active_device.pk)])
+        self.assertFalse(Device.objects.filter(pk=deactivated_device.pk).exists())
+        # only the devices which have been deleted are logged
+        log_entry = LogEntry.objects.get(action_flag=DELETION)
+        self.assertEqual(log_entry.object_id, str(deactivated_device.pk))
+        self.assertEqual(log_entry.object_repr, "device1")
+        self.assertEqual(log_entry.user, admin)
+
+    def test_manage_devices_group_templates_new_config(self):
+        org = self._get_org()
+        template = self._create_template(name="t1", organization=org)
+        group = self._create_device_group(organization=org)
+        group.templates.add(template)
+        device = self._create_device(organization=org)
+        self.assertFalse(Config.objects.filter(device=device).exists())
+        Device.objects.filter(pk=device.pk).update(group=group)
+        with catch_signal(config_modified) as handler:
+            Device.manage_devices_group_templates(device.pk, None, group.pk)
+        # like the configs created by the other code paths,
+        # config_modified is not sent for the config just created
+        handler.assert_not_called()
+        device.refresh_from_db()
+        self.assertEqual(list(device.config.templates.all()), [template])
+
     @mock.patch.object(app_settings, "WHOIS_CONFIGURED", True)
     def test_changed_checked_fields_no_duplicates(self):
         """Ensure `_changed_checked_fields` contains `last_ip` only once.
@@ -583,6 +744,92 @@ class TestDevice(
         self.assertEqual(device.config.context, {"ssid": "test"})
         self.assertEqual(device.config.config, {"general": {}})
 
+    def _get_import_row(self, org, index, **kwargs):
+        row = {
+            "name": f"imported{index}",
+            "mac_address": f"00:11:22:33:44:0{index}",
+            "organization_id": str(org.pk),
+        }
+        row.update(kwargs)
+        return row
+
+    def test_bulk_import(self):
+        org = self._get_org()
+        template = self._create_template(name="t1", organization=org)
+        group_template = self._create_template(name="group", organization=org)
+        group = self._create_device_group(organization=org)
+        group.templates.add(group_template)
+        rows = [
+            self._get_import_row(
+                org,
+                1,
+                config_backend="netjsonconfig.OpenWrt",
+                config_data={"general": {}},
+                config_templates=str(template.pk),
+            ),
+            # the group templates are applied
+            # also when no configuration is given
+            self._get_import_row(org, 2, group_id=str(group.pk)),
+            self._get_import_row(org, 3),
+        ]
+        self.assertTrue(DeviceBulkImport(rows).validate())
+        job = DeviceBulkImport(rows).save()
+        self.assertEqual(job.get_progress()["processed"], 3)
+        device1 = Device.objects.get(name="imported1")
+        self.assertEqual(list(device1.config.templates.all()), [template])
+        self.assertEqual(device1.config.checksum_db, device1.config.checksum)
+        self.assertEqual(
+            device1.key, device1.generate_key(org.config_settings.shared_secret)
+        )
+        device2 = Device.objects.get(name="imported2")
+        self.assertEqual(device2.config.backend, app_settings.DEFAULT_BACKEND)
+        self.assertEqual(list(device2.config.templates.all()), [group_template])
+        self.assertFalse(Device.objects.get(name="imported3")._has_config())
+
+        with self.subTest("invalid rows"):
+            rows = [
+                self._get_import_row(org, 1),
+                self._get_import_row(org, 4, config_data="{invalid"),
+                self._get_import_row(org, 5, mac_address="invalid"),
+            ]
+            device_import = DeviceBulkImport(rows)
+            self.assertFalse(device_import.validate())
+            self.assertEqual(len(device_import.errors), 1)
+            self.assertIn("Row 3: mac_address", device_import.errors[0])
+            with self.assertRaises(ValidationError):
+                device_import.save()
+            self.assertEqual(Device.objects.count(), 3)
+
+        with self.subTest("device limit"):
+            org.config_limits.device_limit = 4
+            org.config_limits.save()
+            device_import = DeviceBulkImport(
+                [self._get_import_row(org, 4), self._get_import_row(org, 5)]
+            )
+            self.assertFalse(device_import.validate())
+            self.assertIn("maximum amount of allowed devices", device_import.errors[0])
+
+    def test_import_devices_command(self):
+        org = self._get_org()
+        rows = [self._get_import_row(org, 1), self._get_import_row(org, 2)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "devices.ndjson")
+            with open(path, "w") as file:
+                file.write("\n".join(json.dumps(row) for row in rows))
+            stdout = StringIO()
+            call_command("import_devices", path, stdout=stdout)
+            self.assertIn("Imported 2 devices", stdout.getvalue())
+            self.assertEqual(Device.objects.filter(organization=org).count(), 2)
+
+            with self.subTest("invalid rows are reported"):
+                with self.assertRaises(CommandError) as context:
+                    call_command("import_devices", path)
+                self.assertIn("Row 1: mac_address", str(context.exception))
+
+            with self.subTest("unknown format"):
+                with self.assertRaises(CommandError):
+                    call_command("import_devices", os.path.join(directory, "file"))
+
 
 class TestTransactionDevice(
     CreateConfigTemplateMixin,
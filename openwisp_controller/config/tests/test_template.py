@@ -1,22 +1,31 @@
 import uuid
+from io import StringIO
 from unittest import mock
 
 from celery.exceptions import SoftTimeLimitExceeded
+from django.contrib.admin.models import LogEntry
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.management import CommandError, call_command
 from django.db import transaction
 from django.test import TestCase, TransactionTestCase
 from netjsonconfig import OpenWrt
 from netjsonconfig.exceptions import ValidationError as NetjsonconfigValidationError
+from reversion.models import Version
 from swapper import load_model
 
 from openwisp_utils.tests import catch_signal
 
 from .. import settings as app_settings
+from ..base.template import logger as template_logger
 from ..signals import config_modified, config_status_changed
 from ..tasks import auto_add_template_to_existing_configs
 from ..tasks import logger as task_logger
-from ..tasks import update_template_related_config_status
+from ..tasks import (
+    update_template_related_config_status,
+    update_template_related_config_status_chunk,
+)
 from .utils import CreateConfigTemplateMixin, TestVpnX509Mixin
 
 Config = load_model("config", "Config")
@@ -189,6 +198,100 @@ class TestTemplate(CreateConfigTemplateMixin, TestVpnX509Mixin, TestCase):
         self.assertNotEqual(c.pk, t.pk)
         self.assertFalse(c.default)
 
+    def _create_bulk_clone_templates(self):
+        org1 = self._get_org()
+        org2 = self._create_org(name="org2", slug="org2")
+        vpn1 = self._create_vpn(name="vpn1", organization=org1)
+        vpn2 = self._create_vpn(name="vpn1", organization=org2, host="vpn2.test.com")
+        t1 = self._create_template(name="t1", organization=org1, required=True)
+        t1.tags.add("mesh", "4G")
+        t2 = self._create_template(
+            name="t2", organization=org1, type="vpn", vpn=vpn1, auto_cert=True
+        )
+        # name already taken in the destination organization
+        self._create_template(name="t2", organization=org2)
+        return org1, org2, t1, t2, vpn2
+
+    def test_bulk_clone(self):
+        org1, org2, t1, t2, vpn2 = self._create_bulk_clone_templates()
+        user = User.objects.create_superuser(
+            username="admin", password="tester", email="admin@admin.com"
+        )
+        with self.captureOnCommitCallbacks() as callbacks:
+            clones = Template.bulk_clone(
+                Template.objects.filter(organization=org1),
+                organization=org2,
+                user=user,
+            )
+        self.assertEqual(len(clones), 2)
+        c1 = Template.objects.get(organization=org2, name="t1")
+        c2 = Template.objects.get(organization=org2, name="t2 (Clone)")
+        self.assertNotEqual(c1.pk, t1.pk)
+        self.assertEqual(c1.config, t1.config)
+        self.assertTrue(c1.required)
+        self.assertTrue(c1.default)
+        self.assertEqual(set(c1.tags.names()), {"mesh", "4G"})
+        self.assertEqual(set(t1.tags.names()), {"mesh", "4G"})
+        self.assertEqual(c2.vpn, vpn2)
+        self.assertEqual(c2.type, "vpn")
+        # the configuration of the clone uses the VPN of the organization
+        config = self._create_config(
+            device=self._create_device(name="clone-vpn", organization=org2)
+        )
+        config.templates.add(c2)
+        rendered = config.get_backend_instance().render()
+        self.assertIn("vpn2.test.com", rendered)
+        self.assertNotIn("vpn1.test.com", rendered)
+        self.assertNotIn(t2.vpn.pk.hex, rendered)
+        self.assertEqual(c2.tags.count(), 0)
+        self.assertEqual(
+            LogEntry.objects.filter(
+                user=user, object_id__in=[str(c1.pk), str(c2.pk)]
+            ).count(),
+            2,
+        )
+        self.assertEqual(Version.objects.get_for_object(c1).count(), 1)
+        self.assertEqual(
+            Version.objects.get_for_object(c1).first().revision,
+            Version.objects.get_for_object(c2).first().revision,
+        )
+        # the required clone is added to the existing configs
+        self.assertEqual(len(callbacks), 1)
+
+        with self.subTest("VPN not available in the destination organization"):
+            org3 = self._create_org(name="org3", slug="org3")
+            with self.assertRaises(ValidationError):
+                Template.bulk_clone([t2], organization=org3)
+            self.assertFalse(Template.objects.filter(organization=org3).exists())
+
+        with self.subTest("clone as shared"):
+            clones = Template.bulk_clone([t1])
+            self.assertEqual(clones[0].name, "t1 (Clone)")
+            self.assertIsNone(clones[0].organization)
+
+    def test_clone_templates_command(self):
+        org1, org2, t1, t2, vpn2 = self._create_bulk_clone_templates()
+        out = StringIO()
+        call_command("clone_templates", "--from", org1.slug, "--to", "org2", stdout=out)
+        self.assertIn("Cloned 2 templates.", out.getvalue())
+        self.assertEqual(Template.objects.filter(organization=org2).count(), 3)
+
+        with self.subTest("single template"):
+            call_command(
+                "clone_templates", "--template", str(t1.pk), "--to", "org2", stdout=out
+            )
+            self.assertTrue(
+                Template.objects.filter(organization=org2, name="t1 (Clone)").exists()
+            )
+
+        with self.subTest("invalid options"):
+            with self.assertRaises(CommandError):
+                call_command("clone_templates", "--from", org1.slug)
+            with self.assertRaises(CommandError):
+                call_command("clone_templates", "--to", "org2")
+            with self.assertRaises(CommandError):
+                call_command("clone_templates", "--from", "wrong", "--to", "org2")
+
     def test_duplicate_files_in_template(self):
         try:
             self._create_template(
@@ -527,14 +630,14 @@ class TestTemplate(CreateConfigTemplateMixin, TestVpnX509Mixin, TestCase):
                 template._auto_add_to_existing_configs()
             mocked_atomic.assert_not_called()
 
-        with self.subTest("config.templates.add(template) raises error"):
+        with self.subTest("updating the status of the config raises error"):
             config = self._create_config(device=self._create_device(name="test-device"))
             template.required = True
             template.full_clean()
             template.save()
             with mock.patch.object(
-                Config.templates.related_manager_cls,
-                "add",
+                Config,
+                "update_status_if_checksum_changed",
                 side_effect=ValueError("Incompatible template"),
             ), mock.patch("logging.Logger.exception") as mocked_logger:
                 template._auto_add_to_existing_configs()
@@ -542,6 +645,101 @@ class TestTemplate(CreateConfigTemplateMixin, TestVpnX509Mixin, TestCase):
                 f"Failed to add template {template.pk} to config {config.pk}:"
                 " Incompatible template"
             )
+            self.assertNotIn(template, config.templates.all())
+
+    def test_auto_add_to_existing_configs_bulk(self):
+        org = self._get_org()
+        t1 = self._create_template(name="t1", organization=org, default=True)
+        configs = []
+        for index in range(3):
+            device = self._create_device(
+                name=f"device{index}", mac_address=f"00:11:22:33:44:0{index}"
+            )
+            configs.append(self._create_config(device=device))
+        for config in configs:
+            config.set_status_applied()
+        t2 = self._create_template(
+            name="t2",
+            organization=org,
+            config={"interfaces": [{"name": "eth1", "type": "ethernet"}]},
+        )
+        Template.objects.filter(pk=t2.pk).update(required=True, default=True)
+        t2.refresh_from_db()
+
+        with catch_signal(config_modified) as handler:
+            with mock.patch.object(Template, "_auto_add_chunk_size", 2):
+                t2._auto_add_to_existing_configs()
+        self.assertEqual(handler.call_count, 3)
+        self.assertEqual(handler.call_args.kwargs["action"], "m2m_templates_changed")
+        for config in configs:
+            config.refresh_from_db()
+            self.assertEqual(config.status, "modified")
+            self.assertEqual(list(config.templates.all()), [t1, t2])
+            self.assertEqual(config.checksum_db, config.checksum)
+
+        with self.subTest("configs having the template already are skipped"):
+            with self.assertNumQueries(1):
+                t2._auto_add_to_existing_configs()
+
+    def test_auto_add_to_existing_configs_validation(self):
+        org = self._get_org()
+        valid = self._create_config(
+            device=self._create_device(name="valid", organization=org)
+        )
+        invalid = self._create_config(
+            device=self._create_device(
+                name="invalid", mac_address="00:11:22:33:44:66", organization=org
+            ),
+            context={"iface_type": "invalid"},
+        )
+        template = self._create_template(
+            organization=org,
+            config={"interfaces": [{"name": "eth1", "type": "{{ iface_type }}"}]},
+            default_values={"iface_type": "ethernet"},
+        )
+        Template.objects.filter(pk=template.pk).update(default=True)
+        template.refresh_from_db()
+        with mock.patch("logging.Logger.exception") as mocked_logger:
+            template._auto_add_to_existing_configs()
+        mocked_logger.assert_called_once()
+        self.assertIn(template, valid.templates.all())
+        self.assertNotIn(template, invalid.templates.all())
+
+        with self.subTest("configs which do not match are not changed"):
+            other_backend = self._create_config(
+                device=self._create_device(
+                    name="other", mac_address="00:11:22:33:44:77", organization=org
+                ),
+                backend="netjsonconfig.OpenWisp",
+            )
+            template._add_to_configs([other_backend.pk])
+            self.assertNotIn(template, other_backend.templates.all())
+
+    def test_auto_add_vpn_template_to_existing_configs(self):
+        org = self._get_org()
+        vpn = self._create_vpn()
+        config = self._create_config(organization=org)
+        template = self._create_template(
+            name="vpn-test", type="vpn", vpn=vpn, auto_cert=True
+        )
+        Template.objects.filter(pk=template.pk).update(default=True)
+        template.refresh_from_db()
+        template._auto_add_to_existing_configs()
+        self.assertIn(template, config.templates.all())
+        self.assertEqual(config.vpnclient_set.count(), 1)
+        vpnclient = config.vpnclient_set.first()
+        self.assertEqual(vpnclient.template, template)
+        self.assertIsNotNone(vpnclient.cert)
+        config.refresh_from_db()
+        self.assertEqual(config.checksum_db, config.checksum)
+
+        with self.subTest("templates of the same VPN server are not added"):
+            other = self._create_template(name="vpn-test2", type="vpn", vpn=vpn)
+            Template.objects.filter(pk=other.pk).update(default=True)
+            other.refresh_from_db()
+            other._auto_add_to_existing_configs()
+            self.assertNotIn(other, config.templates.all())
+            self.assertEqual(config.vpnclient_set.count(), 1)
 
     @mock.patch.object(task_logger, "warning")
     def test_auto_add_template_to_existing_configs_task_failure(self, mocked_warning):
@@ -586,7 +784,7 @@ class TestTemplateTransaction(
             with catch_signal(config_status_changed) as handler:
                 t.config["interfaces"][0]["name"] = "eth2"
                 t.full_clean()
-                with self.assertNumQueries(13):
+                with self.assertNumQueries(14):
                     t.save()
                 c.refresh_from_db()
                 handler.assert_not_called()
@@ -806,6 +1004,110 @@ class TestTemplateTransaction(
         update_template_related_config_status.delay(uuid.uuid4())
         mocked_warning.assert_called_once()
 
+    def test_update_related_config_status_chunks(self):
+        template = self._create_template()
+        configs = []
+        for index in range(3):
+            device = self._create_device(
+                name=f"device{index}", mac_address=f"00:11:22:33:44:0{index}"
+            )
+            config = self._create_config(device=device)
+            config.templates.add(template)
+            config.set_status_applied()
+            configs.append(config)
+        template.config["interfaces"][0]["name"] = "eth1"
+        template.full_clean()
+
+        chunk_task_delay = update_template_related_config_status_chunk.delay
+        with mock.patch.object(
+            Template, "_related_config_status_chunk_size", 2
+        ), mock.patch.object(
+            update_template_related_config_status_chunk,
+            "delay",
+            wraps=chunk_task_delay,
+        ) as mocked_chunk_task, mock.patch.object(
+            template_logger, "info"
+        ) as mocked_info:
+            with catch_signal(config_modified) as handler:
+                template.save()
+        self.assertEqual(mocked_chunk_task.call_count, 2)
+        config_ids = sorted(str(config.pk) for config in configs)
+        mocked_chunk_task.assert_any_call(
+            template_pk=str(template.pk),
+            first_config_id=config_ids[0],
+            last_config_id=config_ids[1],
+        )
+        mocked_chunk_task.assert_any_call(
+            template_pk=str(template.pk),
+            first_config_id=config_ids[2],
+            last_config_id=config_ids[2],
+        )
+        self.assertEqual(handler.call_count, 3)
+        self.assertEqual(mocked_info.call_count, 2)
+        self.assertIn("Finished updating", mocked_info.call_args.args[0])
+        self.assertIsNone(cache.get(template._related_config_status_cache_key))
+        for config in configs:
+            config.refresh_from_db()
+            self.assertEqual(config.status, "modified")
+
+        with self.subTest("single chunk is processed without spawning tasks"):
+            template.config["interfaces"][0]["name"] = "eth2"
+            template.full_clean()
+            with mock.patch.object(
+                update_template_related_config_status_chunk, "delay"
+            ) as mocked_chunk_task:
+                template.save()
+            mocked_chunk_task.assert_not_called()
+
+    def test_update_related_config_status_coalesce_signals(self):
+        template = self._create_template()
+        configs = []
+        for index in range(2):
+            device = self._create_device(
+                name=f"device{index}", mac_address=f"00:11:22:33:44:0{index}"
+            )
+            config = self._create_config(device=device)
+            config.templates.add(template)
+            config.set_status_applied()
+            configs.append(config)
+        template.config["interfaces"][0]["name"] = "eth1"
+        template.full_clean()
+        config_ids = sorted(str(config.pk) for config in configs)
+
+        def reset_debounce():
+            for config in configs:
+                config._delete_config_modified_timeout_cache()
+
+        reset_debounce()
+
+        with self.subTest("signal is sent once for each config"):
+            with catch_signal(config_modified) as handler:
+                template.save()
+            self.assertEqual(handler.call_count, 2)
+
+        reset_debounce()
+
+        with self.subTest("configs reached again are not signaled twice"):
+            with catch_signal(config_modified) as handler:
+                template._update_related_config_status_chunk(*config_ids)
+            handler.assert_not_called()
+
+        reset_debounce()
+
+        with self.subTest("signal is sent again after a new change"):
+            template.config["interfaces"][0]["name"] = "eth2"
+            template.full_clean()
+            with catch_signal(config_modified) as handler:
+                template.save()
+            self.assertEqual(handler.call_count, 2)
+
+    @mock.patch.object(task_logger, "warning")
+    def test_chunk_task_failure(self, mocked_warning):
+        update_template_related_config_status_chunk.delay(
+            uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        )
+        mocked_warning.assert_called_once()
+
     @mock.patch.object(
         Template, "_update_related_config_status", side_effect=SoftTimeLimitExceeded
     )
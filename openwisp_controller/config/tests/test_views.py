@@ -70,7 +70,7 @@ class TestViews(
             inactive_t,
         ) = self._create_template_test_data()
         self._login()
-        with self.assertNumQueries(3):
+        with self.assertNumQueries(4):
             response = self.client.get(
                 reverse("admin:get_relevant_templates", args=[org1.pk])
             )
@@ -92,7 +92,7 @@ class TestViews(
             default=False,
             required=True,
         )
-        with self.assertNumQueries(3):
+        with self.assertNumQueries(4):
             response = self.client.get(
                 reverse("admin:get_relevant_templates", args=[org1.pk])
             )
@@ -130,7 +130,7 @@ class TestViews(
         )
         self._login()
 
-        with self.assertNumQueries(3):
+        with self.assertNumQueries(4):
             response = self.client.get(
                 reverse("admin:get_relevant_templates", args=[org1.pk]),
                 {"backend": "netjsonconfig.OpenWrt"},
@@ -245,6 +245,86 @@ class TestViews(
         )
         self.assertEqual(response.status_code, 400)
 
+    def test_get_relevant_templates_search_and_pagination(self):
+        org1 = self._create_org(name="org1")
+        device = self._create_device(organization=org1)
+        templates = [
+            self._create_template(organization=org1, name=f"tpl{i}") for i in range(5)
+        ]
+        self._create_template(organization=org1, name="unrelated")
+        config = self._create_config(device=device)
+        config.templates.add(templates[4])
+        url = reverse("admin:get_relevant_templates", args=[org1.pk])
+        params = {"backend": "netjsonconfig.OpenWrt", "config_id": config.pk}
+        self._login()
+
+        with self.subTest("Search by name"):
+            response = self.client.get(url, {**params, "search": "tpl"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()), 5)
+            self.assertNotIn("unrelated", [t["name"] for t in response.json().values()])
+
+        with self.subTest("Selected templates come first in the first page"):
+            response = self.client.get(url, {**params, "page_size": 2})
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertEqual(data["count"], 6)
+            self.assertEqual(data["next"], 2)
+            self.assertEqual(
+                list(data["results"].keys()),
+                [str(templates[4].pk), str(templates[0].pk)],
+            )
+            self.assertTrue(data["results"][str(templates[4].pk)]["selected"])
+
+        with self.subTest("Last page"):
+            response = self.client.get(url, {**params, "page_size": 2, "page": 3})
+            data = response.json()
+            self.assertEqual(data["next"], None)
+            self.assertEqual(
+                list(data["results"].keys()),
+                [str(templates[3].pk), str(Template.objects.get(name="unrelated").pk)],
+            )
+
+        with self.subTest("Invalid pagination parameters"):
+            response = self.client.get(url, {**params, "page_size": "wrong"})
+            self.assertEqual(response.status_code, 400)
+            response = self.client.get(url, {**params, "page_size": 2, "page": 0})
+            self.assertEqual(response.status_code, 400)
+
+    def test_get_relevant_templates_etag(self):
+        org1 = self._create_org(name="org1")
+        template = self._create_template(organization=org1, name="t1")
+        url = reverse("admin:get_relevant_templates", args=[org1.pk])
+        params = {"backend": "netjsonconfig.OpenWrt"}
+        self._login()
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("ETag", response)
+        self.assertIn("no-cache", response["Cache-Control"])
+        etag = response["ETag"]
+
+        with self.subTest("Unchanged templates"):
+            # the templates are not fetched
+            with self.assertNumQueries(3):
+                response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response["ETag"], etag)
+
+        with self.subTest("Template modified"):
+            template.name = "changed"
+            template.full_clean()
+            template.save()
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response["ETag"], etag)
+            etag = response["ETag"]
+
+        with self.subTest("Template added"):
+            self._create_template(organization=org1, name="t2")
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()), 2)
+
     def test_get_default_values_authorization(self):
         org1 = self._get_org()
         org1_template = self._create_template(
@@ -17,6 +17,7 @@ from openwisp_utils.tests import catch_signal
 
 from ...vpn_backends import OpenVpn
 from .. import settings as app_settings
+from ..base.cache import CacheDependencyIndex
 from ..exceptions import ZeroTierIdentityGenerationError
 from ..settings import API_TASK_RETRY_OPTIONS
 from ..signals import config_modified, vpn_peers_changed, vpn_server_modified
@@ -569,6 +570,9 @@ class TestVpnTransaction(BaseTestVpn, TestWireguardVpnMixin, TransactionTestCase
         device, vpn, _ = self._create_wireguard_vpn_template()
         config = Config.objects.get(pk=device.config.pk)
         old_checksum_db = config.checksum_db
+        # the clients of the VPN server are materialized in the cache
+        # when they are looked up for the first time
+        CacheDependencyIndex.get_registered_index("vpn -> clients").lookup(vpn.pk)
         with catch_signal(config_modified) as mocked_config_modified:
             # select_related on the client queryset keeps this bounded: dropping
             # it reintroduces the per-client N+1 and increases the query count.
@@ -1,11 +1,13 @@
+import hashlib
 import json
 from collections import OrderedDict
 from copy import deepcopy
 from uuid import UUID
 
-from django.db.models import Q
+from django.db.models import Count, Max, Q
 from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils.module_loading import import_string
 from django.utils.translation import gettext as _
 from django.views.decorators.http import last_modified
@@ -19,6 +21,8 @@ Config = load_model("config", "Config")
 DeviceGroup = load_model("config", "DeviceGroup")
 OrganizationConfigSettings = load_model("config", "OrganizationConfigSettings")
 
+RELEVANT_TEMPLATES_MAX_PAGE_SIZE = 100
+
 
 def _get_relevant_templates_dict(queryset, selected=False):
     relevant_templates = OrderedDict()
@@ -33,9 +37,46 @@ def _get_relevant_templates_dict(queryset, selected=False):
     return relevant_templates
 
 
+def _get_page_params(request):
+    """
+    returns the ``page`` and ``page_size`` query parameters,
+    ``page_size`` is ``None`` when pagination is not requested
+    """
+    page = int(request.GET.get("page", 1))
+    page_size = request.GET.get("page_size", None)
+    if page_size is None:
+        return page, None
+    page_size = min(int(page_size), RELEVANT_TEMPLATES_MAX_PAGE_SIZE)
+    if page < 1 or page_size < 1:
+        raise ValueError("page and page_size must be positive integers")
+    return page, page_size
+
+
+def _get_relevant_templates_etag(request, stats, selected_templates):
+    modified = stats["modified"].isoformat() if stats["modified"] else ""
+    key = "|".join(
+        [
+            request.get_full_path(),
+            str(stats["count"]),
+            modified,
+            ",".join(str(template.pk) for template in selected_templates),
+        ]
+    )
+    return f'"{hashlib.md5(key.encode()).hexdigest()}"'
+
+
 def get_relevant_templates(request, organization_id):
     """
     returns default templates of specified organization
+
+    Optional query parameters:
+        search: filters templates by name
+        page_size: paginates the results (selected templates come first)
+        page: number of the page to return (defaults to 1)
+
+    The response carries an ``ETag`` derived from the number of
+    relevant templates and their most recent modification date,
+    requests sending a matching ``If-None-Match`` get a 304 response.
     """
     backend = request.GET.get("backend", None)
     config_id = request.GET.get("config_id", None)
@@ -75,10 +116,18 @@ def get_relevant_templates(request, organization_id):
     else:
         filter_options.update(required=False, default=False)
 
+    search = request.GET.get("search", None)
+    if search:
+        filter_options.update(name__icontains=search)
+    try:
+        page, page_size = _get_page_params(request)
+    except ValueError:
+        return HttpResponseBadRequest(_("Invalid pagination parameters."))
+
     queryset = (
         Template.objects.filter(**filter_options)
         .filter(org_filters)
-        .order_by("-required", "-default")
+        .order_by("-required", "-default", "name")
         .only("id", "name", "backend", "default", "required")
     )
     selected_templates = []
@@ -106,13 +155,42 @@ def get_relevant_templates(request, organization_id):
         except (DeviceGroup.DoesNotExist, ValueError):
             pass
 
-    relevant_templates = _get_relevant_templates_dict(selected_templates, selected=True)
-    relevant_templates.update(
-        _get_relevant_templates_dict(
-            queryset.exclude(pk__in=relevant_templates.keys()), selected=False
+    selected_templates = list(selected_templates)
+    # the selected templates are a subset of the queryset, hence the
+    # number of templates and the last modification date of the set
+    # are enough to tell whether the response would change
+    stats = queryset.aggregate(count=Count("pk"), modified=Max("modified"))
+    etag = _get_relevant_templates_etag(request, stats, selected_templates)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        relevant_templates = _get_relevant_templates_dict(
+            selected_templates, selected=True
         )
-    )
-    return JsonResponse(relevant_templates)
+        unselected_templates = queryset.exclude(pk__in=relevant_templates.keys())
+        if page_size:
+            start = (page - 1) * page_size
+            end = start + page_size
+            relevant_templates = _get_relevant_templates_dict(
+                selected_templates[start:end], selected=True
+            )
+            start = max(start - len(selected_templates), 0)
+            end = max(end - len(selected_templates), 0)
+            unselected_templates = unselected_templates[start:end]
+        relevant_templates.update(
+            _get_relevant_templates_dict(unselected_templates, selected=False)
+        )
+        if page_size:
+            relevant_templates = {
+                "count": stats["count"],
+                "next": page + 1 if page * page_size < stats["count"] else None,
+                "results": relevant_templates,
+            }
+        response = JsonResponse(relevant_templates)
+    response["ETag"] = etag
+    # browsers must revalidate the response on each request,
+    # which costs only one query when the templates did not change
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 ALL_BACKENDS = BACKENDS + VPN_BACKENDS
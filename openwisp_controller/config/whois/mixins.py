@@ -1,5 +1,10 @@
+from rest_framework.serializers import ListSerializer
+from swapper import load_model
+
+from ...serializers import is_field_requested
 from .. import settings as app_settings
 from .serializers import WHOISSerializer
+from .service import WHOISService
 
 
 class WHOISMixin:
@@ -7,14 +12,41 @@ class WHOISMixin:
 
     serializer_class = WHOISSerializer
 
+    def _get_whois_info_by_ip(self):
+        """
+        When many devices are serialized at once, the WHOIS
+        information of all of them is loaded with a single query
+        """
+        if not hasattr(self, "_whois_info_by_ip"):
+            WHOISInfo = load_model("config", "WHOISInfo")
+            ip_addresses = {
+                device.last_ip
+                for device in self.parent.instance
+                if WHOISService.is_valid_public_ip_address(device.last_ip)
+            }
+            self._whois_info_by_ip = {
+                whois_obj.ip_address: whois_obj
+                for whois_obj in WHOISInfo.objects.filter(ip_address__in=ip_addresses)
+            }
+        return self._whois_info_by_ip
+
     def get_whois_info(self, obj):
-        whois_obj = obj.whois_service.get_device_whois_info()
+        if isinstance(self.parent, ListSerializer):
+            whois_obj = None
+            if WHOISService.is_valid_public_ip_address(obj.last_ip):
+                whois_obj = self._get_whois_info_by_ip().get(obj.last_ip)
+        else:
+            whois_obj = obj.whois_service.get_device_whois_info()
         if not whois_obj:
             return None
         return self.serializer_class(whois_obj).data
 
     def to_representation(self, obj):
         data = super().to_representation(obj)
-        if app_settings.WHOIS_CONFIGURED and obj.whois_service.is_whois_enabled:
+        if (
+            app_settings.WHOIS_CONFIGURED
+            and is_field_requested(self.context.get("request"), "whois_info")
+            and obj.whois_service.is_whois_enabled
+        ):
             data["whois_info"] = self.get_whois_info(obj)
         return data
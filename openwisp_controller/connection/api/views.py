@@ -16,6 +16,7 @@ from ...mixins import (
     RelatedDeviceModelPermission,
     RelatedDeviceProtectedAPIMixin,
 )
+from ...pagination import OptionalCursorPagination
 from .serializers import (
     CommandSerializer,
     CredentialSerializer,
@@ -58,7 +59,7 @@ class BaseCommandView(RelatedDeviceProtectedAPIMixin):
 
 
 class CommandListCreateView(BaseCommandView, ListCreateAPIView):
-    pagination_class = OpenWispPagination
+    pagination_class = OptionalCursorPagination
 
     def create(self, request, *args, **kwargs):
         self.assert_parent_exists()
@@ -1,3 +1,5 @@
+import logging
+
 from asgiref.sync import async_to_sync
 from channels import layers
 from django.apps import AppConfig
@@ -10,9 +12,12 @@ from swapper import get_model_name, load_model
 
 from openwisp_utils.admin_theme.menu import register_menu_subitem
 
-from ..config.signals import config_deactivating, config_modified
+from ..config.signals import checksum_requested, config_deactivating, config_modified
+from .reachability import DeviceReachability
 from .signals import is_working_changed
 
+logger = logging.getLogger(__name__)
+
 
 class ConnectionConfig(AppConfig):
     name = "openwisp_controller.connection"
@@ -44,6 +49,10 @@ class ConnectionConfig(AppConfig):
         config_deactivating.connect(
             self.config_modified_receiver, dispatch_uid="connection.update_config"
         )
+        checksum_requested.connect(
+            DeviceReachability.checksum_requested_receiver,
+            dispatch_uid="connection.checksum_requested",
+        )
 
         post_save.connect(
             Credentials.auto_add_credentials_to_device,
@@ -91,6 +100,22 @@ class ConnectionConfig(AppConfig):
         # Check if push update should be skipped
         if device.should_skip_push_update():
             return
+        reachability = DeviceReachability(device.pk)
+        # the device is going to download the new configuration anyway
+        if reachability.has_recently_polled():
+            logger.info(f"{device} (pk: {device.pk}) polled recently, skipping push")
+            return
+        # the device could not be reached recently, the
+        # push operation is deferred until the backoff expires
+        countdown = reachability.get_retry_delay()
+        if countdown:
+            if reachability.defer(countdown):
+                logger.info(
+                    f"{device} (pk: {device.pk}) is unreachable, "
+                    f"deferring push by {countdown} seconds"
+                )
+                update_config.apply_async(args=[str(device.pk)], countdown=countdown)
+            return
         update_config.delay(str(device.pk))
 
     @classmethod
@@ -1,7 +1,9 @@
 import logging
+import time
 
 import django
 import jsonschema
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import DatabaseError, models, transaction
@@ -29,8 +31,13 @@ from ..commands import (
     get_command_schema,
 )
 from ..exceptions import NoWorkingDeviceConnectionError
+from ..reachability import DeviceReachability
 from ..signals import is_working_changed
-from ..tasks import auto_add_credentials_to_devices, launch_command
+from ..tasks import (
+    auto_add_credentials_to_devices,
+    auto_add_credentials_to_devices_chunk,
+    launch_command,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -109,6 +116,9 @@ class AbstractCredentials(ConnectorMixin, ShareableOrgMixinUniqueName, BaseModel
     # Controls the number of objects which can be stored in memory
     # before committing them to database during bulk auto add operation.
     chunk_size = 1000
+    # Time (in seconds) after which the progress of an interrupted
+    # auto add operation is discarded.
+    auto_add_checkpoint_timeout = 86400
 
     connector = models.CharField(
         _("connection type"),
@@ -155,11 +165,66 @@ class AbstractCredentials(ConnectorMixin, ShareableOrgMixinUniqueName, BaseModel
     def auto_add_to_devices(cls, credential_id, organization_id):
         """
         When ``auto_add`` is ``True``, adds the credentials
-        to each relevant ``Device`` and ``DeviceConnection`` objects
+        to each relevant ``Device`` and ``DeviceConnection`` objects.
+
+        The relevant devices are split in ranges of primary keys
+        containing at most ``chunk_size`` devices, each range is
+        processed by a separate background task, which allows to
+        distribute the work among the available workers.
+        The dispatched ranges are stored in the cache and each chunk
+        task marks its range as completed, so that an interrupted
+        operation can be resumed by dispatching again only the
+        ranges which have not been completed.
         """
-        DeviceConnection = load_model("connection", "DeviceConnection")
-        Device = load_model("config", "Device")
+        checkpoint_key = cls._get_auto_add_checkpoint_key(
+            credential_id, organization_id
+        )
+        checkpoint = cache.get(checkpoint_key) or {
+            "last_device_id": None,
+            "chunks": [],
+        }
+        checkpoint["dispatched"] = False
+        cache.set(checkpoint_key, checkpoint, timeout=cls.auto_add_checkpoint_timeout)
+        pending = cls._get_pending_auto_add_chunks(checkpoint_key, checkpoint)
+        for first_device_id, last_device_id in pending:
+            cls._dispatch_auto_add_chunk(
+                credential_id, organization_id, first_device_id, last_device_id
+            )
+        devices = cls._get_auto_add_devices(credential_id, organization_id)
+        if checkpoint["last_device_id"]:
+            devices = devices.filter(pk__gt=checkpoint["last_device_id"])
+        device_ids = (
+            devices.order_by("pk")
+            .values_list("pk", flat=True)
+            .iterator(chunk_size=cls.chunk_size)
+        )
+        chunk = []
+        for device_id in device_ids:
+            chunk.append(device_id)
+            if len(chunk) >= cls.chunk_size:
+                cls._checkpoint_auto_add_chunk(checkpoint_key, checkpoint, chunk)
+                cls._dispatch_auto_add_chunk(
+                    credential_id, organization_id, chunk[0], chunk[-1]
+                )
+                chunk = []
+        if chunk:
+            cls._checkpoint_auto_add_chunk(checkpoint_key, checkpoint, chunk)
+            cls._dispatch_auto_add_chunk(
+                credential_id, organization_id, chunk[0], chunk[-1]
+            )
+        checkpoint["dispatched"] = True
+        cache.set(checkpoint_key, checkpoint, timeout=cls.auto_add_checkpoint_timeout)
+        logger.info(
+            f"Credentials {credential_id}: dispatched auto add "
+            f"in {len(checkpoint['chunks'])} chunks "
+            f"({len(pending)} resumed)"
+        )
+        # chunks may have been completed while they were being dispatched
+        cls._clear_auto_add_checkpoint(checkpoint_key)
 
+    @classmethod
+    def _get_auto_add_devices(cls, credential_id, organization_id):
+        Device = load_model("config", "Device")
         # Deactivated devices are intentionally included: attaching credentials
         # is a database-only operation with no network activity (the connection
         # cannot be used while the device is deactivated), and having the
@@ -168,21 +233,164 @@ class AbstractCredentials(ConnectorMixin, ShareableOrgMixinUniqueName, BaseModel
         if organization_id:
             devices = devices.filter(organization_id=organization_id)
         # exclude devices which have been already added
-        devices = devices.exclude(deviceconnection__credentials_id=credential_id)
+        return devices.exclude(deviceconnection__credentials_id=credential_id)
+
+    @staticmethod
+    def _get_auto_add_checkpoint_key(credential_id, organization_id):
+        return f"connection_auto_add_{credential_id}_{organization_id}"
+
+    @staticmethod
+    def _get_auto_add_chunk_key(checkpoint_key, first_device_id):
+        return f"{checkpoint_key}_done_{first_device_id}"
+
+    @classmethod
+    def _get_pending_auto_add_chunks(cls, checkpoint_key, checkpoint):
+        """
+        Returns the ranges of the checkpoint which
+        have been dispatched but not completed yet.
+        """
+        chunks = checkpoint["chunks"]
+        done = cache.get_many(
+            [cls._get_auto_add_chunk_key(checkpoint_key, first) for first, _ in chunks]
+        )
+        return [
+            (first, last)
+            for first, last in chunks
+            if cls._get_auto_add_chunk_key(checkpoint_key, first) not in done
+        ]
+
+    @classmethod
+    def _checkpoint_auto_add_chunk(cls, checkpoint_key, checkpoint, device_ids):
+        # the range is stored before being dispatched, so
+        # that it can be completed by a resumed operation
+        checkpoint["chunks"].append((str(device_ids[0]), str(device_ids[-1])))
+        checkpoint["last_device_id"] = device_ids[-1]
+        cache.set(checkpoint_key, checkpoint, timeout=cls.auto_add_checkpoint_timeout)
+
+    @classmethod
+    def _dispatch_auto_add_chunk(
+        cls, credential_id, organization_id, first_device_id, last_device_id
+    ):
+        auto_add_credentials_to_devices_chunk.delay(
+            credential_id=str(credential_id),
+            organization_id=str(organization_id) if organization_id else None,
+            first_device_id=str(first_device_id),
+            last_device_id=str(last_device_id),
+        )
+
+    @classmethod
+    def _complete_auto_add_chunk(cls, credential_id, organization_id, first_device_id):
+        """
+        Marks the range starting at ``first_device_id`` as completed
+        and logs the progress of the whole operation.
+        """
+        checkpoint_key = cls._get_auto_add_checkpoint_key(
+            credential_id, organization_id
+        )
+        cache.set(
+            cls._get_auto_add_chunk_key(checkpoint_key, first_device_id),
+            True,
+            timeout=cls.auto_add_checkpoint_timeout,
+        )
+        checkpoint = cache.get(checkpoint_key)
+        if not checkpoint:
+            return
+        total = len(checkpoint["chunks"])
+        pending = len(cls._get_pending_auto_add_chunks(checkpoint_key, checkpoint))
+        logger.info(
+            f"Credentials {credential_id}: completed {total - pending} "
+            f"of {total} dispatched auto add chunks"
+        )
+        cls._clear_auto_add_checkpoint(checkpoint_key)
+
+    @classmethod
+    def _clear_auto_add_checkpoint(cls, checkpoint_key):
+        """
+        Discards the checkpoint once all the
+        ranges have been dispatched and completed.
+        """
+        checkpoint = cache.get(checkpoint_key)
+        if not checkpoint or not checkpoint["dispatched"]:
+            return
+        if cls._get_pending_auto_add_chunks(checkpoint_key, checkpoint):
+            return
+        cache.delete_many(
+            [checkpoint_key]
+            + [
+                cls._get_auto_add_chunk_key(checkpoint_key, first)
+                for first, _ in checkpoint["chunks"]
+            ]
+        )
+
+    @classmethod
+    def auto_add_to_devices_chunk(
+        cls, credential_id, organization_id, first_device_id, last_device_id
+    ):
+        """
+        Adds the credentials to the relevant devices having
+        primary key between ``first_device_id`` and ``last_device_id``.
+
+        The validation of the ``DeviceConnection`` objects is
+        performed only once for each update strategy (which is
+        the only information depending on the device), the objects
+        are then inserted with a single query; conflicting rows
+        (eg: added concurrently) are ignored, hence the operation
+        can be safely repeated.
+        """
+        DeviceConnection = load_model("connection", "DeviceConnection")
+        try:
+            credentials = cls.objects.get(pk=credential_id)
+        except cls.DoesNotExist:
+            return
+        devices = cls._get_auto_add_devices(credential_id, organization_id).filter(
+            pk__gte=first_device_id, pk__lte=last_device_id
+        )
+        update_strategies = {}
         device_connections = []
-        for device in devices.iterator():
-            conn = DeviceConnection(
-                device=device, credentials_id=credential_id, enabled=True
+        for device_id, backend in devices.values_list("pk", "config__backend"):
+            if backend not in update_strategies:
+                update_strategies[backend] = credentials._get_auto_add_update_strategy(
+                    backend
+                )
+            update_strategy = update_strategies[backend]
+            if not update_strategy:
+                continue
+            device_connections.append(
+                DeviceConnection(
+                    device_id=device_id,
+                    credentials=credentials,
+                    update_strategy=update_strategy,
+                    enabled=True,
+                )
             )
-            conn.full_clean()
-            device_connections.append(conn)
-            # Send create query when chunk_size is reached
-            # and reset the device_connections list
-            if len(device_connections) >= cls.chunk_size:
-                DeviceConnection.objects.bulk_create(device_connections)
-                device_connections = []
-        if len(device_connections):
-            DeviceConnection.objects.bulk_create(device_connections)
+        DeviceConnection.objects.bulk_create(
+            device_connections, batch_size=cls.chunk_size, ignore_conflicts=True
+        )
+        logger.info(
+            f"Credentials {credential_id}: added to {len(device_connections)} "
+            f"devices ({first_device_id} - {last_device_id})"
+        )
+        cls._complete_auto_add_chunk(credential_id, organization_id, first_device_id)
+
+    def _get_auto_add_update_strategy(self, backend):
+        """
+        Returns the update strategy of the ``DeviceConnection`` objects
+        of devices using ``backend``, validated against these credentials,
+        or ``None`` if a valid ``DeviceConnection`` cannot be created.
+        """
+        DeviceConnection = load_model("connection", "DeviceConnection")
+        try:
+            update_strategy = app_settings.CONFIG_UPDATE_MAPPING[backend]
+            DeviceConnection(
+                credentials=self, update_strategy=update_strategy
+            )._validate_connector_schema()
+        except (KeyError, ValidationError) as e:
+            logger.warning(
+                f"Cannot auto add credentials {self.pk} to devices "
+                f'using backend "{backend}": {e}'
+            )
+            return None
+        return update_strategy
 
     @classmethod
     def auto_add_credentials_to_device(cls, instance, created, **kwargs):
@@ -194,9 +402,6 @@ class AbstractCredentials(ConnectorMixin, ShareableOrgMixinUniqueName, BaseModel
          we can automatically create a DeviceConnection if we have
          a ``Config`` object)
         """
-        from django.contrib.contenttypes.models import ContentType
-        from reversion.models import Version
-
         DeviceConnection = load_model("connection", "DeviceConnection")
 
         if not created:
@@ -228,21 +433,48 @@ class AbstractCredentials(ConnectorMixin, ShareableOrgMixinUniqueName, BaseModel
         # deleted device is restored from the revision history we avoid
         # this race condition which would generate two identical DeviceConnection
         # objects and hence prevent the restoration of a deleted device.
-        device_connection_versions = Version.objects.filter(
-            content_type=ContentType.objects.get_for_model(DeviceConnection),
-            serialized_data__contains=str(device.id),
-        )
-        versioned_credentials = []
-        for version in device_connection_versions:
-            versioned_credentials.append(version.field_dict["credentials_id"])
-        not_where |= models.Q(id__in=versioned_credentials)
+        not_where |= models.Q(id__in=cls._get_versioned_credentials(device))
         credentials = cls.objects.filter(where).exclude(not_where)
+        device_connections = []
         for cred in credentials:
-            DeviceConnection = load_model("connection", "DeviceConnection")
             conn = DeviceConnection(device=device, credentials=cred, enabled=True)
             conn.set_connector(cred.connector_instance)
-            conn.full_clean()
-            conn.save()
+            # The uniqueness of (device, credentials) and the existence of
+            # the related objects are already guaranteed by the query above,
+            # hence full_clean() is skipped in favour of clean(), which still
+            # runs once per object and may query the database (eg: to check
+            # the organization of the related objects).
+            conn.clean()
+            device_connections.append(conn)
+        if device_connections:
+            DeviceConnection.objects.bulk_create(device_connections)
+
+    @classmethod
+    def _get_versioned_credentials(cls, device):
+        """
+        Returns the IDs of the credentials of the ``DeviceConnection``
+        objects of ``device`` stored in the revision history.
+
+        ``DeviceConnection`` is registered in django-reversion following
+        its device, therefore each of its versions belongs to a revision
+        which also contains a version of the device: looking up the
+        revisions of the device by its primary key (indexed) avoids
+        scanning the serialized data of the whole version table.
+        """
+        from reversion.models import Version
+
+        DeviceConnection = load_model("connection", "DeviceConnection")
+        device_revisions = Version.objects.get_for_object(device).values("revision_id")
+        device_connection_versions = Version.objects.get_for_model(
+            DeviceConnection
+        ).filter(
+            revision_id__in=device_revisions,
+            serialized_data__contains=str(device.id),
+        )
+        versioned_credentials = set()
+        for version in device_connection_versions:
+            versioned_credentials.add(version.field_dict["credentials_id"])
+        return versioned_credentials
 
 
 class AbstractDeviceConnection(ConnectorMixin, TimeStampedEditableModel):
@@ -305,11 +537,15 @@ class AbstractDeviceConnection(ConnectorMixin, TimeStampedEditableModel):
         # NoWorkingDeviceConnectionError.connection will be
         # equal to None if the device has no DeviceConnection.
         device_conn = None
+        reachability = DeviceReachability(device.pk)
         for device_conn in qs.iterator():
             is_connected = device_conn.connect()
             if is_connected:
+                reachability.mark_reachable()
                 return device_conn
         # The device has no working connection
+        if device_conn:
+            reachability.mark_unreachable(last_attempt=device_conn.last_attempt)
         raise NoWorkingDeviceConnectionError(connection=device_conn)
 
     def clean(self):
@@ -400,6 +636,7 @@ class AbstractDeviceConnection(ConnectorMixin, TimeStampedEditableModel):
         self.connect()
         if self.is_working:
             try:
+                self.connector_instance.config = self.device.config
                 self.connector_instance.update_config()
             except Exception as e:
                 logger.exception(e)
@@ -629,9 +866,7 @@ class AbstractCommand(TimeStampedEditableModel):
         # custom commands, perform each one separately and save output incrementally
         if self.is_custom:
             command = self.custom_command
-            output, exit_code = self.connection.connector_instance.exec_command(
-                command, raise_unexpected_exit=False
-            )
+            output, exit_code = self._exec_streaming_command(command)
         # default commands
         elif self.is_default_command:
             output, exit_code = self._execute_predefined_command()
@@ -640,10 +875,8 @@ class AbstractCommand(TimeStampedEditableModel):
         else:
             input = self.input or {}
             command = self._callable(**input)
-            output, exit_code = self.connection.connector_instance.exec_command(
-                command, raise_unexpected_exit=False
-            )
-        self._add_output(output)
+            output, exit_code = self._exec_streaming_command(command)
+        self._add_command_output(output)
         # if got non zero exit code, add extra info
         if exit_code != 0:
             self._add_output(
@@ -657,6 +890,60 @@ class AbstractCommand(TimeStampedEditableModel):
         method = getattr(self.connection.connector_instance, self.type)
         return method(*self.arguments)
 
+    def _exec_streaming_command(self, command):
+        """
+        Executes the command passing ``_stream_output`` as output
+        callback, which allows to follow the progress of long running
+        commands; returns the output received after the command exited
+        """
+        self._output_updated = time.monotonic()
+        return self.connection.connector_instance.exec_command(
+            command, raise_unexpected_exit=False, output_callback=self._stream_output
+        )
+
+    def _stream_output(self, output):
+        """
+        Adds the output received while the command is running,
+        the partial output is saved (which sends it to the websocket
+        clients) at most once every ``COMMAND_OUTPUT_UPDATE_INTERVAL``
+        """
+        self._append_command_output(output)
+        now = time.monotonic()
+        if now - self._output_updated < app_settings.COMMAND_OUTPUT_UPDATE_INTERVAL:
+            return
+        self._output_updated = now
+        self._save_without_resurrecting()
+
+    def _append_command_output(self, output):
+        """
+        appends the output of the command without exceeding
+        ``COMMAND_OUTPUT_MAX_SIZE``, the exceeding output is discarded
+        """
+        max_size = app_settings.COMMAND_OUTPUT_MAX_SIZE
+        if getattr(self, "_output_truncated", False):
+            return
+        if max_size and len(self.output) + len(output) > max_size:
+            self.output += output[: max(max_size - len(self.output), 0)]
+            self._add_output(
+                gettext(
+                    "\nOutput truncated: the output of the command "
+                    "exceeded {max_size} characters."
+                ).format(max_size=max_size)
+            )
+            self._output_truncated = True
+            return
+        self.output += output
+
+    def _add_command_output(self, output):
+        """
+        adds the output of the command (after the
+        output streamed while it was running, if any)
+        and a trailing new line if output doesn't have it
+        """
+        self._append_command_output(str(output))
+        if not self.output.endswith("\n"):
+            self.output += "\n"
+
     def _add_output(self, output):
         """
         adds trailing new line if output doesn't have it
@@ -1,4 +1,6 @@
+import hashlib
 import logging
+from io import BytesIO
 
 from packaging import version
 
@@ -51,6 +53,41 @@ class OpenWrt(Ssh):
         )
 
 
+class OpenWrtUpload(OpenWrt):
+    """
+    Uploads the configuration archive to the device and applies it
+    in the same SSH session, the agent running on the device is spared
+    from downloading the configuration from the controller, which is
+    useful also for devices which cannot reach the controller efficiently.
+    """
+
+    remote_dir = "/tmp/openwisp"
+    apply_command = (
+        "openwisp-update-config --conf {archive} && "
+        "echo {checksum} > {remote_dir}/checksum && "
+        "reload_config"
+    )
+
+    def update_config(self):
+        # the configuration is not available
+        # (eg: connector used outside DeviceConnection)
+        if self.config is None:
+            return super().update_config()
+        contents = self.config.generate().getvalue()
+        checksum = hashlib.md5(contents).hexdigest()
+        archive = f"{self.remote_dir}/configuration.tar.gz"
+        self.exec_command(f"mkdir -p {self.remote_dir}")
+        self.upload(BytesIO(contents), archive)
+        self.exec_command(
+            self.apply_command.format(
+                archive=archive, checksum=checksum, remote_dir=self.remote_dir
+            )
+        )
+        # the agent does not report the status
+        # of configurations which it did not download
+        self.config.set_status_applied()
+
+
 class OpenWisp1(Ssh):
     """
     Dummy legacy backend.
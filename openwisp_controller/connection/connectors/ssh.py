@@ -1,3 +1,4 @@
+import codecs
 import logging
 import socket
 import time
@@ -56,6 +57,12 @@ class Ssh(object):
     }
 
     has_update_strategy = True
+    # used when the output of a command is read while it's running
+    output_chunk_size = 32768
+    output_read_interval = 1
+    # configuration object of the device, assigned
+    # by DeviceConnection before calling update_config()
+    config = None
 
     def __init__(self, params, addresses):
         self._params = params
@@ -175,6 +182,7 @@ class Ssh(object):
         timeout=app_settings.SSH_COMMAND_TIMEOUT,
         exit_codes=[0],
         raise_unexpected_exit=True,
+        output_callback=None,
     ):
         """
         Executes a command and performs the following operations
@@ -183,6 +191,11 @@ class Ssh(object):
         - logs standard error
         - aborts on exceptions
         - raises socket.timeout exceptions
+
+        If ``output_callback`` is passed, the output received while the
+        command is running is read in chunks and each chunk is passed to
+        the callback as soon as it is received; the returned output will
+        contain only the output received after the command exited.
         """
         # paramiko expects timeout as a float
         timeout = float(timeout)
@@ -202,21 +215,33 @@ class Ssh(object):
         # workaround https://github.com/paramiko/paramiko/issues/1815
         # workaround https://github.com/paramiko/paramiko/issues/1787
         # Ref. https://docs.paramiko.org/en/stable/api/channel.html#paramiko.channel.Channel.recv_exit_status  # noqa
-        if not stdout.channel.status_event.wait(
-            timeout=timeout - (time.perf_counter() - start_cmd)
-        ):
-            log_message = f"Command timed out after {timeout} seconds."
-            logger.info(log_message)
-            raise CommandTimeoutException(log_message)
-        exit_status = stdout.channel.exit_status
+        channel = stdout.channel
+        deadline = start_cmd + timeout
+        decoders = {
+            "stdout": codecs.getincrementaldecoder("utf-8")("ignore"),
+            "stderr": codecs.getincrementaldecoder("utf-8")("ignore"),
+        }
+        while True:
+            wait_timeout = deadline - time.perf_counter()
+            if output_callback:
+                wait_timeout = min(wait_timeout, self.output_read_interval)
+            if channel.status_event.wait(timeout=max(wait_timeout, 0)):
+                break
+            if time.perf_counter() >= deadline:
+                log_message = f"Command timed out after {timeout} seconds."
+                logger.info(log_message)
+                raise CommandTimeoutException(log_message)
+            if output_callback:
+                self._read_channel_output(channel, decoders, output_callback)
+        exit_status = channel.exit_status
         # log standard output
         # try to decode to UTF-8, ignoring unconvertible characters
         # https://docs.python.org/3/howto/unicode.html#the-string-type
-        output = stdout.read().decode("utf-8", "ignore")
+        output = self._read_remaining_output(stdout, decoders["stdout"])
         if output:
             logger.info(output)
         # log standard error
-        error = stderr.read().decode("utf-8", "ignore")
+        error = self._read_remaining_output(stderr, decoders["stderr"])
         if error:
             if not output.endswith("\n"):
                 output += "\n"
@@ -231,6 +256,29 @@ class Ssh(object):
             raise CommandFailedException(message or log_message)
         return output, exit_status
 
+    def _read_channel_output(self, channel, decoders, output_callback):
+        """
+        Passes the output available in the channel
+        (if any) to ``output_callback``
+        """
+        for stream, ready, recv in (
+            ("stdout", channel.recv_ready, channel.recv),
+            ("stderr", channel.recv_stderr_ready, channel.recv_stderr),
+        ):
+            while ready():
+                output = decoders[stream].decode(recv(self.output_chunk_size))
+                if output:
+                    logger.info(output)
+                    output_callback(output)
+
+    def _read_remaining_output(self, stream, decoder):
+        data = stream.read()
+        # bytes which are part of a character split
+        # between chunks are still held by the decoder
+        if decoder.getstate()[0]:
+            return decoder.decode(data, final=True)
+        return data.decode("utf-8", "ignore")
+
     def update_config(self):  # pragma: no cover
         raise NotImplementedError()
 
@@ -0,0 +1,99 @@
+import math
+import time
+
+from django.core.cache import cache
+
+from . import settings as app_settings
+
+
+class DeviceReachability:
+    """
+    Keeps track (in the cache) of the information which allows to
+    skip or defer push operations which are not needed or which are
+    bound to fail:
+
+    - devices which have requested their configuration checksum
+      recently are going to download the new configuration anyway;
+    - devices which could not be reached are not reached again
+      until an exponentially increasing delay has passed.
+
+    Other modules (eg: openwisp-monitoring) can feed this information
+    by calling ``mark_reachable`` and ``mark_unreachable``.
+    """
+
+    # time (in seconds) after which the information
+    # about devices which could not be reached is discarded
+    unreachable_timeout = 7 * 86400
+
+    def __init__(self, device_id):
+        self.device_id = str(device_id)
+
+    @property
+    def _unreachable_cache_key(self):
+        return f"connection_unreachable_{self.device_id}"
+
+    @property
+    def _polled_cache_key(self):
+        return f"connection_checksum_polled_{self.device_id}"
+
+    @property
+    def _deferred_cache_key(self):
+        return f"connection_push_deferred_{self.device_id}"
+
+    def mark_reachable(self):
+        cache.delete(self._unreachable_cache_key)
+
+    def mark_unreachable(self, last_attempt=None):
+        """
+        ``last_attempt`` is the datetime of the last failed
+        attempt to reach the device (defaults to now)
+        """
+        state = cache.get(self._unreachable_cache_key) or {"failures": 0}
+        state["failures"] += 1
+        state["last_attempt"] = (
+            last_attempt.timestamp() if last_attempt else time.time()
+        )
+        cache.set(self._unreachable_cache_key, state, self.unreachable_timeout)
+
+    def get_failures(self):
+        state = cache.get(self._unreachable_cache_key)
+        return state["failures"] if state else 0
+
+    def get_retry_delay(self):
+        """
+        Returns the amount of seconds to wait before
+        attempting to reach the device again
+        (``0`` means the device can be reached now)
+        """
+        if not app_settings.PUSH_BACKOFF_BASE:
+            return 0
+        state = cache.get(self._unreachable_cache_key)
+        if not state:
+            return 0
+        backoff = min(
+            app_settings.PUSH_BACKOFF_BASE * 2 ** (state["failures"] - 1),
+            app_settings.PUSH_BACKOFF_MAX,
+        )
+        return max(math.ceil(state["last_attempt"] + backoff - time.time()), 0)
+
+    def mark_checksum_polled(self):
+        if app_settings.PUSH_SKIP_RECENTLY_POLLED:
+            cache.set(
+                self._polled_cache_key, True, app_settings.PUSH_SKIP_RECENTLY_POLLED
+            )
+
+    def has_recently_polled(self):
+        if not app_settings.PUSH_SKIP_RECENTLY_POLLED:
+            return False
+        return bool(cache.get(self._polled_cache_key))
+
+    def defer(self, countdown):
+        """
+        Returns ``True`` if no other push operation
+        has already been deferred for the device
+        """
+        return cache.add(self._deferred_cache_key, True, countdown)
+
+    @classmethod
+    def checksum_requested_receiver(cls, instance, **kwargs):
+        cls(instance.pk).mark_checksum_polled()
@@ -20,6 +20,10 @@ DEFAULT_UPDATE_STRATEGIES = (
         "openwisp_controller.connection.connectors.openwrt.ssh.OpenWisp1",
         "OpenWISP 1.x SSH",
     ),
+    (
+        "openwisp_controller.connection.connectors.openwrt.ssh.OpenWrtUpload",
+        "OpenWRT SSH (upload configuration)",
+    ),
 )
 
 UPDATE_STRATEGIES = getattr(
@@ -39,6 +43,18 @@ SSH_AUTH_TIMEOUT = getattr(settings, "OPENWISP_SSH_AUTH_TIMEOUT", 2)
 SSH_BANNER_TIMEOUT = getattr(settings, "OPENWISP_SSH_BANNER_TIMEOUT", 60)
 SSH_COMMAND_TIMEOUT = getattr(settings, "OPENWISP_SSH_COMMAND_TIMEOUT", 30)
 SSH_CONNECTION_TIMEOUT = getattr(settings, "OPENWISP_SSH_CONNECTION_TIMEOUT", 5)
+COMMAND_OUTPUT_MAX_SIZE = getattr(
+    settings, "OPENWISP_CONTROLLER_COMMAND_OUTPUT_MAX_SIZE", 1048576
+)
+COMMAND_OUTPUT_UPDATE_INTERVAL = getattr(
+    settings, "OPENWISP_CONTROLLER_COMMAND_OUTPUT_UPDATE_INTERVAL", 2
+)
+
+PUSH_BACKOFF_BASE = getattr(settings, "OPENWISP_CONTROLLER_PUSH_BACKOFF_BASE", 0)
+PUSH_BACKOFF_MAX = getattr(settings, "OPENWISP_CONTROLLER_PUSH_BACKOFF_MAX", 3600)
+PUSH_SKIP_RECENTLY_POLLED = getattr(
+    settings, "OPENWISP_CONTROLLER_PUSH_SKIP_RECENTLY_POLLED", 0
+)
 
 # this may get overridden by openwisp-monitoring
 UPDATE_CONFIG_MODEL = getattr(settings, "OPENWISP_UPDATE_CONFIG_MODEL", "config.Device")
@@ -102,3 +102,13 @@ def launch_command(command_id):
 def auto_add_credentials_to_devices(credential_id, organization_id):
     Credentials = load_model("connection", "Credentials")
     Credentials.auto_add_to_devices(credential_id, organization_id)
+
+
+@shared_task(soft_time_limit=3600)
+def auto_add_credentials_to_devices_chunk(
+    credential_id, organization_id, first_device_id, last_device_id
+):
+    Credentials = load_model("connection", "Credentials")
+    Credentials.auto_add_to_devices_chunk(
+        credential_id, organization_id, first_device_id, last_device_id
+    )
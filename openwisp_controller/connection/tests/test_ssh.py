@@ -83,6 +83,24 @@ class TestSsh(CreateConnectionsMixin, TestCase):
         mocked_info.assert_has_calls([mock.call(log_message)])
         self.assertEqual(str(ctx.exception), log_message)
 
+    @mock.patch.object(ssh_logger, "info")
+    @mock.patch.object(ssh_logger, "debug")
+    def test_connection_command_output_callback(self, mocked_debug, mocked_info):
+        ckey = self._create_credentials_with_key(port=self.ssh_server.port)
+        dc = self._create_device_connection(credentials=ckey)
+        dc.connector_instance.connect()
+        chunks = []
+        with mock.patch.object(dc.connector_instance, "output_read_interval", 0.1):
+            output, exit_code = dc.connector_instance.exec_command(
+                "echo first; sleep 0.5; echo second >&2",
+                output_callback=chunks.append,
+            )
+        self.assertEqual(exit_code, 0)
+        # the output is either streamed or returned at the end
+        output = "".join(chunks) + output
+        self.assertEqual(output.count("first\n"), 1)
+        self.assertEqual(output.count("second\n"), 1)
+
     @mock.patch.object(ssh_logger, "info")
     @mock.patch.object(ssh_logger, "debug")
     def test_connection_failed_command_suppressed_output(
@@ -20,9 +20,11 @@ from openwisp_utils.api.pagination import OpenWispPagination
 
 from ...mixins import (
     BaseProtectedAPIMixin,
+    ConditionalListMixin,
     ProtectedAPIMixin,
     RelatedDeviceProtectedAPIMixin,
 )
+from ...pagination import OptionalCursorPagination
 from .filters import DeviceListFilter
 from .serializers import (
     DeviceCoordinatesSerializer,
@@ -219,12 +221,17 @@ class GeoJsonLocationListPagination(GeoJsonPagination):
 
 
 class GeoJsonLocationList(
-    ProtectedAPIMixin, FilterByOrganizationManaged, generics.ListAPIView
+    ConditionalListMixin,
+    ProtectedAPIMixin,
+    FilterByOrganizationManaged,
+    generics.ListAPIView,
 ):
     """
     Shows only locations which are assigned to devices.
     """
 
+    # the number of devices of each location is shown
+    list_version_relations = ["devicelocation"]
     queryset = (
         Location.objects.filter(devicelocation__isnull=False)
         .annotate(device_count=Count("devicelocation"))
@@ -302,7 +309,9 @@ class LocationDeviceList(
         return response
 
 
-class FloorPlanListCreateView(ProtectedAPIMixin, generics.ListCreateAPIView):
+class FloorPlanListCreateView(
+    ConditionalListMixin, ProtectedAPIMixin, generics.ListCreateAPIView
+):
     serializer_class = FloorPlanSerializer
     queryset = FloorPlan.objects.select_related().order_by("-created")
     pagination_class = OpenWispPagination
@@ -318,15 +327,18 @@ class FloorPlanDetailView(
     queryset = FloorPlan.objects.select_related()
 
 
-class LocationListCreateView(ProtectedAPIMixin, generics.ListCreateAPIView):
+class LocationListCreateView(
+    ConditionalListMixin, ProtectedAPIMixin, generics.ListCreateAPIView
+):
     serializer_class = LocationSerializer
+    list_version_relations = ["floorplan"]
     queryset = Location.objects.prefetch_related(
         Prefetch(
             "floorplan_set",
             queryset=FloorPlan.objects.order_by("-created"),
         )
     ).order_by("-created")
-    pagination_class = OpenWispPagination
+    pagination_class = OptionalCursorPagination
     filter_backends = [filters.DjangoFilterBackend]
     filterset_class = LocationOrganizationFilter
 
@@ -46,6 +46,13 @@ class GeoDeviceResource(DeviceResource):
         default=None,
     )
 
+    def get_stream_queryset(self, queryset):
+        return (
+            super()
+            .get_stream_queryset(queryset)
+            .select_related("devicelocation__location", "devicelocation__floorplan")
+        )
+
     def dehydrate_coords(self, device):
         try:
             return device.devicelocation.location.geometry.wkt
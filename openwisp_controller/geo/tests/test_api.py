@@ -415,7 +415,7 @@ class TestGeoApi(
 
     def test_get_floorplan_list(self):
         path = reverse("geo_api:list_floorplan")
-        with self.assertNumQueries(2):
+        with self.assertNumQueries(3):
             response = self.client.get(path)
         self.assertEqual(response.status_code, 200)
 
@@ -431,7 +431,7 @@ class TestGeoApi(
         path = reverse("geo_api:list_floorplan")
 
         with self.subTest("Test without organization filtering"):
-            with self.assertNumQueries(3):
+            with self.assertNumQueries(4):
                 response = self.client.get(path)
             self.assertEqual(response.status_code, 200)
             self.assertEqual(response.data["count"], 2)
@@ -439,7 +439,7 @@ class TestGeoApi(
             self.assertContains(response, org2_floorplan.id)
 
         with self.subTest("Test filtering with organization slug"):
-            with self.assertNumQueries(3):
+            with self.assertNumQueries(4):
                 response = self.client.get(path, {"organization_slug": org1.slug})
             self.assertEqual(response.status_code, 200)
             self.assertEqual(response.data["count"], 1)
@@ -447,7 +447,7 @@ class TestGeoApi(
             self.assertNotContains(response, org2_floorplan.id)
 
         with self.subTest("Test filtering with organization id"):
-            with self.assertNumQueries(4):
+            with self.assertNumQueries(5):
                 response = self.client.get(path, {"organization": org1.id})
             self.assertEqual(response.status_code, 200)
             self.assertEqual(response.data["count"], 1)
@@ -458,7 +458,7 @@ class TestGeoApi(
             self.client.logout()
             user = self._create_administrator([org1])
             self.client.force_login(user)
-            with self.assertNumQueries(5):
+            with self.assertNumQueries(6):
                 response = self.client.get(path)
             self.assertEqual(response.status_code, 200)
             self.assertEqual(response.data["count"], 1)
@@ -524,10 +524,51 @@ class TestGeoApi(
 
     def test_get_location_list(self):
         path = reverse("geo_api:list_location")
-        with self.assertNumQueries(2):
+        with self.assertNumQueries(3):
             response = self.client.get(path)
         self.assertEqual(response.status_code, 200)
 
+    def test_location_list_conditional_requests(self):
+        location = self._create_location(type="indoor")
+        path = reverse("geo_api:list_location")
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Last-Modified", response)
+        etag = response["ETag"]
+
+        with self.subTest("unchanged list"):
+            with self.assertNumQueries(2):
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response["ETag"], etag)
+
+        with self.subTest("floorplan added to a location"):
+            self._create_floorplan(location=location)
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response["ETag"], etag)
+
+        path = reverse("geo_api:location_geojson")
+        location = self._create_location(name="outdoor", type="outdoor")
+        device = self._create_device()
+        self._create_device_location(content_object=device, location=location)
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        with self.subTest("unchanged geojson"):
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+        with self.subTest("device added to a location"):
+            device2 = self._create_device(
+                name="device2", mac_address="00:11:22:33:44:66"
+            )
+            self._create_device_location(content_object=device2, location=location)
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response["ETag"], etag)
+
     def test_filter_location_list(self):
         org1 = self._create_org(name="org1")
         org2 = self._create_org(name="org2")
@@ -538,7 +579,7 @@ class TestGeoApi(
         path = reverse("geo_api:list_location")
 
         with self.subTest("Test without organization filtering"):
-            with self.assertNumQueries(4):
+            with self.assertNumQueries(5):
                 response = self.client.get(path)
             self.assertEqual(response.status_code, 200)
             self.assertEqual(response.data["count"], 2)
@@ -546,7 +587,7 @@ class TestGeoApi(
             self.assertContains(response, org2_location.id)
 
         with self.subTest("Test filtering with organization slug"):
-            with self.assertNumQueries(4):
+            with self.assertNumQueries(5):
                 response = self.client.get(path, {"organization_slug": org1.slug})
             self.assertEqual(response.status_code, 200)
             self.assertEqual(response.data["count"], 1)
@@ -554,7 +595,7 @@ class TestGeoApi(
             self.assertNotContains(response, org2_location.id)
 
         with self.subTest("Test filtering with organization id"):
-            with self.assertNumQueries(5):
+            with self.assertNumQueries(6):
                 response = self.client.get(path, {"organization": org1.id})
             self.assertEqual(response.status_code, 200)
             self.assertEqual(response.data["count"], 1)
@@ -562,7 +603,7 @@ class TestGeoApi(
             self.assertNotContains(response, org2_location.id)
 
         with self.subTest("Test filtering with location type"):
-            with self.assertNumQueries(4):
+            with self.assertNumQueries(5):
                 response = self.client.get(path, {"type": "indoor"})
             self.assertEqual(response.status_code, 200)
             self.assertEqual(response.data["count"], 1)
@@ -570,7 +611,7 @@ class TestGeoApi(
             self.assertNotContains(response, org2_location.id)
 
         with self.subTest('Test filtering with "is_mobile"'):
-            with self.assertNumQueries(4):
+            with self.assertNumQueries(5):
                 response = self.client.get(path, {"is_mobile": True})
             self.assertEqual(response.status_code, 200)
             self.assertEqual(response.data["count"], 1)
@@ -581,7 +622,7 @@ class TestGeoApi(
             self.client.logout()
             user = self._create_administrator([org1])
             self.client.force_login(user)
-            with self.assertNumQueries(6):
+            with self.assertNumQueries(7):
                 response = self.client.get(path)
             self.assertEqual(response.status_code, 200)
             self.assertEqual(response.data["count"], 1)
@@ -1,7 +1,21 @@
+from hashlib import md5
+
+from django.db.models import Count, Max
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date
+from django.utils.translation import get_language
+from rest_framework.response import Response
+
 from openwisp_users.api.mixins import FilterByOrganizationManaged, FilterByParentManaged
 from openwisp_users.api.mixins import ProtectedAPIMixin as BaseProtectedAPIMixin
 from openwisp_users.api.permissions import DjangoModelPermissions, IsOrganizationManager
 
+from .serializers import is_field_requested
+
 
 class RelatedDeviceModelPermission(DjangoModelPermissions):
     _device_field = "device"
@@ -33,3 +47,157 @@ class RelatedDeviceProtectedAPIMixin(FilterByParentManaged, BaseProtectedAPIMixi
 
 class ProtectedAPIMixin(BaseProtectedAPIMixin, FilterByOrganizationManaged):
     pass
+
+
+def _get_related_paths(related, prefix=""):
+    """
+    Converts the nested dict of ``QuerySet.query.select_related``
+    into the list of lookups accepted by ``select_related``
+    """
+    paths = []
+    for name, nested in related.items():
+        path = f"{prefix}{name}"
+        if nested:
+            paths.extend(_get_related_paths(nested, f"{path}__"))
+        else:
+            paths.append(path)
+    return paths
+
+
+class SparseFieldsetsViewMixin:
+    """
+    Skips the ``select_related`` and ``prefetch_related`` lookups
+    of the queryset which are needed only by the fields excluded
+    with the ``fields`` or ``omit`` query parameters
+    (see ``openwisp_controller.serializers.SparseFieldsetsMixin``).
+    """
+
+    # maps each field of the serializer to the
+    # relations of the queryset which it uses
+    sparse_fieldsets_relations = {}
+
+    def _get_skipped_relations(self):
+        return {
+            relation
+            for field, relations in self.sparse_fieldsets_relations.items()
+            if not is_field_requested(self.request, field)
+            for relation in relations
+        }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        skipped = self._get_skipped_relations()
+        if not skipped:
+            return queryset
+
+        def is_needed(lookup):
+            return lookup.split("__")[0] not in skipped
+
+        select_related = queryset.query.select_related
+        if isinstance(select_related, dict):
+            lookups = list(filter(is_needed, _get_related_paths(select_related)))
+            queryset = queryset.select_related(None)
+            # "select_related()" without arguments would follow all the relations
+            if lookups:
+                queryset = queryset.select_related(*lookups)
+        prefetch_related = queryset._prefetch_related_lookups
+        if prefetch_related:
+            queryset = queryset.prefetch_related(None).prefetch_related(
+                *(
+                    lookup
+                    for lookup in prefetch_related
+                    if is_needed(getattr(lookup, "prefetch_through", lookup))
+                )
+            )
+        return queryset
+
+
+class ConditionalListMixin:
+    """
+    Adds the ``ETag`` and ``Last-Modified`` headers to the responses of
+    list endpoints and returns ``304 Not Modified`` to the conditional
+    requests (``If-None-Match``) made when the listed objects did not
+    change, which spares the serialization of the objects to the clients
+    which poll the API.
+
+    The version of the list is computed with a single aggregate query
+    on the filtered queryset: the number of objects and the most recent
+    ``modified`` timestamp, also of the objects of the related models
+    listed in ``list_version_relations`` (which are shown in the list).
+    It is computed on each request because the lists depend on the query
+    parameters and on the organizations of the user, which would make a
+    cached version hard to invalidate.
+
+    ``If-Modified-Since`` alone is not answered with ``304``: a timestamp
+    with the precision of one second cannot detect deletions nor changes
+    made within the same second, which change the ``ETag`` instead.
+    """
+
+    # relations of the listed objects which are shown in the list
+    list_version_relations = []
+
+    def get_list_version(self, queryset):
+        """
+        Returns a dict which identifies the current version of the list
+        """
+        queryset = queryset.order_by()
+        if queryset.query.annotations:
+            # aggregates cannot be computed over the annotations
+            queryset = queryset.model._default_manager.filter(
+                pk__in=queryset.values("pk")
+            )
+        aggregates = {
+            "count": Count("pk", distinct=bool(self.list_version_relations)),
+            "last_modified": Max("modified"),
+        }
+        for relation in self.list_version_relations:
+            aggregates[f"{relation}_count"] = Count(relation, distinct=True)
+            aggregates[f"{relation}_last_modified"] = Max(f"{relation}__modified")
+        return queryset.aggregate(**aggregates)
+
+    def _get_list_etag(self, request, version):
+        key = "|".join(
+            [
+                request.get_full_path(),
+                str(request.user.pk),
+                request.accepted_renderer.format,
+                get_language() or "",
+            ]
+            + [str(version[name]) for name in sorted(version)]
+        )
+        return f'"{md5(key.encode()).hexdigest()}"'
+
+    def _get_list_response(self, queryset):
+        # same as ListModelMixin.list, but uses the
+        # queryset which has already been filtered
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        version = self.get_list_version(queryset)
+        etag = self._get_list_etag(request, version)
+        last_modified = max(
+            (
+                value
+                for name, value in version.items()
+                if name.endswith("last_modified") and value
+            ),
+            default=None,
+        )
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = self._get_list_response(queryset)
+        response["ETag"] = etag
+        if timestamp:
+            response["Last-Modified"] = http_date(timestamp)
+        # clients must revalidate the response on each request,
+        # which costs only one query when the list did not change
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ["Accept"])
+        return response
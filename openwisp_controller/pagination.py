@@ -0,0 +1,188 @@
+from hashlib import md5
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+from openwisp_utils.api.pagination import OpenWispPagination
+
+
+class CreatedCursorPagination(CursorPagination):
+    """
+    Keyset pagination on ``(created, id)``: each page is fetched by
+    filtering on the position of the last item of the previous page
+    (``created < c OR (created = c AND id < i)``), the positions are
+    unique, hence the pages are fetched without ``OFFSET``, their cost
+    does not depend on their depth and the total number of items is
+    never counted.
+    """
+
+    ordering = ("-created", "-pk")
+    page_size = OpenWispPagination.page_size
+    page_size_query_param = "page_size"
+    max_page_size = OpenWispPagination.max_page_size
+
+    def get_ordering(self, request, queryset, view):
+        # the position of the items relies on this ordering
+        return self.ordering
+
+    def _get_position_from_instance(self, instance, ordering):
+        return f"{instance.created.isoformat()}|{instance.pk}"
+
+    def _filter_by_position(self, queryset, position, reverse):
+        """
+        Returns the items which follow ``position``
+        (or precede it if ``reverse`` is ``True``)
+        """
+        created, _, pk = position.rpartition("|")
+        created = parse_datetime(created) if created else None
+        if created is None:
+            raise NotFound(self.invalid_cursor_message)
+        lookup = "gt" if reverse else "lt"
+        return queryset.filter(
+            Q(**{f"created__{lookup}": created})
+            | Q(created=created, **{f"pk__{lookup}": pk})
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # same as CursorPagination.paginate_queryset, but filters on
+        # the whole position instead of the first field of the ordering
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            offset, reverse, current_position = 0, False, None
+        else:
+            offset, reverse, current_position = self.cursor
+        if reverse:
+            queryset = queryset.order_by("created", "pk")
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if current_position is not None:
+            queryset = self._filter_by_position(queryset, current_position, reverse)
+        # the links never contain an offset, because the positions are
+        # unique, an extra item is fetched to know if there's a next page
+        end = offset + self.page_size + 1
+        results = list(queryset[offset:end])
+        self.page = results[: self.page_size]
+        following_position = None
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(
+                results[-1], self.ordering
+            )
+        if reverse:
+            # the items have been fetched in the reverse order
+            self.page = list(reversed(self.page))
+            self.has_next = current_position is not None or offset > 0
+            self.has_previous = following_position is not None
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = following_position is not None
+            self.has_previous = current_position is not None or offset > 0
+            self.next_position = following_position
+            self.previous_position = current_position
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+
+class OptionalCursorPagination(OpenWispPagination):
+    """
+    Page number pagination which switches to
+    ``CreatedCursorPagination`` when ``?pagination=cursor``
+    is passed or when a cursor is requested.
+    """
+
+    pagination_query_param = "pagination"
+    cursor_pagination_class = CreatedCursorPagination
+    cursor_paginator = None
+
+    def use_cursor(self, request):
+        cursor_query_param = self.cursor_pagination_class.cursor_query_param
+        return (
+            request.query_params.get(self.pagination_query_param) == "cursor"
+            or cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.use_cursor(request):
+            return super().paginate_queryset(queryset, request, view)
+        self.cursor_paginator = self.cursor_pagination_class()
+        return self.cursor_paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.cursor_paginator:
+            return self.cursor_paginator.to_html()
+        return super().to_html()
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator which avoids counting all the rows of very large tables:
+    when the queryset is not filtered and the database is PostgreSQL,
+    the number of rows is estimated from the statistics of the table
+    (``pg_class.reltuples``), otherwise the exact count is cached for
+    a short time, so that browsing the pages of the same list
+    counts its rows only once.
+    """
+
+    # estimates lower than this are replaced by the exact count,
+    # which is cheap to compute on small tables
+    estimate_threshold = 10000
+    # time (in seconds) for which exact counts are cached
+    cache_timeout = 60
+
+    def _get_estimated_count(self):
+        queryset = self.object_list
+        query = getattr(queryset, "query", None)
+        if query is None or query.where or query.distinct:
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # reltuples is negative if the table has never been analyzed
+        return int(row[0]) if row else None
+
+    def _get_cache_key(self):
+        try:
+            sql = str(self.object_list.query)
+        except (AttributeError, EmptyResultSet):
+            return None
+        digest = md5(f"{self.object_list.db}{sql}".encode()).hexdigest()
+        return f"paginator_count_{digest}"
+
+    @cached_property
+    def count(self):
+        estimate = self._get_estimated_count()
+        if estimate is not None and estimate >= self.estimate_threshold:
+            return estimate
+        cache_key = self._get_cache_key()
+        if cache_key is None:
+            return super().count
+        count = cache.get(cache_key)
+        if count is None:
+            count = super().count
+            cache.set(cache_key, count, self.cache_timeout)
+        return count
@@ -1,3 +1,6 @@
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
 from openwisp_users.api.mixins import FilterSerializerByOrgManaged
 from openwisp_utils.api.serializers import ValidatedModelSerializer
 
@@ -10,3 +13,93 @@ class BaseSerializer(FilterSerializerByOrgManaged, ValidatedModelSerializer):
     """
 
     pass
+
+
+def _parse_fieldset(value):
+    """
+    Parses a comma separated list of fields (eg: ``id,config.status``)
+    into a dict which maps each field to the set of its subfields
+    """
+    if not value:
+        return None
+    fields = {}
+    for item in value.split(","):
+        name, _, subfield = item.strip().partition(".")
+        if not name:
+            continue
+        subfields = fields.setdefault(name, set())
+        if subfield:
+            subfields.add(subfield)
+    return fields
+
+
+def get_sparse_fieldsets(request):
+    """
+    Returns the fields requested with the ``fields`` query parameter
+    and the ones excluded with the ``omit`` query parameter (as parsed
+    by ``_parse_fieldset``), both are ignored in write requests
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None, None
+    return (
+        _parse_fieldset(request.query_params.get("fields")),
+        _parse_fieldset(request.query_params.get("omit")),
+    )
+
+
+def is_field_requested(request, name):
+    """
+    Returns ``False`` if the top level field ``name`` is
+    excluded by the ``fields`` or ``omit`` query parameters
+    """
+    fields, omit = get_sparse_fieldsets(request)
+    if fields is not None and name not in fields:
+        return False
+    if omit and name in omit and not omit[name]:
+        return False
+    return True
+
+
+class SparseFieldsetsMixin:
+    """
+    Allows clients to choose the fields returned by read requests,
+    eg: ``?fields=id,name,config.status`` or ``?omit=config.templates``;
+    the fields of nested serializers can be selected with the dot notation.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields, omit = get_sparse_fieldsets(self.context.get("request"))
+        if fields is not None:
+            self._keep_fields(self.fields, fields)
+        if omit:
+            self._omit_fields(self.fields, omit)
+
+    @staticmethod
+    def _get_nested_fields(field):
+        if isinstance(field, serializers.Serializer):
+            return field.fields
+        return None
+
+    def _keep_fields(self, serializer_fields, fields):
+        for name in list(serializer_fields):
+            if name not in fields:
+                serializer_fields.pop(name)
+                continue
+            nested_fields = self._get_nested_fields(serializer_fields[name])
+            if fields[name] and nested_fields is not None:
+                for nested_name in list(nested_fields):
+                    if nested_name not in fields[name]:
+                        nested_fields.pop(nested_name)
+
+    def _omit_fields(self, serializer_fields, omit):
+        for name, subfields in omit.items():
+            if name not in serializer_fields:
+                continue
+            if not subfields:
+                serializer_fields.pop(name)
+                continue
+            nested_fields = self._get_nested_fields(serializer_fields[name])
+            if nested_fields is not None:
+                for nested_name in subfields:
+                    nested_fields.pop(nested_name, None)
@@ -10,12 +10,27 @@ from openwisp_controller.config.api.download_views import (
 from openwisp_controller.config.api.views import (
     DeviceActivateView as BaseDeviceActivateView,
 )
+from openwisp_controller.config.api.views import (
+    DeviceBulkActionView as BaseDeviceBulkActionView,
+)
+from openwisp_controller.config.api.views import (
+    DeviceBulkJobView as BaseDeviceBulkJobView,
+)
+from openwisp_controller.config.api.views import (
+    DeviceBulkUpdateView as BaseDeviceBulkUpdateView,
+)
+from openwisp_controller.config.api.views import (
+    DeviceChangeGroupView as BaseDeviceChangeGroupView,
+)
 from openwisp_controller.config.api.views import (
     DeviceDeactivateView as BaseDeviceDeactivateView,
 )
 from openwisp_controller.config.api.views import (
     DeviceDetailView as BaseDeviceDetailView,
 )
+from openwisp_controller.config.api.views import (
+    DeviceExportView as BaseDeviceExportView,
+)
 from openwisp_controller.config.api.views import (
     DeviceGroupCommonName as BaseDeviceGroupCommonName,
 )
@@ -25,9 +40,18 @@ from openwisp_controller.config.api.views import (
 from openwisp_controller.config.api.views import (
     DeviceGroupListCreateView as BaseDeviceGroupListCreateView,
 )
+from openwisp_controller.config.api.views import (
+    DeviceImportView as BaseDeviceImportView,
+)
 from openwisp_controller.config.api.views import (
     DeviceListCreateView as BaseDeviceListCreateView,
 )
+from openwisp_controller.config.api.views import (
+    DeviceRenderView as BaseDeviceRenderView,
+)
+from openwisp_controller.config.api.views import (
+    TemplateCloneView as BaseTemplateCloneView,
+)
 from openwisp_controller.config.api.views import (
     TemplateDetailView as BaseTemplateDetailView,
 )
@@ -48,6 +72,10 @@ class TemplateDetailView(BaseTemplateDetailView):
     pass
 
 
+class TemplateCloneView(BaseTemplateCloneView):
+    pass
+
+
 class DownloadTemplateconfiguration(BaseDownloadTemplateconfiguration):
     pass
 
@@ -80,6 +108,34 @@ class DeviceDeactivateView(BaseDeviceDeactivateView):
     pass
 
 
+class DeviceChangeGroupView(BaseDeviceChangeGroupView):
+    pass
+
+
+class DeviceBulkActionView(BaseDeviceBulkActionView):
+    pass
+
+
+class DeviceBulkUpdateView(BaseDeviceBulkUpdateView):
+    pass
+
+
+class DeviceImportView(BaseDeviceImportView):
+    pass
+
+
+class DeviceBulkJobView(BaseDeviceBulkJobView):
+    pass
+
+
+class DeviceRenderView(BaseDeviceRenderView):
+    pass
+
+
+class DeviceExportView(BaseDeviceExportView):
+    pass
+
+
 class DeviceGroupListCreateView(BaseDeviceGroupListCreateView):
     pass
 
@@ -98,6 +154,7 @@ class DownloadDeviceView(BaseDownloadDeviceView):
 
 template_list = TemplateListCreateView.as_view()
 template_detail = TemplateDetailView.as_view()
+template_clone = TemplateCloneView.as_view()
 download_template_config = DownloadTemplateconfiguration.as_view()
 vpn_list = VpnListCreateView.as_view()
 vpn_detail = VpnDetailView.as_view()
@@ -106,6 +163,13 @@ device_list = DeviceListCreateView.as_view()
 device_detail = DeviceDetailView.as_view()
 device_activate = DeviceActivateView.as_view()
 device_deactivate = DeviceDeactivateView.as_view()
+device_change_group = DeviceChangeGroupView.as_view()
+device_bulk_update = DeviceBulkUpdateView.as_view()
+device_bulk_action = DeviceBulkActionView.as_view()
+device_import = DeviceImportView.as_view()
+device_bulk_job = DeviceBulkJobView.as_view()
+device_render = DeviceRenderView.as_view()
+device_export = DeviceExportView.as_view()
 download_device_config = DownloadDeviceView().as_view()
 devicegroup_list = DeviceGroupListCreateView.as_view()
 devicegroup_detail = DeviceGroupDetailView.as_view()